@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 16:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('avatar__gt', '')), fields=['avatar'], name='profile_avatar_idx'),
+        ),
+    ]
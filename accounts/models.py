@@ -12,6 +12,10 @@ class Profile(models.Model):
     class Meta:
         verbose_name = "Профиль"
         verbose_name_plural = "Профили"
+        indexes = [
+            # Имена файлов для gc_media
+            models.Index(fields=['avatar'], name='profile_avatar_idx', condition=models.Q(avatar__gt='')),
+        ]
 
     def __str__(self):
         return f"Профиль {self.user.username}"
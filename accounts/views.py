@@ -11,6 +11,7 @@ from django.urls import reverse
 from .forms import CustomUserCreationForm, ProfileUpdateForm
 from .models import Profile
 from orders.models import Order
+from products import renditions
 
 class RegisterView(CreateView):
     form_class = CustomUserCreationForm
@@ -69,7 +70,8 @@ class ProfileView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['orders'] = Order.objects.filter(user=self.request.user).prefetch_related('items__product')
+        context['orders'] = Order.objects.filter(user=self.request.user)
+        context['renditions'] = renditions.ready_map([self.object.profile.avatar])
         return context
 
 
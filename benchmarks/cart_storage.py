@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Добавление в корзину: запросов в секунду для разных хранилищ корзины.
+
+Каждый покупатель - отдельный клиент со своими cookie; запросы идут по
+кругу между покупателями, как при одновременной работе магазина.
+
+Запуск: python benchmarks/cart_storage.py [число запросов] [число покупателей]
+"""
+import sys
+import time
+
+from common import benchmark_database
+
+from django.core.cache import cache
+from django.test import Client, override_settings
+
+from products.models import Category, Product
+
+BACKENDS = [
+    ('сессия (БД)', 'orders.cart_storage.SessionCartStorage'),
+    ('подписанная cookie', 'orders.cart_storage.SignedCookieCartStorage'),
+    ('кэш + запись в БД', 'orders.cart_storage.CacheCartStorage'),
+]
+
+
+def fill_products(size=50):
+    category = Category.objects.create(name='Овощи', slug='vegetables')
+    return [
+        Product.objects.create(
+            category=category, name=f'Товар {i}', slug=f'product-{i}', description='', price=100,
+            weight='1 кг', calories='35 ккал', protein='1г', fat='1г', carbs='1г',
+        ).id
+        for i in range(size)
+    ]
+
+
+def throughput(product_ids, requests, shoppers):
+    clients = [Client() for _ in range(shoppers)]
+    urls = [f'/orders/cart/add/{product_id}/' for product_id in product_ids]
+    start = time.perf_counter()
+    for i in range(requests):
+        response = clients[i % shoppers].post(urls[i % len(urls)])
+        assert response.status_code == 302
+    return requests / (time.perf_counter() - start)
+
+
+def main(requests, shoppers):
+    with benchmark_database():
+        product_ids = fill_products()
+        print(f'{requests} добавлений в корзину, {shoppers} покупателей')
+        for label, backend in BACKENDS:
+            cache.clear()
+            with override_settings(CART_STORAGE=backend):
+                print(f'{label:<20} {throughput(product_ids, requests, shoppers):8.1f} запросов/с')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [2000, 50][len(args):]))
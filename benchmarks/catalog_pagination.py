@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Латентность 1000-й страницы каталога: OFFSET против keyset-курсора.
+
+Запуск: python benchmarks/catalog_pagination.py [размеры каталога...]
+По умолчанию каталог растёт до 10k, 100k и 500k товаров.
+"""
+import sys
+
+from common import benchmark_database, measure, report
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+
+from products.models import Category, Product
+from products.pagination import KeysetPaginator, encode_cursor
+
+PAGE = 1000
+PER_PAGE = 12
+ORDERING = ('name', 'id')
+
+
+def grow_catalog(category, start, stop, batch_size=5000):
+    for offset in range(start, stop, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                category=category,
+                name=f'Товар {i:07d}',
+                slug=f'product-{i}',
+                description='Описание',
+                price=100,
+                weight='1 кг',
+                calories='35 ккал',
+                protein='1г',
+                fat='1г',
+                carbs='1г',
+            )
+            for i in range(offset, min(offset + batch_size, stop))
+        ])
+
+
+def main(sizes):
+    with benchmark_database():
+        category = Category.objects.create(name='Овощи', slug='vegetables')
+        queryset = Product.objects.filter(in_stock=True).select_related('category', 'supplier')
+        current = 0
+        for size in sizes:
+            grow_catalog(category, current, size)
+            current = size
+            cache.clear()
+
+            def offset_page():
+                page = Paginator(queryset.order_by(*ORDERING), PER_PAGE).page(PAGE)
+                return list(page.object_list)
+
+            last_row = queryset.order_by(*ORDERING)[(PAGE - 1) * PER_PAGE - 1]
+            cursor = encode_cursor([last_row.name, last_row.id], ORDERING)
+            paginator = KeysetPaginator(queryset, ORDERING, PER_PAGE, count_key=f'bench:{size}')
+
+            def keyset_page():
+                page = paginator.get_page(after=cursor)
+                page.count
+                return page.object_list
+
+            assert [p.id for p in offset_page()] == [p.id for p in keyset_page()]
+            print(f'--- {size} товаров')
+            report('offset  (?page=1000, COUNT + OFFSET)', *measure(offset_page))
+            report('keyset  (?after=..., cached count)', *measure(keyset_page))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 500_000])
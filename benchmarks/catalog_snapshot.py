@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Пропускная способность каталога: ORM против снимка в памяти.
+
+Запуск: python benchmarks/catalog_snapshot.py [размер каталога] [число запросов]
+"""
+import sys
+import time
+
+from common import benchmark_database
+
+from django.test import Client, override_settings
+
+from products.models import Category, Product, Supplier
+from products.snapshot import get_snapshot
+
+
+def fill_catalog(size, batch_size=5000):
+    categories = [Category.objects.create(name=f'Категория {i}', slug=f'category-{i}') for i in range(8)]
+    suppliers = [
+        Supplier.objects.create(name=f'Ферма {i}', address='Адрес', latitude=55.7, longitude=37.6)
+        for i in range(20)
+    ]
+    for offset in range(0, size, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                category=categories[i % len(categories)],
+                supplier=suppliers[i % len(suppliers)],
+                name=f'Товар {i:07d}',
+                slug=f'product-{i}',
+                description='Описание товара',
+                price=100,
+                weight='1 кг',
+                calories='35 ккал',
+                protein='1г',
+                fat='1г',
+                carbs='1г',
+            )
+            for i in range(offset, min(offset + batch_size, size))
+        ])
+
+
+def throughput(client, requests):
+    urls = ['/', '/?category=category-3', '/?supplier=5', '/?category=category-1&supplier=9', '/product-42/']
+    for url in urls:
+        client.get(url)
+    start = time.perf_counter()
+    for i in range(requests):
+        response = client.get(urls[i % len(urls)])
+        assert response.status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+def main(size, requests):
+    with benchmark_database():
+        fill_catalog(size)
+        client = Client()
+        with override_settings(CATALOG_SNAPSHOT=False):
+            orm = throughput(client, requests)
+        with override_settings(CATALOG_SNAPSHOT=True):
+            start = time.perf_counter()
+            get_snapshot()
+            build = (time.perf_counter() - start) * 1000
+            snapshot = throughput(client, requests)
+        print(f'{size} товаров, {requests} запросов (список с фильтрами и карточка товара)')
+        print(f'ORM:             {orm:8.1f} запросов/с')
+        print(f'снимок в памяти: {snapshot:8.1f} запросов/с (построение снимка {build:.0f} ms)')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [50_000, 2000][len(args):]))
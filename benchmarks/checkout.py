@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Оформление заказа: построчные INSERT против транзакции с bulk_create.
+
+Запуск: python benchmarks/checkout.py
+"""
+import uuid
+
+from common import benchmark_database, measure, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from orders.cart import CartLine
+from orders.checkout import place_order
+from orders.models import Order, OrderItem
+from products.models import Category, Product
+
+SIZES = (1, 10, 50, 200)
+
+
+def fill_products(size):
+    category = Category.objects.create(name='Овощи', slug='vegetables')
+    Product.objects.bulk_create([
+        Product(
+            category=category, name=f'Товар {i}', slug=f'product-{i}', description='', price=100 + i,
+            weight='1 кг', calories='35 ккал', protein='1г', fat='1г', carbs='1г',
+        )
+        for i in range(size)
+    ])
+    return list(Product.objects.order_by('id'))
+
+
+def legacy_checkout(user, product_ids, quantities):
+    """Прежний checkout: заказ, затем get + create на каждую строку, без транзакции"""
+    order = Order.objects.create(user=user, phone='+7', address='Адрес')
+    for product_id, quantity in zip(product_ids, quantities):
+        product = Product.objects.get(id=product_id)
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_order=product.price)
+
+
+def bulk_checkout(user, product_ids, quantities):
+    products = Product.objects.in_bulk(product_ids)
+    lines = [CartLine(products[pk], quantity, products[pk].price) for pk, quantity in zip(product_ids, quantities)]
+    place_order(user, lines, '+7', 'Адрес', uuid.uuid4())
+
+
+def main():
+    with benchmark_database():
+        user = User.objects.create_user(username='buyer', password='x')
+        products = fill_products(max(SIZES))
+        for size in SIZES:
+            product_ids = [product.id for product in products[:size]]
+            quantities = [1 + i % 3 for i in range(size)]
+            for label, func in (('построчно', legacy_checkout), ('bulk', bulk_checkout)):
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as context:
+                    func(user, product_ids, quantities)
+                median, p95 = measure(lambda: func(user, product_ids, quantities), repeat=20)
+                report(f'{size:>3} строк, {label} ({len(context.captured_queries)} запросов)', median, p95)
+
+
+if __name__ == '__main__':
+    main()
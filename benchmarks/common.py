@@ -0,0 +1,54 @@
+"""Общие утилиты для бенчмарков.
+
+Каждый бенчмарк работает на отдельной тестовой базе, которая создаётся
+через механизм тестового раннера Django и удаляется после прогона, и с
+кэшем во временном каталоге, так что рабочие db.sqlite3 и var/cache не
+затрагиваются.
+"""
+import os
+import sys
+import statistics
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecoshop.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ecoshop.testing import isolated_caches
+
+
+@contextmanager
+def benchmark_database():
+    """Временная база с применёнными миграциями и временный кэш"""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with isolated_caches():
+            yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, repeat=20, warmup=2):
+    """Медиана и p95 времени вызова func в миллисекундах"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def report(label, median, p95):
+    print(f'{label:<48} median {median:9.3f} ms   p95 {p95:9.3f} ms')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Загрузка изображений: прежний цикл requests.get против пула download_images.
+
+Изображения отдаёт локальный HTTP-сервер с задержкой ответа, имитирующей
+CDN. Замеряется только сеть (ImageDownloader без записи в базу) при разном
+числе потоков и, для сравнения, прежний последовательный requests.get без
+общей сессии - новое соединение на каждый URL. Затем команда
+download_images целиком на временной базе: первый запуск и повторный,
+которому загружать уже нечего.
+
+Запуск: python benchmarks/download_images.py [изображений] [задержка, мс]
+"""
+import json
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+
+from common import benchmark_database
+
+import requests
+from django.core.management import call_command
+from django.test import override_settings
+
+from products.images import ImageDownloader, ImageJob
+from products.models import Category, Product
+
+BODY = b'\xff\xd8' + b'\0' * 30_000  # ~30 KB, как превью товара
+
+
+def serve(delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Заголовки и тело уходят отдельными write: без этого keep-alive ждал бы delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(BODY)))
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            self.wfile.write(BODY)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def legacy(urls):
+    for url in urls:
+        requests.get(url, timeout=10).content
+
+
+def pooled(urls, workers):
+    downloader = ImageDownloader(workers)
+    jobs = (ImageJob(0, 'product', i, url, '') for i, url in enumerate(urls))
+    assert all(error is None for _, _, error in downloader.download(jobs))
+    downloader.close()
+
+
+def main(size, delay_ms):
+    server = serve(delay_ms / 1000)
+    base = f'http://127.0.0.1:{server.server_port}'
+    urls = [f'{base}/{i}.jpg' for i in range(size)]
+
+    print(f'{size} изображений, задержка ответа {delay_ms} мс')
+    serial = timed(lambda: legacy(urls))
+    print(f'requests.get подряд:     {serial:6.2f} s  {size / serial:7.0f} изобр./с')
+    for workers in (1, 2, 4, 8, 16, 32):
+        elapsed = timed(lambda: pooled(urls, workers))
+        print(f'пул, {workers:2} потоков:        {elapsed:6.2f} s  {size / elapsed:7.0f} изобр./с  x{serial / elapsed:5.1f}')
+
+    with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory), benchmark_database():
+        category = Category.objects.create(name='Овощи', slug='vegetables')
+        per_product = 4
+        Product.objects.bulk_create([
+            Product(
+                category=category, name=f'Товар {i}', slug=f'product-{i}', description='', price=1,
+                weight='1 кг', calories='1', protein='1', fat='1', carbs='1',
+            )
+            for i in range(size // per_product)
+        ])
+        feed = Path(directory) / 'feed.jsonl'
+        feed.write_text(''.join(
+            json.dumps({'name': f'Товар {i}', 'image_urls': urls[i * per_product:(i + 1) * per_product]}) + '\n'
+            for i in range(size // per_product)
+        ))
+        for label in ('первый запуск', 'повторный запуск'):
+            elapsed = timed(lambda: call_command('download_images', str(feed), '--workers', '16', stdout=StringIO()))
+            print(f'download_images, 16 потоков, {label}: {elapsed:6.2f} s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [400, 50][len(args):]))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Сборка мусора в медиафайлах: разность множеств против проверки файла запросом.
+
+На временной базе создаются товары с изображениями в хранилище по хэшу
+(файлы пишутся напрямую, минуя upload) и десятая часть файлов-сирот.
+Сравниваются gc_media (имена из индексов полей, файлы одним обходом
+каталогов, разность множеств) и наивный обход - exists() по каждому файлу
+в каждой модели с файловым полем; он замеряется на части файлов и
+пересчитывается на все.
+
+Запуск: python benchmarks/gc_media.py [товаров] [файлов для наивного обхода]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+from common import benchmark_database
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+
+from ecoshop.storage import content_name
+from products.management.commands.gc_media import file_fields, stored_names
+from products.models import Category, Product
+
+
+def write_file(body):
+    name = content_name(hashlib.sha256(body).hexdigest(), 'image.jpg')
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+    old = time.time() - 86400
+    os.utime(path, (old, old))
+    return name
+
+
+def naive_unreferenced(names):
+    unreferenced = []
+    for name in names:
+        if not any(model._default_manager.filter(**{field.attname: name}).exists() for model, field in file_fields()):
+            unreferenced.append(name)
+        connection.queries_log.clear()
+    return unreferenced
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main(size, naive_size):
+    with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory), benchmark_database():
+        category = Category.objects.create(name='Овощи', slug='vegetables')
+        for start in range(0, size, 5000):
+            Product.objects.bulk_create([
+                Product(
+                    category=category, name=f'Товар {i}', slug=f'product-{i}', description='Описание ' * 20, price=1,
+                    weight='1 кг', calories='1', protein='1', fat='1', carbs='1', image=write_file(f'image {i}'.encode()),
+                )
+                for i in range(start, min(start + 5000, size))
+            ])
+        orphans = [write_file(f'orphan {i}'.encode()) for i in range(size // 10)]
+
+        files = sorted(stored_names(['content']))
+        naive, _ = timed(lambda: naive_unreferenced(files[:naive_size]))
+        out = StringIO()
+        gc, _ = timed(lambda: call_command('gc_media', '--dry-run', stdout=out))
+        assert f'Would delete {len(orphans)} ' in out.getvalue()
+
+    print(f'{size} товаров, {len(orphans)} файлов-сирот')
+    print(f'exists() на файл:  {naive:7.2f} s на {naive_size} -> ~{naive * len(files) / naive_size:7.0f} s на все файлы')
+    print(f'gc_media:          {gc:7.2f} s')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [50_000, 200][len(args):]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Импорт фида товаров: update_or_create на строку против пакетного upsert.
+
+Прежний способ замеряется на части фида (он линеен по числу товаров) и
+пересчитывается на весь фид; новый - командой load_products целиком,
+сначала на пустой базе, затем повторно поверх загруженных товаров (фид не
+изменился - записывать нечего) и с изменённой десятой частью товаров. Для
+сравнения - время одного чтения и проверки фида без базы.
+
+Запуск: python benchmarks/load_products.py [товаров] [товаров для прежнего способа]
+"""
+import json
+import sys
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+from common import benchmark_database
+
+from django.core.management import call_command
+
+from products.feed import FeedReader, clean_record
+from products.importer import ensure_categories
+from products.models import Product
+
+CATEGORIES = ('vegetables', 'meat', 'dairy', 'fruits', 'berries', 'bakery', 'preserves', 'sweets')
+
+
+def synthetic_feed(size):
+    return [
+        {
+            'name': f'Товар фермерский {i}', 'description': f'Описание товара {i}: натуральный продукт с фермы',
+            'price': 100 + i % 900, 'category': CATEGORIES[i % len(CATEGORIES)],
+            'weight': f'{100 + i % 900} г', 'calories': f'{i % 400} ккал',
+            'protein': '1.3г', 'carbs': '7.2г', 'fat': '0.1г', 'in_stock': bool(i % 7),
+        }
+        for i in range(size)
+    ]
+
+
+def legacy_load(records, categories):
+    """Прежний цикл команды: update_or_create по названию (Product.save ищет свободный slug)"""
+    for data in records:
+        fields = {key: data[key] for key in ('name', 'description', 'price', 'weight', 'calories',
+                                             'protein', 'fat', 'carbs', 'in_stock')}
+        Product.objects.update_or_create(name=data['name'], defaults={**fields, 'category': categories[data['category']]})
+
+
+def read_feed(path):
+    for _, data, _ in FeedReader(path):
+        clean_record(data)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(size, legacy_size):
+    records = synthetic_feed(size)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'products.json'
+        path.write_text(json.dumps(records, ensure_ascii=False), encoding='utf-8')
+
+        with benchmark_database():
+            categories, _ = ensure_categories()
+            legacy = timed(lambda: legacy_load(records[:legacy_size], categories))
+            Product.objects.all().delete()
+
+            created = timed(lambda: call_command('load_products', str(path), stdout=StringIO()))
+            unchanged = timed(lambda: call_command('load_products', str(path), stdout=StringIO()))
+            for record in records[::10]:
+                record['price'] += 1
+            path.write_text(json.dumps(records, ensure_ascii=False), encoding='utf-8')
+            changed = timed(lambda: call_command('load_products', str(path), stdout=StringIO()))
+        read = timed(lambda: read_feed(path))
+
+    print(f'{size} товаров в фиде')
+    print(f'update_or_create:  {legacy:7.1f} s на {legacy_size} -> ~{legacy * size / legacy_size:7.0f} s на весь фид')
+    print(f'load_products:     {created:7.1f} s (новые товары)')
+    print(f'load_products:     {unchanged:7.1f} s (фид не изменился)')
+    print(f'load_products:     {changed:7.1f} s (изменилась десятая часть)')
+    print(f'чтение фида:       {read:7.1f} s')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [100_000, 2_000][len(args):]))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Потоковый импорт фида: пиковая память не растёт с размером файла.
+
+Для каждого размера фида (JSON-массив и JSON Lines) импорт запускается в
+отдельном процессе, чтобы ru_maxrss относился только к нему. Для сравнения
+замеряется пиковая память простого json.load того же файла (для JSON
+Lines - списка json.loads по строкам).
+
+Запуск: python benchmarks/load_products_stream.py [товаров через запятую]
+"""
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+from load_products import synthetic_feed
+
+
+def write_feed(path, size, json_lines):
+    """Фид пишется частями, чтобы сам генератор не держал его в памяти"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if not json_lines:
+            f.write('[\n')
+        for start in range(0, size, 10_000):
+            records = synthetic_feed(min(10_000, size - start))
+            for i, record in enumerate(records):
+                record['name'] = f'{record["name"]}-{start}'
+                line = json.dumps(record, ensure_ascii=False)
+                if json_lines:
+                    f.write(line + '\n')
+                else:
+                    f.write(('' if start == 0 and i == 0 else ',\n') + line)
+        if not json_lines:
+            f.write('\n]\n')
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, path):
+    if mode == 'json.load':
+        with open(path, encoding='utf-8') as f:
+            json.load(f) if path.endswith('.json') else [json.loads(line) for line in f]
+        print(f'{peak_mb():.0f} 0')
+        return
+
+    from common import benchmark_database
+    from django.core.management import call_command
+
+    with benchmark_database():
+        start = time.perf_counter()
+        call_command('load_products', path, '--batch-size', '1000', stdout=StringIO())
+        print(f'{peak_mb():.0f} {time.perf_counter() - start:.1f}')
+
+
+def run(mode, path):
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', mode, str(path)], capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return float(output[-2]), float(output[-1])
+
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            for json_lines in (False, True):
+                path = Path(directory) / ('feed.jsonl' if json_lines else 'feed.json')
+                write_feed(path, size, json_lines)
+                megabytes = path.stat().st_size / 2 ** 20
+                loaded, _ = run('json.load', path)
+                peak, elapsed = run('load_products', path)
+                print(
+                    f'{size:>8} товаров, {"JSONL" if json_lines else "JSON ":5} {megabytes:6.0f} MB: '
+                    f'load_products {peak:5.0f} MB пик, {size / elapsed:7.0f} записей/с; '
+                    f'json.load {loaded:5.0f} MB пик'
+                )
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main([int(size) for size in (sys.argv[1] if len(sys.argv) > 1 else '20000,100000,300000').split(',')])
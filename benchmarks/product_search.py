@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Латентность поиска: FTS5 + bm25 против LIKE-скана (icontains).
+
+Запуск: python benchmarks/product_search.py [размеры каталога...]
+"""
+import random
+import sys
+
+from common import benchmark_database, measure, report
+
+from products.models import Category, Product
+from products.search import SearchResults, rebuild_index
+
+WORDS = [
+    'морковь', 'свекла', 'творог', 'сыр', 'молоко', 'яблоко', 'груша', 'мёд', 'хлеб',
+    'фермерский', 'свежий', 'домашний', 'сладкий', 'сочный', 'органический', 'зелёный',
+    'варенье', 'клубника', 'малина', 'говядина', 'курица', 'сметана', 'кефир', 'огурец',
+]
+SYLLABLES = ['ка', 'ро', 'ли', 'на', 'ве', 'то', 'му', 'се', 'ды', 'жа', 'по', 'ри']
+
+
+def vocabulary(size, rng):
+    """Синтетический словарь: реальный каталог куда разнообразнее 24 слов"""
+    words = set(WORDS)
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def grow_catalog(category, start, stop, batch_size=5000):
+    rng = random.Random(start)
+    words = vocabulary(20_000, random.Random(0))
+    for offset in range(start, stop, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                category=category,
+                name=' '.join(rng.sample(words, 3)) + f' {i}',
+                slug=f'product-{i}',
+                description=' '.join(rng.choices(words, k=20)),
+                price=100,
+                weight='1 кг',
+                calories='35 ккал',
+                protein='1г',
+                fat='1г',
+                carbs='1г',
+            )
+            for i in range(offset, min(offset + batch_size, stop))
+        ])
+
+
+def main(sizes):
+    with benchmark_database():
+        category = Category.objects.create(name='Овощи', slug='vegetables')
+        current = 0
+        for size in sizes:
+            grow_catalog(category, current, size)
+            current = size
+            rebuild_index()
+
+            def fts_page():
+                results = SearchResults('творог фермерский')
+                return results[:12], results.count()
+
+            def like_page():
+                queryset = Product.objects.filter(in_stock=True, name__icontains='творог') \
+                    .filter(name__icontains='фермерский')
+                return list(queryset[:12]), queryset.count()
+
+            print(f'--- {size} товаров')
+            report('FTS5 MATCH + bm25, первая страница + count', *measure(fts_page, repeat=10))
+            report('LIKE %...% (icontains), первая страница + count', *measure(like_page, repeat=5))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000])
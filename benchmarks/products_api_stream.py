@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Время до первого байта и пиковая память выгрузки /api/products/.
+
+Запуск: python benchmarks/products_api_stream.py [размеры каталога...]
+"""
+import sys
+import time
+import tracemalloc
+
+from common import benchmark_database
+
+from django.test import Client
+
+from products.models import Category, Product
+
+
+def grow_catalog(category, start, stop, batch_size=5000):
+    for offset in range(start, stop, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                category=category,
+                name=f'Товар {i:07d}',
+                slug=f'product-{i}',
+                description='Описание товара ' * 10,
+                price=100,
+                weight='1 кг',
+                calories='35 ккал',
+                protein='1г',
+                fat='1г',
+                carbs='1г',
+            )
+            for i in range(offset, min(offset + batch_size, stop))
+        ])
+
+
+def export(client):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get('/api/products/', {'fields': 'id,name,slug,price,description'})
+    stream = iter(response.streaming_content)
+    first_chunk = next(stream)
+    ttfb = (time.perf_counter() - start) * 1000
+    size = len(first_chunk)
+    for chunk in stream:
+        size += len(chunk)
+    total = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return ttfb, total, peak, size / 1024 / 1024
+
+
+def main(sizes):
+    with benchmark_database():
+        category = Category.objects.create(name='Овощи', slug='vegetables')
+        client = Client()
+        current = 0
+        for size in sizes:
+            grow_catalog(category, current, size)
+            current = size
+            ttfb, total, peak, megabytes = export(client)
+            print(
+                f'{size:>9} товаров: TTFB {ttfb:8.1f} ms, вся выгрузка {total:9.1f} ms, '
+                f'{megabytes:7.1f} MB ответа, пик памяти Python {peak:6.1f} MB'
+            )
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
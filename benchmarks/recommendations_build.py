@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Построение матрицы совместных покупок на синтетической истории заказов.
+
+Замеряется векторная часть orders/recommendations.py (пары, свёртка, top-N)
+без чтения из базы: позиции подаются теми же пачками, что и в build().
+
+Запуск: python benchmarks/recommendations_build.py [позиций заказов] [товаров]
+"""
+import resource
+import sys
+import time
+
+import common  # noqa: F401  (настройка Django)
+
+import numpy as np
+
+from orders.recommendations import CoPurchaseMatrix
+
+BATCH_SIZE = 500_000
+
+
+def synthetic_items(items, products, seed=0):
+    """Заказы по 1-12 позиций, популярность товаров по закону Ципфа"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 13, size=items // 6 + 1)
+    order_ids = np.repeat(np.arange(1, len(sizes) + 1), sizes)[:items]
+    product_ids = np.minimum(rng.zipf(1.3, size=len(order_ids)), products)
+    return order_ids.astype(np.int64), product_ids.astype(np.int64)
+
+
+def main(items, products):
+    order_ids, product_ids = synthetic_items(items, products)
+    matrix = CoPurchaseMatrix()
+    start = time.perf_counter()
+    # Границы пачек по заказам, как в read_order_items
+    boundaries = np.searchsorted(order_ids, order_ids[BATCH_SIZE::BATCH_SIZE], side='right')
+    for chunk_orders, chunk_products in zip(np.split(order_ids, boundaries), np.split(product_ids, boundaries)):
+        matrix.add_items(chunk_orders, chunk_products)
+    accumulate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    a, _, _, _ = matrix.top_neighbors(8)
+    top = time.perf_counter() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{len(order_ids)} позиций, {order_ids[-1]} заказов, {products} товаров')
+    print(f'матрица: {len(matrix.pair_keys)} пар за {accumulate:.1f} s')
+    print(f'top-8:   {len(a)} рекомендаций за {top:.1f} s')
+    print(f'пиковая память процесса: {peak:.0f} MB')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [10_000_000, 50_000][len(args):]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Копии изображений: вес страницы каталога и скорость build_renditions.
+
+На временной базе и в временном MEDIA_ROOT создаются товары с фото
+(шум поверх градиента - JPEG такого же веса, как у фото с CDN), затем
+build_renditions строит копии при разном числе потоков. Вес страницы -
+сумма оригиналов 12 карточек против копий card шириной 480 (то, что
+выберет браузер для колонки 25-33vw) в WebP и JPEG.
+
+Запуск: python benchmarks/renditions.py [товаров] [ширина оригинала]
+"""
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO, StringIO
+
+from common import benchmark_database
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image
+
+from products import renditions
+from products.models import Category, ImageRendition, Product
+
+PAGE_SIZE = 12
+
+
+def photo(index, width):
+    height = width * 3 // 4
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buffer = BytesIO()
+    Image.blend(gradient, noise, 0.3 + index % 5 / 20).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def main(size, width):
+    with tempfile.TemporaryDirectory() as directory, \
+            override_settings(MEDIA_ROOT=directory, RENDITION_WORKERS=0), benchmark_database():
+        category = Category.objects.create(name='Овощи', slug='vegetables')
+        Product.objects.bulk_create([
+            Product(
+                category=category, name=f'Товар {i}', slug=f'product-{i}', description='', price=1,
+                weight='1 кг', calories='1', protein='1', fat='1', carbs='1',
+                image=default_storage.save('products/photo.jpg', ContentFile(photo(i, width))),
+            )
+            for i in range(size)
+        ])
+        call_command('build_renditions', stdout=StringIO())
+
+        sources = list(Product.objects.order_by('id').values_list('image', flat=True)[:PAGE_SIZE])
+        originals = sum(default_storage.size(source) for source in sources)
+        print(f'{size} фото {width}x{width * 3 // 4}, страница из {PAGE_SIZE} карточек:')
+        print(f'оригиналы:     {originals / 1024:8.0f} KB')
+        for extension in renditions.FORMATS:
+            weight = sum(
+                os.path.getsize(renditions.storage.path(renditions.rendition_name(source, 'card', 480, extension)))
+                for source in sources
+            )
+            print(f'card 480 {extension:4}: {weight / 1024:8.0f} KB  (x{originals / weight:.0f} меньше)')
+
+        copies = ImageRendition.objects.count()
+        for workers in (1, 2, 4, 8):
+            start = time.perf_counter()
+            call_command('build_renditions', '--rebuild', '--workers', str(workers), stdout=StringIO())
+            elapsed = time.perf_counter() - start
+            print(f'build_renditions, {workers} потоков: {elapsed:6.1f} s  {copies / elapsed:6.1f} пресетов/с')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [60, 1600][len(args):]))
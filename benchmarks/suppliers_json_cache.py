@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""suppliers_json: сборка ответа на каждый запрос против готовых байт из кэша.
+
+Запуск: python benchmarks/suppliers_json_cache.py [число поставщиков]
+"""
+import random
+import sys
+
+from common import benchmark_database, measure, report
+
+from django.test import Client
+
+from products import suppliers_cache
+from products.models import Category, Product, Supplier
+from products.versioning import get_suppliers_version
+
+
+def fill(size, products_per_supplier=5, batch_size=5000):
+    rng = random.Random(1)
+    category = Category.objects.create(name='Овощи', slug='vegetables')
+    for offset in range(0, size, batch_size):
+        Supplier.objects.bulk_create([
+            Supplier(
+                name=f'Ферма {i}', address='Адрес', description='Описание фермы ' * 10,
+                latitude=round(rng.uniform(43, 65), 6), longitude=round(rng.uniform(20, 140), 6),
+            )
+            for i in range(offset, min(offset + batch_size, size))
+        ])
+    supplier_ids = list(Supplier.objects.values_list('id', flat=True))
+    Product.objects.bulk_create([
+        Product(
+            category=category, supplier_id=supplier_ids[i % len(supplier_ids)], name=f'Товар {i}',
+            slug=f'product-{i}', description='', price=100, weight='1 кг', calories='35 ккал',
+            protein='1г', fat='1г', carbs='1г',
+        )
+        for i in range(size * products_per_supplier)
+    ], batch_size=batch_size)
+
+
+def main(size):
+    with benchmark_database():
+        fill(size)
+        client = Client()
+        url = '/suppliers/json/'
+
+        report(f'сборка ответа ({size} поставщиков)', *measure(
+            lambda: suppliers_cache.build_payload(get_suppliers_version()), repeat=10))
+        report('запрос, ответ из кэша', *measure(lambda: client.get(url), repeat=200))
+        etag = client.get(url)['ETag']
+        report('запрос с If-None-Match (304)', *measure(
+            lambda: client.get(url, HTTP_IF_NONE_MATCH=etag), repeat=200))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
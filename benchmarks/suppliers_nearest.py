@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Задержка поиска ближайших поставщиков: индекс в памяти против ORM.
+
+Запуск: python benchmarks/suppliers_nearest.py [число поставщиков] [число запросов]
+"""
+import random
+import sys
+import time
+
+from common import benchmark_database
+
+from django.test import Client
+
+from products.models import Supplier
+from products.nearest import get_index
+
+
+def fill_suppliers(size, batch_size=5000):
+    rng = random.Random(1)
+    for offset in range(0, size, batch_size):
+        Supplier.objects.bulk_create([
+            Supplier(
+                name=f'Ферма {i}', address='Адрес',
+                latitude=round(rng.uniform(43, 65), 6), longitude=round(rng.uniform(20, 140), 6),
+            )
+            for i in range(offset, min(offset + batch_size, size))
+        ])
+
+
+def percentiles(func, points):
+    timings = []
+    for latitude, longitude in points:
+        start = time.perf_counter()
+        func(latitude, longitude)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return [timings[int(len(timings) * p) - 1] for p in (0.5, 0.95, 0.99)]
+
+
+def main(size, requests):
+    rng = random.Random(2)
+    points = [(rng.uniform(43, 65), rng.uniform(20, 140)) for _ in range(requests)]
+    with benchmark_database():
+        fill_suppliers(size)
+        start = time.perf_counter()
+        index = get_index()
+        build = (time.perf_counter() - start) * 1000
+
+        client = Client()
+        url = '/suppliers/nearest/'
+        print(f'{size} поставщиков, {requests} запросов, k=10 (построение индекса {build:.0f} ms)')
+        p50, p95, p99 = percentiles(lambda lat, lon: index.nearest(lat, lon, 10), points)
+        print(f'индекс:        p50 {p50:7.3f} ms  p95 {p95:7.3f} ms  p99 {p99:7.3f} ms')
+        p50, p95, p99 = percentiles(
+            lambda lat, lon: client.get(url, {'lat': lat, 'lon': lon, 'k': 10}), points
+        )
+        print(f'HTTP endpoint: p50 {p50:7.3f} ms  p95 {p95:7.3f} ms  p99 {p99:7.3f} ms')
+
+        # Для сравнения: перебор всех строк в Python, как без индекса
+        def orm_scan(lat, lon):
+            rows = Supplier.objects.filter(is_active=True).values_list('id', 'latitude', 'longitude')
+            return sorted(rows, key=lambda r: (float(r[1]) - lat) ** 2 + (float(r[2]) - lon) ** 2)[:10]
+        p50, p95, p99 = percentiles(orm_scan, points[:20])
+        print(f'ORM-перебор:   p50 {p50:7.3f} ms  p95 {p95:7.3f} ms  p99 {p99:7.3f} ms')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [100_000, 2000][len(args):]))
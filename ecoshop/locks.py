@@ -0,0 +1,36 @@
+"""Блокировки между процессами одного сервера.
+
+cache.add() атомарен не у всех бэкендов кэша (у файлового это проверка и
+запись), поэтому для "построить может только один" используется flock() на
+файле в LOCKS_DIR. Блокировку держит открытый дескриптор: ОС снимает её
+при закрытии файла или завершении процесса, брошенных блокировок не бывает.
+Без fcntl (Windows, только runserver) блокировка всегда берётся.
+"""
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def try_lock(name):
+    """Взять блокировку name без ожидания; даёт True, если она взята"""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(settings.LOCKS_DIR, exist_ok=True)
+    fd = os.open(os.path.join(settings.LOCKS_DIR, f'{name}.lock'), os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+        else:
+            yield True
+    finally:
+        os.close(fd)
@@ -49,6 +49,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "orders.middleware.CartMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -80,10 +81,47 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Пишущие транзакции берут блокировку сразу (BEGIN IMMEDIATE) и ждут
+            # её не дольше timeout секунд, а не падают с "database is locked"
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # Тестовая база в файле: в общей памяти SQLite не ждёт блокировку, и
+        # параллельные транзакции в тестах падали бы вместо ожидания
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
 
+# Cache
+# Общий для всех процессов кэш: версии каталога (products.versioning), фасеты,
+# готовые ответы и корзины CacheCartStorage. LocMemCache у каждого воркера
+# свой, и изменения из manage.py или другого воркера он бы не увидел.
+# Несколько серверов должны делить один Redis (django.core.cache.backends.redis)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "var" / "cache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    # Корзины CacheCartStorage: вытеснение из кэша по умолчанию их не задевает.
+    # При переполнении удаляется десятая часть записей, вытесненная корзина
+    # читается из БД (StoredCart)
+    "carts": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "var" / "carts",
+        "OPTIONS": {"MAX_ENTRIES": 100000, "CULL_FREQUENCY": 10},
+    },
+}
+# Файлы блокировок между процессами (ecoshop.locks)
+LOCKS_DIR = BASE_DIR / "var" / "locks"
+
+# Тесты получают собственные кэши во временном каталоге, а не var/cache
+TEST_RUNNER = "ecoshop.testing.TestRunner"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -126,6 +164,15 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Медиафайлы именуются по хэшу содержимого: одинаковые загрузки хранятся один раз
+STORAGES = {
+    "default": {"BACKEND": "ecoshop.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+# Потоков, строящих уменьшенные копии загруженных изображений в фоне (products.renditions);
+# 0 - строить сразу после сохранения, в том же потоке
+RENDITION_WORKERS = 2
+
 LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
@@ -134,3 +181,24 @@ LOGOUT_REDIRECT_URL = "/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Catalog
+# 'keyset' - постраничная навигация по курсору (?after=), 'offset' - классическая ?page=N
+CATALOG_PAGINATION = "keyset"
+# Отдавать список и карточки товаров из снимка каталога в памяти воркера (products.snapshot)
+CATALOG_SNAPSHOT = False
+# Не чаще чем раз в столько секунд воркер перестраивает снимок после смены версии каталога
+CATALOG_SNAPSHOT_REBUILD_INTERVAL = 10
+# Матрица совместных покупок для команды build_recommendations
+RECOMMENDATIONS_MATRIX_PATH = BASE_DIR / "var" / "copurchase.npz"
+
+# Cart
+# Хранилище корзины: SessionCartStorage (сессия), SignedCookieCartStorage (подписанная cookie)
+# или CacheCartStorage (кэш с отложенной записью в БД)
+CART_STORAGE = "orders.cart_storage.SessionCartStorage"
+CART_COOKIE_NAME = "cart"
+# Как часто CacheCartStorage сохраняет корзину в БД, секунд; с тем же периодом
+# по cron запускается flush_carts
+CART_WRITE_BEHIND_INTERVAL = 60
+# Сколько секунд товары корзины отложены под открытую форму оформления заказа
+STOCK_RESERVATION_TTL = 15 * 60
@@ -0,0 +1,74 @@
+"""Хранилище медиафайлов с адресацией по содержимому.
+
+Имя файла - SHA-256 его содержимого, разложенный по каталогам
+content/ab/cd/<хэш>.<расширение>, чтобы в одном каталоге не копились
+десятки тысяч файлов. Одинаковая картинка, загруженная для товара,
+категории, поставщика или аватара, хранится один раз: upload_to полей
+не участвует в имени, от исходного имени остаётся только расширение
+(по нему веб-сервер выбирает Content-Type).
+
+Хэш считается по ходу записи: файл копируется блоками во временный файл
+рядом с целевым каталогом, затем переименовывается (атомарно) или
+удаляется, если такое содержимое уже есть (тогда у существующего файла
+обновляется время изменения, см. gc_media --min-age). Удалять файл при смене
+изображения в строке нельзя - он может быть нужен другим строкам; лишние
+файлы убирает команда gc_media.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_DIR = 'content'
+EXTENSION_ALIASES = {'.jpeg': '.jpg', '.jpe': '.jpg', '.tif': '.tiff'}
+EXTENSION_RE = re.compile(r'\.[a-z0-9]{1,8}$')
+
+
+def content_name(digest, name):
+    """Имя файла в хранилище по хэшу содержимого и исходному имени"""
+    extension = os.path.splitext(name)[1].lower()
+    extension = EXTENSION_ALIASES.get(extension, extension)
+    if not EXTENSION_RE.match(extension):
+        extension = ''
+    return f'{CONTENT_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        temp_dir = self.path(CONTENT_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=temp_dir)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    f.write(chunk)
+            name = content_name(digest.hexdigest(), name)
+            path = self.path(name)
+            try:
+                # Файл снова нужен: свежее время изменения - отсрочка от gc_media (--min-age),
+                # пока строка со ссылкой на него не сохранена
+                os.utime(path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, path)
+            else:
+                os.unlink(temp_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
@@ -0,0 +1,37 @@
+"""Окружение тестов и бенчмарков.
+
+Тесты и бенчмарки очищают кэши (cache.clear()), а рабочие кэши в var/
+общие для всех процессов сервера: в них версии каталога и корзины
+покупателей. Поэтому на время прогона каждый кэш и каталог блокировок
+переносятся во временный каталог, который удаляется после прогона.
+"""
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def isolated_caches():
+    """Кэши из settings.CACHES (тот же бэкенд) и LOCKS_DIR во временном каталоге"""
+    with tempfile.TemporaryDirectory(prefix='ecoshop-cache-') as directory:
+        caches = {
+            alias: {**params, 'LOCATION': os.path.join(directory, alias)}
+            for alias, params in settings.CACHES.items()
+        }
+        with override_settings(CACHES=caches, LOCKS_DIR=os.path.join(directory, 'locks')):
+            yield directory
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._isolation = ExitStack()
+        self._isolation.enter_context(isolated_caches())
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolation.close()
+        super().teardown_test_environment(**kwargs)
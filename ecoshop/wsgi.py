@@ -14,3 +14,15 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ecoshop.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.CATALOG_SNAPSHOT:
+    from django.db import connections
+
+    from products import snapshot
+
+    # Снимок строится до форка воркеров (gunicorn --preload) и делится ими
+    # через copy-on-write; соединение с базой не должно наследоваться.
+    snapshot.warm()
+    connections.close_all()
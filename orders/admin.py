@@ -11,18 +11,40 @@ class OrderItemInline(admin.TabularInline):
     total_price.short_description = 'Сумма'
 
 
+class OrderTotalFilter(admin.SimpleListFilter):
+    title = 'Сумма'
+    parameter_name = 'total'
+    # (значение, подпись, от, до)
+    RANGES = (
+        ('lt1000', 'до 1 000 ₽', None, 1000),
+        ('1000-5000', '1 000 – 5 000 ₽', 1000, 5000),
+        ('5000-20000', '5 000 – 20 000 ₽', 5000, 20000),
+        ('gte20000', 'от 20 000 ₽', 20000, None),
+    )
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, label, _, _ in self.RANGES]
+
+    def queryset(self, request, queryset):
+        for value, _, low, high in self.RANGES:
+            if self.value() == value:
+                if low is not None:
+                    queryset = queryset.filter(total__gte=low)
+                if high is not None:
+                    queryset = queryset.filter(total__lt=high)
+                return queryset
+        return queryset
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'created_at', 'status', 'total_price')
-    list_filter = ('status', 'created_at')
+    list_display = ('id', 'user', 'created_at', 'status', 'item_count', 'total')
+    list_filter = ('status', 'created_at', OrderTotalFilter)
+    list_select_related = ('user',)
     search_fields = ('user__username', 'phone', 'address')
-    readonly_fields = ('created_at', 'total_price')
+    readonly_fields = ('created_at', 'item_count', 'total')
     inlines = [OrderItemInline]
 
-    def total_price(self, obj):
-        return obj.total_price()
-    total_price.short_description = 'Сумма'
-
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -32,4 +54,4 @@ class OrderItemAdmin(admin.ModelAdmin):
 
     def total_price(self, obj):
         return obj.total_price()
-    total_price.short_description = 'Сумма'
\ No newline at end of file
+    total_price.short_description = 'Сумма'
@@ -0,0 +1,109 @@
+"""Корзина покупателя.
+
+Содержимое - {product_id: {'quantity': n, 'price': 'цена при добавлении'}} -
+хранится в сессии, cookie или кэше, см. orders.cart_storage.
+Товары всех строк загружаются одним запросом in_bulk, поэтому число
+запросов на страницах корзины не зависит от её размера. Строки с
+удалёнными товарами не ломают страницу: они убираются из корзины и
+попадают в Cart.missing, чтобы представление могло предупредить покупателя.
+"""
+from decimal import Decimal
+
+from django.utils.functional import cached_property
+
+from products.models import Product
+from .cart_storage import get_cart_storage, summarize
+
+
+class CartLine:
+    __slots__ = ('product', 'quantity', 'price')
+
+    def __init__(self, product, quantity, price):
+        self.product = product
+        self.quantity = quantity
+        self.price = price
+
+    @property
+    def item_total(self):
+        return self.price * self.quantity
+
+
+class Cart:
+    """Корзина запроса. Содержимое читается из хранилища при первом обращении,
+    число единиц и сумма - из сохранённой сводки, которая обновляется при
+    каждом изменении."""
+
+    def __init__(self, request):
+        self.storage = get_cart_storage(request)
+        self.missing = []
+
+    @cached_property
+    def data(self):
+        return self.storage.load()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __bool__(self):
+        return bool(self.data)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    @property
+    def count(self):
+        """Число единиц товара (для значка корзины)"""
+        return self.storage.load_summary()[0]
+
+    @property
+    def total(self):
+        return self.storage.load_summary()[1]
+
+    def quantity(self, product_id):
+        item = self.data.get(str(product_id))
+        return item['quantity'] if item else 0
+
+    def _save(self, summary, item, quantity):
+        count, total = summary
+        self.storage.save(self.data, (count + quantity, total + Decimal(item['price']) * quantity))
+
+    def add(self, product, quantity=1):
+        # Сводка берётся до изменения: у старых корзин она считается по строкам
+        summary = self.storage.load_summary()
+        item = self.data.setdefault(str(product.id), {'quantity': 0, 'price': str(product.price)})
+        item['quantity'] += quantity
+        self._save(summary, item, quantity)
+
+    def remove(self, product_id, quantity=1):
+        key = str(product_id)
+        if key not in self.data:
+            return
+        summary = self.storage.load_summary()
+        item = self.data[key]
+        quantity = min(quantity, item['quantity'])
+        if item['quantity'] > quantity:
+            item['quantity'] -= quantity
+        else:
+            del self.data[key]
+        self._save(summary, item, -quantity)
+
+    def clear(self):
+        self.data = {}
+        self.__dict__.pop('lines', None)
+        self.storage.save(self.data, (0, Decimal('0')))
+
+    @cached_property
+    def lines(self):
+        """Строки корзины с товарами, загруженными одним запросом"""
+        products = Product.objects.in_bulk([int(key) for key in self.data])
+        lines = []
+        for key, item in list(self.data.items()):
+            product = products.get(int(key))
+            if product is None:
+                self.missing.append(int(key))
+                del self.data[key]
+                continue
+            lines.append(CartLine(product, item['quantity'], Decimal(item['price'])))
+        if self.missing:
+            self.storage.save(self.data, summarize(self.data))
+        return lines
@@ -0,0 +1,260 @@
+"""Хранилища содержимого корзины.
+
+Корзина (orders.cart.Cart) работает со словарём
+{product_id: {'quantity': n, 'price': 'цена'}}, а где он хранится, решает
+бэкенд из settings.CART_STORAGE:
+
+* SessionCartStorage - request.session['cart'], как раньше; с сессиями в БД
+  каждое изменение корзины - транзакция записи в SQLite;
+* SignedCookieCartStorage - подписанная сжатая cookie, анонимная корзина
+  не требует состояния на сервере;
+* CacheCartStorage - общий для всех процессов кэш 'carts' (не LocMemCache)
+  по случайному идентификатору из cookie. Кэш отдельный: когда кэш по
+  умолчанию переполняется фасетами и счётчиками, вытеснение случайных
+  записей не задевает корзины. В БД (StoredCart) корзина
+  записывается не чаще раза в CART_WRITE_BEHIND_INTERVAL секунд и
+  читается оттуда, если вытеснена из кэша. Изменения, сделанные в пределах
+  интервала после записи, дописывает в БД команда flush_carts (по cron раз
+  в интервал); вытеснение из кэша до неё теряет не больше двух интервалов.
+
+Рядом с корзиной хранится сводка (число единиц, сумма), которую Cart
+обновляет при каждом изменении: значку корзины не нужно пересчитывать
+строки. Хранилище создаётся одно на запрос (get_cart_storage), изменения
+записываются в ответ в orders.middleware.CartMiddleware.
+"""
+import secrets
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import StoredCart
+
+CART_SESSION_KEY = 'cart'
+CART_SUMMARY_SESSION_KEY = 'cart_summary'
+CART_COOKIE_SALT = 'orders.cart'
+CART_COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+CART_CACHE_TIMEOUT = CART_COOKIE_MAX_AGE
+CART_CACHE_ALIAS = 'carts'
+
+
+def cart_cookie_name():
+    return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+
+def may_have_cart(request):
+    """Есть ли у посетителя cookie корзины или сессии: без них корзина пуста"""
+    cookies = request.COOKIES
+    return settings.SESSION_COOKIE_NAME in cookies or cart_cookie_name() in cookies
+
+
+def write_behind_interval():
+    return getattr(settings, 'CART_WRITE_BEHIND_INTERVAL', 60)
+
+
+def cart_cache_key(cart_id):
+    return f'orders:cart:{cart_id}'
+
+
+class BaseCartStorage:
+    def __init__(self, request):
+        self.request = request
+        self._data = None
+        self._summary = None
+        self.modified = False
+
+    def load(self):
+        """Словарь корзины; один и тот же объект на весь запрос"""
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def load_summary(self):
+        """(число единиц, сумма Decimal) без разбора строк, если сводка сохранена"""
+        if self._summary is None:
+            self._summary = self._load_summary() or summarize(self.load())
+        return self._summary
+
+    def save(self, data, summary):
+        self._data = data
+        self._summary = summary
+        self.modified = True
+        self._save(data, summary)
+
+    def update(self, response):
+        """Записать изменения в ответ (вызывается из CartMiddleware)"""
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _load_summary(self):
+        return None
+
+    def _save(self, data, summary):
+        pass
+
+    def _set_cookie(self, response, value):
+        response.set_cookie(
+            cart_cookie_name(), value, max_age=CART_COOKIE_MAX_AGE,
+            secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+        )
+
+
+class SessionCartStorage(BaseCartStorage):
+    def _load(self):
+        return self.request.session.get(CART_SESSION_KEY, {})
+
+    def _load_summary(self):
+        stored = self.request.session.get(CART_SUMMARY_SESSION_KEY)
+        return (stored[0], Decimal(stored[1])) if stored else None
+
+    def _save(self, data, summary):
+        self.request.session[CART_SESSION_KEY] = data
+        self.request.session[CART_SUMMARY_SESSION_KEY] = [summary[0], str(summary[1])]
+        self.request.session.modified = True
+
+
+class SignedCookieCartStorage(BaseCartStorage):
+    """Корзина целиком в cookie: 'id:количество:цена,...', подписано и сжато"""
+
+    @staticmethod
+    def encode(data):
+        compact = ','.join(f'{key}:{item["quantity"]}:{item["price"]}' for key, item in data.items())
+        return signing.dumps(compact, salt=CART_COOKIE_SALT, compress=True)
+
+    @staticmethod
+    def decode(value):
+        try:
+            compact = signing.loads(value, salt=CART_COOKIE_SALT, max_age=CART_COOKIE_MAX_AGE)
+            data = {}
+            for line in filter(None, compact.split(',')):
+                key, quantity, price = line.split(':')
+                data[key] = {'quantity': int(quantity), 'price': price}
+            return data
+        except (signing.BadSignature, ValueError, AttributeError):
+            # Подделанная или устаревшая cookie - пустая корзина
+            return {}
+
+    def _load(self):
+        value = self.request.COOKIES.get(cart_cookie_name())
+        return self.decode(value) if value else {}
+
+    def update(self, response):
+        if not self.modified:
+            return
+        if self._data:
+            self._set_cookie(response, self.encode(self._data))
+        else:
+            response.delete_cookie(cart_cookie_name(), samesite='Lax')
+
+
+class CacheCartStorage(BaseCartStorage):
+    """Корзина в кэше с отложенной записью в БД (StoredCart)"""
+
+    def __init__(self, request):
+        if CART_CACHE_ALIAS not in settings.CACHES:
+            raise ImproperlyConfigured(f'CacheCartStorage needs a separate "{CART_CACHE_ALIAS}" cache in CACHES')
+        self.cache = caches[CART_CACHE_ALIAS]
+        if isinstance(self.cache, LocMemCache):
+            # У каждого воркера была бы своя копия корзины
+            raise ImproperlyConfigured('CacheCartStorage needs a cache shared by all processes, not LocMemCache')
+        super().__init__(request)
+        self.cart_id = request.COOKIES.get(cart_cookie_name())
+        self.new_id = False
+        self._cache_entry = None
+
+    def _entry(self):
+        """{'data', 'summary', 'revision', 'persisted_at'} из кэша, при промахе - из БД"""
+        if self._cache_entry is None:
+            entry = self.cache.get(cart_cache_key(self.cart_id)) if self.cart_id else None
+            if entry is None:
+                data, revision = {}, 0
+                if self.cart_id:
+                    stored = StoredCart.objects.filter(key=self.cart_id).values_list('data', 'revision').first()
+                    data, revision = stored or (data, revision)
+                entry = {
+                    'data': data, 'summary': summarize(data), 'revision': revision,
+                    'persisted_at': time.time() if data else 0,
+                }
+                if self.cart_id:
+                    self.cache.set(cart_cache_key(self.cart_id), entry, CART_CACHE_TIMEOUT)
+            self._cache_entry = entry
+        return self._cache_entry
+
+    def _load(self):
+        return self._entry()['data']
+
+    def _load_summary(self):
+        return self._entry().get('summary')
+
+    def _save(self, data, summary):
+        entry = self._entry()
+        if not self.cart_id:
+            self.cart_id = secrets.token_urlsafe(24)
+            self.new_id = True
+        interval = write_behind_interval()
+        entry['revision'] = entry.get('revision', 0) + 1
+        if not data:
+            # Очищенная корзина (после заказа) не должна вернуться из БД
+            StoredCart.objects.filter(key=self.cart_id).delete()
+            entry['persisted_at'] = time.time()
+        elif time.time() - entry['persisted_at'] >= interval:
+            StoredCart.objects.update_or_create(key=self.cart_id, defaults={
+                'data': data, 'revision': entry['revision'],
+                'flush_after': timezone.now() + timedelta(seconds=interval),
+            })
+            entry['persisted_at'] = time.time()
+        entry['data'] = data
+        entry['summary'] = summary
+        self.cache.set(cart_cache_key(self.cart_id), entry, CART_CACHE_TIMEOUT)
+
+    def update(self, response):
+        if self.modified and self.new_id:
+            self._set_cookie(response, self.cart_id)
+
+
+def flush_write_behind():
+    """Дописать в БД корзины, изменённые в кэше после записи; возвращает их число.
+
+    Корзина, записанная в БД при изменении, до flush_after может меняться только
+    в кэше. Если ревизия в кэше новее записанной, копия обновляется и проверяется
+    снова через интервал, иначе проверка снимается.
+    """
+    now = timezone.now()
+    flush_after = now + timedelta(seconds=write_behind_interval())
+    flushed = 0
+    carts = caches[CART_CACHE_ALIAS]
+    due = StoredCart.objects.filter(flush_after__lte=now).values_list('id', 'key', 'revision', 'flush_after')
+    for pk, key, revision, due_at in due.iterator():
+        entry = carts.get(cart_cache_key(key))
+        # Условия по ревизии и сроку: запись, сделанная корзиной за это время, не перезаписывается
+        rows = StoredCart.objects.filter(pk=pk, revision=revision, flush_after=due_at)
+        if entry is not None and entry['data'] and entry.get('revision', 0) > revision:
+            flushed += rows.update(
+                data=entry['data'], revision=entry['revision'], flush_after=flush_after, updated_at=now,
+            )
+        else:
+            rows.update(flush_after=None)
+    return flushed
+
+
+def summarize(data):
+    """Сводка по строкам - для корзин, сохранённых без неё"""
+    count = sum(item['quantity'] for item in data.values())
+    total = sum((Decimal(item['price']) * item['quantity'] for item in data.values()), Decimal('0'))
+    return count, total
+
+
+def get_cart_storage(request):
+    storage = getattr(request, '_cart_storage', None)
+    if storage is None:
+        backend = import_string(getattr(settings, 'CART_STORAGE', 'orders.cart_storage.SessionCartStorage'))
+        storage = request._cart_storage = backend(request)
+    return storage
@@ -0,0 +1,49 @@
+"""Оформление заказа одной транзакцией.
+
+Товары корзины уже загружены одним запросом (Cart.lines), цены берутся
+текущие из Product.price, позиции вставляются одним bulk_create. Заказ
+и позиции создаются атомарно: сбой посередине не оставляет неполного
+заказа. Сумма и число единиц сохраняются в заказе сразу, без отдельного
+пересчёта (см. orders.totals). Ключ идемпотентности из формы уникален для пользователя, поэтому
+двойная отправка формы возвращает уже созданный заказ.
+
+В той же транзакции снимаются резервы покупателя и списывается остаток
+товаров за вычетом чужих резервов (orders.stock): если какого-то товара не
+хватает, заказ не создаётся.
+"""
+from django.db import IntegrityError, transaction
+
+from . import stock
+from .models import Order, OrderItem, StockReservation
+from .totals import line_totals
+
+
+def find_order(user, idempotency_key):
+    return Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
+
+def place_order(user, lines, phone, address, idempotency_key):
+    """Создать заказ из строк корзины, возвращает (заказ, создан ли он сейчас).
+
+    Если остатка не хватает, поднимает stock.OutOfStock и ничего не меняет.
+    """
+    total, item_count = line_totals((line.product.price, line.quantity) for line in lines)
+    try:
+        with transaction.atomic():
+            StockReservation.objects.filter(user=user).delete()
+            stock.take(stock.cart_quantities(lines), user=user)
+            order = Order.objects.create(
+                user=user, phone=phone, address=address, idempotency_key=idempotency_key,
+                total=total, item_count=item_count,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=line.product, quantity=line.quantity, price_at_order=line.product.price)
+                for line in lines
+            ])
+    except IntegrityError:
+        # Параллельная отправка той же формы успела создать заказ раньше
+        order = find_order(user, idempotency_key)
+        if order is None:
+            raise
+        return order, False
+    return order, True
@@ -1,11 +1,19 @@
-from products.models import Product
+from decimal import Decimal
+
+from django.utils.functional import SimpleLazyObject
+
+from .cart import Cart
+from .cart_storage import may_have_cart
 
 def cart_context_processor(request):
-    cart = request.session.get('cart', {})
-    cart_count = sum(item['quantity'] for item in cart.values())
-    cart_total = sum(float(item['price']) * item['quantity'] for item in cart.values())
+    # Без cookie корзины и сессии корзина пуста, хранилище не открывается
+    if not may_have_cart(request):
+        return {'cart_count': 0, 'cart_total': Decimal('0')}
+    # Ленивые значения: хранилище корзины (и сессия) читается, только если
+    # шаблон действительно выводит значок корзины
+    cart = SimpleLazyObject(lambda: Cart(request))
     
     return {
-        'cart_count': cart_count,
-        'cart_total': cart_total
-    }
\ No newline at end of file
+        'cart_count': SimpleLazyObject(lambda: cart.count),
+        'cart_total': SimpleLazyObject(lambda: cart.total)
+    }
@@ -0,0 +1,8 @@
+from django import forms
+
+
+class CheckoutForm(forms.Form):
+    phone = forms.CharField(max_length=20)
+    address = forms.CharField()
+    # Ключ выдаётся вместе с формой: повторная отправка той же формы не создаёт второй заказ
+    idempotency_key = forms.UUIDField(required=False, widget=forms.HiddenInput)
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.models import Order
+from orders.totals import update_order_totals
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored Order.total and Order.item_count from order items in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders processed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        start = time.monotonic()
+        last_id = 0
+        processed = updated = 0
+        while True:
+            # Пакеты по первичному ключу: без OFFSET и без загрузки всех id в память
+            ids = list(
+                Order.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            updated += update_order_totals(ids)
+            processed += len(ids)
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  up to order #{last_id}: {processed} checked, {updated} updated')
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {processed} orders, updated {updated} in {time.monotonic() - start:.1f}s'
+        ))
@@ -0,0 +1,42 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Build "frequently bought together" recommendations from order history (requires numpy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=8, help='Recommendations stored per product')
+        parser.add_argument('--full', action='store_true', help='Rebuild from scratch instead of reading only new orders')
+        parser.add_argument('--batch-size', type=int, default=500_000, help='Order items read per batch')
+        parser.add_argument('--matrix', type=str, default=None, help='Path to the co-purchase matrix file')
+
+    def handle(self, *args, **options):
+        if recommendations.np is None:
+            raise CommandError('numpy is not installed')
+
+        path = Path(options['matrix'] or settings.RECOMMENDATIONS_MATRIX_PATH)
+        start = time.monotonic()
+
+        def progress(matrix):
+            self.stdout.write(
+                f'  up to order #{matrix.last_order_id}: {len(matrix.pair_keys)} product pairs '
+                f'({time.monotonic() - start:.1f}s)'
+            )
+
+        matrix, stored = recommendations.build(
+            path,
+            limit=options['limit'],
+            full=options['full'],
+            items_per_batch=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {stored} recommendations, last order #{matrix.last_order_id}, '
+            f'{len(matrix.pair_keys)} product pairs in {time.monotonic() - start:.1f}s'
+        ))
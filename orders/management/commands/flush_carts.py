@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders import cart_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Write carts changed only in the cache since their last database write to StoredCart '
+        '(CacheCartStorage; run every CART_WRITE_BEHIND_INTERVAL seconds, e.g. from cron)'
+    )
+
+    def handle(self, *args, **options):
+        flushed = cart_storage.flush_write_behind()
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} carts'))
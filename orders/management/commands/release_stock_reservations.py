@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from orders import stock
+
+
+class Command(BaseCommand):
+    help = 'Delete expired checkout stock reservations (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        deleted = stock.release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired reservations'))
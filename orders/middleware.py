@@ -0,0 +1,15 @@
+from .cart_storage import get_cart_storage
+
+
+class CartMiddleware:
+    """Записывает изменения корзины в ответ (cookie для cookie- и кэш-хранилищ)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        storage = getattr(request, '_cart_storage', None)
+        if storage is not None:
+            storage.update(response)
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Идентификатор')),
+                ('data', models.JSONField(default=dict, verbose_name='Содержимое')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Сохранённая корзина',
+                'verbose_name_plural': 'Сохранённые корзины',
+            },
+        ),
+    ]
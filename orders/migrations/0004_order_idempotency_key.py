@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stored_cart'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='order_user_idempotency_uniq'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Сумма'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total'], name='order_total_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedcart',
+            name='flush_after',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Проверить после'),
+        ),
+        migrations.AddField(
+            model_name='storedcart',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ревизия'),
+        ),
+    ]
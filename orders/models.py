@@ -9,36 +9,95 @@ class Order(models.Model):
         ('completed', 'Выполнен'),
     )
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    # Отдельный индекс по user не нужен: его покрывает order_user_created_idx
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="Пользователь")
     phone = models.CharField(max_length=20, verbose_name="Телефон")
     address = models.TextField(verbose_name="Адрес")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new', verbose_name="Статус")
+    # Ключ формы оформления: повторная отправка не создаёт второй заказ (orders.checkout)
+    idempotency_key = models.UUIDField(null=True, blank=True, editable=False, verbose_name="Ключ идемпотентности")
+    # Сумма и число единиц по позициям: задаются при оформлении и
+    # пересчитываются при изменении позиций (orders.totals), чтобы списки
+    # заказов не читали позиции
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Сумма")
+    item_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество товаров")
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ['-created_at']
+        indexes = [
+            # История заказов пользователя: WHERE user_id = ? ORDER BY created_at DESC
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            # Сортировка и фильтр по сумме в админке
+            models.Index(fields=['total'], name='order_total_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='order_user_idempotency_uniq'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} от {self.user.username}"
 
     def total_price(self):
+        """Сумма по позициям; для отображения есть сохранённая Order.total"""
         return sum(item.price_at_order * item.quantity for item in self.items.all())
 
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE, verbose_name="Заказ")
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товар")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False, verbose_name="Товар")
     quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
     price_at_order = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена на момент заказа")
 
     class Meta:
         verbose_name = "Элемент заказа"
         verbose_name_plural = "Элементы заказа"
+        indexes = [
+            # Поиск позиций по товару; order_id в индексе делает его покрывающим для связки товар-заказ
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} ({self.quantity} шт.)"
 
     def total_price(self):
-        return self.price_at_order * self.quantity
\ No newline at end of file
+        return self.price_at_order * self.quantity
+
+
+class StoredCart(models.Model):
+    """Копия корзины из кэша (orders.cart_storage.CacheCartStorage)"""
+    key = models.CharField(max_length=64, unique=True, verbose_name="Идентификатор")
+    data = models.JSONField(default=dict, verbose_name="Содержимое")
+    # Номер изменения корзины в кэше, записанного в data
+    revision = models.PositiveIntegerField(default=0, verbose_name="Ревизия")
+    # Когда flush_carts проверит, нет ли в кэше изменений новее этой копии
+    flush_after = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Проверить после")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Сохранённая корзина"
+        verbose_name_plural = "Сохранённые корзины"
+
+    def __str__(self):
+        return self.key
+
+
+class StockReservation(models.Model):
+    """Товар, отложенный под открытую форму оформления заказа (orders.stock)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="Пользователь")
+    key = models.UUIDField(verbose_name="Ключ формы")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False, verbose_name="Товар")
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+
+    class Meta:
+        verbose_name = "Резерв товара"
+        verbose_name_plural = "Резервы товаров"
+        indexes = [
+            models.Index(fields=['user', 'key'], name='reservation_user_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity} до {self.expires_at:%H:%M}"
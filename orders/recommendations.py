@@ -0,0 +1,192 @@
+"""Рекомендации "часто покупают вместе" по истории заказов.
+
+Матрица совместных покупок строится векторно на NumPy: позиции заказов
+читаются диапазонами order_id, для каждого диапазона все пары товаров
+внутри заказа порождаются без циклов Python и сворачиваются через
+np.unique. Разреженная матрица хранится как отсортированные ключи пар
+(product_a << 32 | product_b) со счётчиками и сохраняется в .npz вместе
+с последним обработанным заказом, поэтому следующий запуск дочитывает
+только новые заказы.
+
+Сила связи - косинусная мера: совместные покупки / sqrt(частота A * частота B).
+Для каждого товара в ProductRecommendation записываются top-N соседей.
+"""
+from django.db import transaction
+
+from products.models import Product, ProductRecommendation
+from products.versioning import bump_catalog_version
+from .models import OrderItem
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для офлайн-построения
+    np = None
+
+PAIR_SHIFT = 32
+# Очень большие заказы (оптовые) дают k^2 пар и почти не несут сигнала
+MAX_ORDER_SIZE = 100
+
+
+class CoPurchaseMatrix:
+    def __init__(self, pair_keys=None, pair_counts=None, item_ids=None, item_counts=None, last_order_id=0):
+        empty = np.zeros(0, dtype=np.int64)
+        self.pair_keys = empty if pair_keys is None else pair_keys
+        self.pair_counts = empty if pair_counts is None else pair_counts
+        self.item_ids = empty if item_ids is None else item_ids
+        self.item_counts = empty if item_counts is None else item_counts
+        self.last_order_id = int(last_order_id)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data['pair_keys'], data['pair_counts'], data['item_ids'], data['item_counts'],
+                int(data['last_order_id']),
+            )
+
+    def save(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                pair_keys=self.pair_keys, pair_counts=self.pair_counts,
+                item_ids=self.item_ids, item_counts=self.item_counts,
+                last_order_id=np.int64(self.last_order_id),
+            )
+
+    @staticmethod
+    def _merge(keys, counts, new_keys, new_counts):
+        """Сложение двух разреженных векторов (ключи уникальны в каждом)"""
+        if not len(keys):
+            return new_keys, new_counts
+        all_keys = np.concatenate([keys, new_keys])
+        merged, inverse = np.unique(all_keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate([counts, new_counts]))
+        return merged, totals.astype(np.int64)
+
+    def add_items(self, order_ids, product_ids):
+        """Добавить позиции заказов (массивы одинаковой длины)"""
+        if not len(order_ids):
+            return
+        # Один товар в заказе учитывается один раз
+        pairs = np.unique(np.stack([order_ids, product_ids], axis=1), axis=0)
+        orders, products = pairs[:, 0], pairs[:, 1]
+
+        _, starts, sizes = np.unique(orders, return_index=True, return_counts=True)
+        keep = np.repeat(sizes <= MAX_ORDER_SIZE, sizes)
+        orders, products = orders[keep], products[keep]
+        if not len(orders):
+            return
+        _, starts, sizes = np.unique(orders, return_index=True, return_counts=True)
+
+        item_ids, item_counts = np.unique(products, return_counts=True)
+        self.item_ids, self.item_counts = self._merge(self.item_ids, self.item_counts, item_ids, item_counts)
+
+        # Каждой позиции - все позиции её заказа: left повторяется size раз,
+        # right пробегает заказ от начала до конца
+        group_size = np.repeat(sizes, sizes)
+        group_start = np.repeat(starts, sizes)
+        left = np.repeat(np.arange(len(products)), group_size)
+        pair_offsets = np.arange(len(left)) - np.repeat(np.cumsum(group_size) - group_size, group_size)
+        right = np.repeat(group_start, group_size) + pair_offsets
+        mask = left != right
+        keys = (products[left[mask]] << PAIR_SHIFT) | products[right[mask]]
+
+        pair_keys, pair_counts = np.unique(keys, return_counts=True)
+        self.pair_keys, self.pair_counts = self._merge(self.pair_keys, self.pair_counts, pair_keys, pair_counts)
+
+    def top_neighbors(self, limit, products=None):
+        """(product, recommended, score, rank) для top-N соседей каждого товара"""
+        a = self.pair_keys >> PAIR_SHIFT
+        b = self.pair_keys & ((1 << PAIR_SHIFT) - 1)
+        counts = self.pair_counts.astype(np.float64)
+        if products is not None:
+            selected = np.isin(a, products)
+            a, b, counts = a[selected], b[selected], counts[selected]
+        frequency_a = self.item_counts[np.searchsorted(self.item_ids, a)]
+        frequency_b = self.item_counts[np.searchsorted(self.item_ids, b)]
+        scores = counts / np.sqrt(frequency_a * frequency_b)
+
+        order = np.lexsort((b, -scores, a))
+        a, b, scores = a[order], b[order], scores[order]
+        _, starts, sizes = np.unique(a, return_index=True, return_counts=True)
+        ranks = np.arange(len(a)) - np.repeat(starts, sizes)
+        keep = ranks < limit
+        return a[keep], b[keep], scores[keep], ranks[keep]
+
+
+def read_order_items(after_order_id, items_per_batch):
+    """Позиции заказов пачками около items_per_batch строк по диапазонам order_id.
+
+    Граница пачки проходит по заказу целиком, поэтому пары внутри заказа
+    не теряются, а память ограничена размером пачки.
+    """
+    last_order_id = after_order_id
+    while True:
+        upper = (
+            OrderItem.objects.filter(order_id__gt=last_order_id)
+            .order_by('order_id')
+            .values_list('order_id', flat=True)[items_per_batch - 1:items_per_batch]
+        )
+        upper = upper[0] if upper else None
+        queryset = OrderItem.objects.filter(order_id__gt=last_order_id)
+        if upper is not None:
+            queryset = queryset.filter(order_id__lte=upper)
+        rows = list(queryset.values_list('order_id', 'product_id').iterator(chunk_size=50_000))
+        if not rows:
+            return
+        data = np.array(rows, dtype=np.int64)
+        last_order_id = int(data[:, 0].max())
+        yield data[:, 0], data[:, 1], last_order_id
+        if upper is None:
+            return
+
+
+def store_recommendations(matrix, limit, products=None, batch_size=5000):
+    """Переписать рекомендации для products (или для всех), возвращает число строк"""
+    a, b, scores, ranks = matrix.top_neighbors(limit, products)
+    existing = set(Product.objects.values_list('id', flat=True)) if len(a) else set()
+    rows = [
+        ProductRecommendation(product_id=int(x), recommended_id=int(y), score=float(s), rank=int(r))
+        for x, y, s, r in zip(a.tolist(), b.tolist(), scores.tolist(), ranks.tolist())
+        if x in existing and y in existing
+    ]
+    with transaction.atomic():
+        stale = ProductRecommendation.objects.all()
+        if products is not None:
+            product_ids = [int(p) for p in products]
+            for start in range(0, len(product_ids), 500):
+                stale.filter(product_id__in=product_ids[start:start + 500]).delete()
+        else:
+            stale.delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+    # Рекомендации входят в карточку товара, а её ETag зависит от версии каталога
+    bump_catalog_version()
+    return len(rows)
+
+
+def build(path, limit=8, full=False, items_per_batch=500_000, progress=None):
+    """Дочитать новые заказы в матрицу и обновить рекомендации затронутых товаров.
+
+    Возвращает (матрица, число записанных рекомендаций).
+    """
+    if np is None:
+        raise RuntimeError('Для построения рекомендаций нужен numpy: pip install numpy')
+
+    matrix = CoPurchaseMatrix() if full or not path.exists() else CoPurchaseMatrix.load(path)
+    incremental = matrix.last_order_id > 0
+    touched = []
+    for order_ids, product_ids, last_order_id in read_order_items(matrix.last_order_id, items_per_batch):
+        matrix.add_items(order_ids, product_ids)
+        matrix.last_order_id = last_order_id
+        touched.append(np.unique(product_ids))
+        if progress:
+            progress(matrix)
+
+    if not touched:
+        return matrix, 0
+    # При дочитывании переписываются только товары из новых заказов
+    products = np.unique(np.concatenate(touched)) if incremental else None
+    stored = store_recommendations(matrix, limit, products)
+    matrix.save(path)
+    return matrix, stored
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Order, OrderItem
+from .totals import update_order_totals
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_order_totals_on_item_change(sender, instance, raw=False, origin=None, **kwargs):
+    # При удалении самого заказа его позиции удаляются каскадом - пересчитывать нечего
+    if raw or getattr(origin, 'model', type(origin)) is Order:
+        return
+    update_order_totals([instance.order_id])
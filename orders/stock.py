@@ -0,0 +1,126 @@
+"""Остатки товаров и их резервирование при оформлении заказа.
+
+Остаток (Product.stock) меняется только условными UPDATE через F():
+списание - UPDATE ... SET stock = stock - n WHERE id = ? AND stock >= n,
+поэтому одновременные заказы не продадут одну единицу дважды, а остаток
+не читается в Python перед записью. Товары списываются в порядке id, так
+что транзакции с общими товарами не блокируют друг друга крест-накрест.
+Наличие (in_stock) пересчитывается одним запросом на всю корзину, только
+у товаров, остаток которых дошёл до нуля или снова стал положительным.
+Товары без учёта остатка (stock IS NULL) не списываются.
+
+При открытии формы оформления товары корзины откладываются в
+StockReservation на STOCK_RESERVATION_TTL секунд под ключ формы. Резерв
+остаток и наличие не меняет: открытая (или перезагруженная, или
+запрошенная роботом) форма не прячет товар из каталога. Резервы других
+покупателей, срок которых не истёк, вычитаются из остатка при проверке
+резерва и при списании заказа. Заказ снимает резервы покупателя и в той
+же транзакции списывает остаток по строкам корзины; истёкшие резервы
+просто перестают учитываться, команда release_stock_reservations удаляет
+их строки.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import Product
+from products.versioning import bump_catalog_version
+from .models import StockReservation
+
+
+class OutOfStock(Exception):
+    """Остатка не хватает; product_ids - товары, которых недостаточно"""
+
+    def __init__(self, product_ids):
+        super().__init__(f'Недостаточно остатка товаров: {product_ids}')
+        self.product_ids = product_ids
+
+
+def cart_quantities(lines):
+    """{id товара: количество} для строк корзины"""
+    quantities = Counter()
+    for line in lines:
+        quantities[line.product.id] += line.quantity
+    return quantities
+
+
+def _update_availability(product_ids):
+    now = timezone.now()
+    products = Product.objects.filter(pk__in=product_ids)
+    changed = products.filter(stock=0, in_stock=True).update(in_stock=False, updated_at=now)
+    changed += products.filter(stock__gt=0, in_stock=False).update(in_stock=True, updated_at=now)
+    if changed:
+        # Товар пропал из наличия или вернулся - списки каталога устарели
+        transaction.on_commit(bump_catalog_version)
+
+
+def reserved_by_others(user, now=None):
+    """Подзапрос: сколько единиц товара (OuterRef pk) отложено другими покупателями"""
+    reservations = StockReservation.objects.filter(product=OuterRef('pk'), expires_at__gt=now or timezone.now())
+    if user is not None:
+        reservations = reservations.exclude(user=user)
+    total = reservations.order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total), 0)
+
+
+def take(quantities, user=None):
+    """Списать {id товара: количество} целиком или ничего (иначе OutOfStock).
+
+    Резервы покупателей, кроме user, не списываются. Возвращает списанное -
+    только товары с учётом остатка.
+    """
+    with transaction.atomic():
+        tracked = set(
+            Product.objects.filter(pk__in=list(quantities), stock__isnull=False).values_list('pk', flat=True)
+        )
+        reserved = reserved_by_others(user)
+        taken = {}
+        failed = []
+        for product_id in sorted(tracked):
+            quantity = quantities[product_id]
+            if Product.objects.filter(pk=product_id, stock__gte=reserved + quantity).update(stock=F('stock') - quantity):
+                taken[product_id] = quantity
+            else:
+                failed.append(product_id)
+        if failed:
+            # Откат точки сохранения возвращает уже списанное
+            raise OutOfStock(failed)
+        if taken:
+            _update_availability(list(taken))
+    return taken
+
+
+def reserve(user, key, quantities):
+    """Отложить товары под форму с ключом key; прежние резервы пользователя снимаются.
+
+    Остаток не меняется; если с учётом чужих резервов товара не хватает -
+    OutOfStock. Возвращает отложенное - только товары с учётом остатка.
+    """
+    ttl = getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60)
+    with transaction.atomic():
+        StockReservation.objects.filter(user=user).delete()
+        available = dict(
+            Product.objects.filter(pk__in=list(quantities), stock__isnull=False)
+            .annotate(available=F('stock') - reserved_by_others(user))
+            .values_list('pk', 'available')
+        )
+        failed = sorted(pk for pk, amount in available.items() if amount < quantities[pk])
+        if failed:
+            raise OutOfStock(failed)
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+        StockReservation.objects.bulk_create([
+            StockReservation(user=user, key=key, product_id=product_id, quantity=quantities[product_id], expires_at=expires_at)
+            for product_id in sorted(available)
+        ])
+    return {product_id: quantities[product_id] for product_id in available}
+
+
+def release_expired(now=None):
+    """Удалить истёкшие резервы, возвращает их число"""
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -1,7 +1,32 @@
-from django.test import TestCase
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.sessions.backends.db import SessionStore
 from django.contrib.auth.models import User
-from products.models import Category, Product
-from .models import Order, OrderItem
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import uuid
+from products.models import Category, Product, ProductRecommendation
+from products.versioning import get_catalog_version
+from . import cart_storage, recommendations, stock
+from .cart import CartLine
+from .checkout import place_order
+from .cart_storage import SignedCookieCartStorage, get_cart_storage
+from .context_processors import cart_context_processor
+from .models import Order, OrderItem, StockReservation, StoredCart
 
 class OrderModelTest(TestCase):
     def setUp(self):
@@ -69,4 +94,575 @@ class OrderModelTest(TestCase):
     def test_order_item_total_price(self):
         """Test that order item total price calculation works correctly"""
         expected_total = 150.00 * 2  # 2 items at 150.00 each
-        self.assertEqual(self.order_item.total_price(), expected_total)
\ No newline at end of file
+        self.assertEqual(self.order_item.total_price(), expected_total)
+
+class OrderQueryPlanTest(TestCase):
+    """EXPLAIN QUERY PLAN guards for order history and item lookups"""
+
+    def test_user_order_history_uses_index(self):
+        plan = Order.objects.filter(user_id=1).order_by('-created_at').explain()
+        self.assertIn('USING INDEX order_user_created_idx', plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_items_by_product_use_index(self):
+        plan = OrderItem.objects.filter(product_id=1).values('order_id').explain()
+        self.assertIn('USING COVERING INDEX orderitem_product_order_idx', plan)
+
+
+class RecommendationsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.products = {
+            name: Product.objects.create(
+                category=category, name=name, slug=name, description="", price=100,
+                weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г", in_stock=True,
+            )
+            for name in ('carrot', 'onion', 'potato', 'apple')
+        }
+        self.path = Path(tempfile.mkdtemp()) / 'copurchase.npz'
+
+    def order(self, *names):
+        order = Order.objects.create(user=self.user, phone="+7", address="Адрес")
+        for name in names:
+            OrderItem.objects.create(order=order, product=self.products[name], quantity=1, price_at_order=100)
+
+    def recommended(self, name):
+        return list(
+            ProductRecommendation.objects.filter(product=self.products[name])
+            .order_by('rank').values_list('recommended__name', flat=True)
+        )
+
+    def test_build_ranks_by_co_purchases(self):
+        self.order('carrot', 'onion', 'potato')
+        self.order('carrot', 'onion')
+        self.order('apple')
+        recommendations.build(self.path)
+        self.assertEqual(self.recommended('carrot'), ['onion', 'potato'])
+        self.assertEqual(self.recommended('potato'), ['carrot', 'onion'])
+        self.assertEqual(self.recommended('apple'), [])
+
+    def test_incremental_build_reads_only_new_orders(self):
+        self.order('carrot', 'potato')
+        matrix, _ = recommendations.build(self.path)
+        last_order_id = matrix.last_order_id
+        self.order('apple', 'onion')
+        self.order('apple', 'onion')
+        matrix, stored = recommendations.build(self.path)
+        self.assertGreater(matrix.last_order_id, last_order_id)
+        self.assertEqual(stored, 2)
+        self.assertEqual(self.recommended('apple'), ['onion'])
+        self.assertEqual(self.recommended('carrot'), ['potato'])
+        # Повторный запуск без новых заказов ничего не переписывает
+        self.assertEqual(recommendations.build(self.path)[1], 0)
+
+    def test_batches_do_not_split_orders(self):
+        for _ in range(5):
+            self.order('carrot', 'onion', 'potato')
+        recommendations.build(self.path, items_per_batch=2)
+        self.assertEqual(self.recommended('onion'), ['carrot', 'potato'])
+
+    def test_detail_shows_recommendations(self):
+        self.order('carrot', 'onion')
+        recommendations.build(self.path)
+        response = self.client.get(reverse('products:product_detail', args=['carrot']))
+        self.assertEqual([p.name for p in response.context['recommendations']], ['onion'])
+        self.assertContains(response, 'С этим товаром покупают')
+
+
+class CartTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.products = [
+            Product.objects.create(
+                category=self.category, name=f"Товар {i}", slug=f"product-{i}", description="",
+                price=Decimal('10.10') + i, weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г",
+            )
+            for i in range(30)
+        ]
+
+    def add(self, product, times=1):
+        for _ in range(times):
+            self.client.post(reverse('orders:cart_add', args=[product.id]))
+
+    def cart_data(self):
+        request = RequestFactory().get('/')
+        request.COOKIES = {name: morsel.value for name, morsel in self.client.cookies.items()}
+        request.session = self.client.session
+        return get_cart_storage(request).load()
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_cart_detail_query_count_is_constant(self):
+        self.add(self.products[0])
+        small = self.queries(reverse('orders:cart_detail'))
+        for product in self.products[1:]:
+            self.add(product)
+        self.assertEqual(self.queries(reverse('orders:cart_detail')), small)
+
+    def test_decimal_totals(self):
+        self.add(self.products[0], 3)
+        self.add(self.products[1])
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['total_price'], Decimal('10.10') * 3 + Decimal('11.10'))
+        self.assertEqual(response.context['cart_count'], 4)
+
+    def test_missing_product_is_dropped(self):
+        self.add(self.products[0])
+        self.add(self.products[1])
+        self.products[1].delete()
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual([item.product for item in response.context['cart_items']], [self.products[0]])
+        self.assertEqual(list(self.cart_data()), [str(self.products[0].id)])
+
+    def test_remove(self):
+        self.add(self.products[0], 3)
+        self.client.post(reverse('orders:cart_remove', args=[self.products[0].id]))
+        self.assertEqual(self.cart_data()[str(self.products[0].id)]['quantity'], 2)
+        self.client.post(reverse('orders:cart_remove', args=[self.products[0].id]), {'quantity': 2})
+        self.assertEqual(self.cart_data(), {})
+
+    def test_checkout_creates_order(self):
+        self.client.login(username='buyer', password='testpass123')
+        self.add(self.products[0], 2)
+        self.add(self.products[1])
+        response = self.client.post(reverse('orders:checkout'), {'phone': '+7', 'address': 'Адрес'})
+        self.assertRedirects(response, reverse('accounts:profile'))
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.total_price(), Decimal('10.10') * 2 + Decimal('11.10'))
+        self.assertEqual(self.cart_data(), {})
+
+
+    def test_summary_is_maintained_incrementally(self):
+        self.add(self.products[0], 3)
+        self.add(self.products[2])
+        self.client.post(reverse('orders:cart_remove', args=[self.products[0].id]))
+        self.products[2].delete()
+        self.client.get(reverse('orders:cart_detail'))
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(response.context['cart_count'], 2)
+        self.assertEqual(Decimal(str(response.context['cart_total'])), Decimal('20.20'))
+
+
+    def test_json_mutations(self):
+        url = reverse('orders:cart_add', args=[self.products[1].id])
+        self.client.post(url, HTTP_ACCEPT='application/json')
+        response = self.client.post(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        data = response.json()
+        self.assertEqual(data['quantity'], 2)
+        self.assertEqual(data['line_total'], '22.20')
+        self.assertEqual(data['cart_count'], 2)
+        self.assertEqual(data['cart_total'], '22.20')
+        self.assertIn(self.products[1].name, data['message'])
+
+        response = self.client.post(
+            reverse('orders:cart_remove', args=[self.products[1].id]), {'quantity': 2}, HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.json()['quantity'], 0)
+        self.assertEqual(response.json()['cart_total'], '0.00')
+        # Сообщение об успехе не откладывается до следующей страницы
+        page = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(list(page.context['messages']), [])
+
+    def test_plain_form_still_redirects(self):
+        response = self.client.post(
+            reverse('orders:cart_add', args=[self.products[0].id]),
+            HTTP_ACCEPT='text/html,application/xhtml+xml,application/json;q=0.9,*/*;q=0.8',
+        )
+        self.assertRedirects(response, reverse('products:product_list'), fetch_redirect_response=False)
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.client.login(username='buyer', password='testpass123')
+        category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.products = [
+            Product.objects.create(
+                category=category, name=f"Товар {i}", slug=f"product-{i}", description="",
+                price=Decimal('10.00') + i, weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г",
+            )
+            for i in range(30)
+        ]
+
+    def fill_cart(self, products):
+        for product in products:
+            self.client.post(reverse('orders:cart_add', args=[product.id]), HTTP_ACCEPT='application/json')
+
+    def submit(self, key=None):
+        return self.client.post(reverse('orders:checkout'), {
+            'phone': '+7', 'address': 'Адрес', 'idempotency_key': key or uuid.uuid4(),
+        })
+
+    def checkout_queries(self, size):
+        Order.objects.all().delete()
+        self.fill_cart(self.products[:size])
+        with CaptureQueriesContext(connection) as context:
+            response = self.submit()
+        self.assertRedirects(response, reverse('accounts:profile'), fetch_redirect_response=False)
+        self.assertEqual(OrderItem.objects.count(), size)
+        return len(context.captured_queries)
+
+    def test_query_count_is_fixed(self):
+        self.assertEqual(self.checkout_queries(1), self.checkout_queries(30))
+
+    def test_double_submit_creates_one_order(self):
+        self.fill_cart(self.products[:3])
+        key = uuid.uuid4()
+        self.submit(key)
+        response = self.submit(key)
+        self.assertRedirects(response, reverse('accounts:profile'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 3)
+
+    def test_items_are_repriced(self):
+        self.fill_cart(self.products[:1])
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('12.50'))
+        self.submit()
+        self.assertEqual(OrderItem.objects.get().price_at_order, Decimal('12.50'))
+
+    def test_failure_leaves_no_partial_order(self):
+        self.fill_cart(self.products[:2])
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.submit()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.client.get(reverse('orders:cart_detail')).context['cart_count'], 2)
+
+    def test_invalid_form_keeps_cart(self):
+        self.fill_cart(self.products[:1])
+        response = self.client.post(reverse('orders:checkout'), {'phone': '', 'address': 'Адрес'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+
+class OrderTotalsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.products = [
+            Product.objects.create(
+                category=category, name=f"Товар {i}", slug=f"product-{i}", description="",
+                price=Decimal('10.00') + i, weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г",
+            )
+            for i in range(3)
+        ]
+
+    def create_order(self, quantities):
+        order = Order.objects.create(user=self.user, phone='+7', address='Адрес')
+        for product, quantity in zip(self.products, quantities):
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_order=product.price)
+        order.refresh_from_db()
+        return order
+
+    def test_checkout_stores_totals(self):
+        self.client.login(username='buyer', password='testpass123')
+        for product in self.products[:2] * 2:
+            self.client.post(reverse('orders:cart_add', args=[product.id]))
+        self.client.post(reverse('orders:checkout'), {'phone': '+7', 'address': 'Адрес', 'idempotency_key': uuid.uuid4()})
+        order = Order.objects.get()
+        self.assertEqual(order.total, order.total_price())
+        self.assertEqual(order.total, Decimal('10.00') * 2 + Decimal('11.00') * 2)
+        self.assertEqual(order.item_count, 4)
+
+    def test_item_changes_update_totals(self):
+        order = self.create_order([1, 2])
+        self.assertEqual((order.total, order.item_count), (Decimal('32.00'), 3))
+        item = order.items.get(product=self.products[1])
+        item.quantity = 5
+        item.save()
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.item_count), (Decimal('65.00'), 6))
+        item.delete()
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.item_count), (Decimal('10.00'), 1))
+
+    def test_backfill(self):
+        orders = [self.create_order([1, 1, 1]), self.create_order([2]), self.create_order([])]
+        Order.objects.update(total=0, item_count=0)
+        call_command('backfill_order_totals', batch_size=2, stdout=mock.MagicMock())
+        self.assertEqual(
+            [(order.total, order.item_count) for order in Order.objects.order_by('pk')],
+            [(order.total_price(), sum(item.quantity for item in order.items.all())) for order in orders],
+        )
+
+    def test_order_list_does_not_read_items(self):
+        for _ in range(3):
+            self.create_order([1, 2, 3])
+        self.client.login(username='buyer', password='testpass123')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('orders:order_list'))
+        self.assertContains(response, '68,00 ₽')
+        self.assertFalse([q for q in context.captured_queries if 'orders_orderitem' in q['sql']])
+
+    def test_admin_sorts_and_filters_by_total(self):
+        small, large = self.create_order([1]), self.create_order([100])
+        User.objects.create_superuser(username='admin', password='adminpass123')
+        self.client.login(username='admin', password='adminpass123')
+        url = reverse('admin:orders_order_changelist')
+        response = self.client.get(url, {'o': '-6'})
+        self.assertEqual([order.pk for order in response.context['cl'].result_list], [large.pk, small.pk])
+        response = self.client.get(url, {'total': 'lt1000'})
+        self.assertEqual([order.pk for order in response.context['cl'].result_list], [small.pk])
+
+class StockTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.client.login(username='buyer', password='testpass123')
+        category = Category.objects.create(name="Овощи", slug="vegetables")
+        defaults = dict(
+            category=category, description="", weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г",
+        )
+        self.tracked = Product.objects.create(name="Морковь", slug="carrot", price=Decimal('10.00'), stock=3, **defaults)
+        self.untracked = Product.objects.create(name="Лук", slug="onion", price=Decimal('5.00'), **defaults)
+
+    def stock_of(self, product):
+        product.refresh_from_db()
+        return product.stock, product.in_stock
+
+    def fill_cart(self, product, quantity):
+        for _ in range(quantity):
+            self.client.post(reverse('orders:cart_add', args=[product.id]), HTTP_ACCEPT='application/json')
+
+    def open_checkout(self):
+        return self.client.get(reverse('orders:checkout')).context['idempotency_key']
+
+    def submit(self, key):
+        return self.client.post(reverse('orders:checkout'), {'phone': '+7', 'address': 'Адрес', 'idempotency_key': key})
+
+    def test_in_stock_follows_stock(self):
+        self.tracked.stock = 0
+        self.tracked.save()
+        self.assertEqual(self.stock_of(self.tracked), (0, False))
+        self.tracked.stock = 2
+        self.tracked.save(update_fields=['stock'])
+        self.assertEqual(self.stock_of(self.tracked), (2, True))
+        self.assertEqual(self.stock_of(self.untracked), (None, True))
+
+    def test_checkout_reserves_and_order_consumes(self):
+        self.fill_cart(self.tracked, 2)
+        self.fill_cart(self.untracked, 5)
+        key = self.open_checkout()
+        # Резерв не трогает остаток и наличие: товар не пропадает из каталога
+        self.assertEqual(self.stock_of(self.tracked), (3, True))
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+        # Повторное открытие формы не откладывает товар второй раз
+        key = self.open_checkout()
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+
+        self.submit(key)
+        self.assertTrue(Order.objects.exists())
+        self.assertEqual(self.stock_of(self.tracked), (1, True))
+        self.assertEqual(self.stock_of(self.untracked), (None, True))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_reservations_of_others_are_not_sold(self):
+        self.fill_cart(self.tracked, 2)
+        self.open_checkout()
+        other = User.objects.create_user(username='other')
+        lines = [CartLine(self.tracked, 2, self.tracked.price)]
+        with self.assertRaises(stock.OutOfStock):
+            stock.reserve(other, uuid.uuid4(), stock.cart_quantities(lines))
+        with self.assertRaises(stock.OutOfStock):
+            place_order(other, lines, '+7', 'Адрес', uuid.uuid4())
+        place_order(other, [CartLine(self.tracked, 1, self.tracked.price)], '+7', 'Адрес', uuid.uuid4())
+        self.assertEqual(self.stock_of(self.tracked), (2, True))
+        # Истёкший резерв больше не держит товар
+        StockReservation.objects.update(expires_at=timezone.now())
+        place_order(other, lines, '+7', 'Адрес', uuid.uuid4())
+        self.assertEqual(self.stock_of(self.tracked), (0, False))
+
+    def test_selling_out_hides_product(self):
+        version = get_catalog_version()
+        self.fill_cart(self.tracked, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submit(self.open_checkout())
+        self.assertEqual(self.stock_of(self.tracked), (0, False))
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_insufficient_stock_creates_nothing(self):
+        self.fill_cart(self.tracked, 4)
+        response = self.client.get(reverse('orders:checkout'))
+        self.assertRedirects(response, reverse('orders:cart_detail'), fetch_redirect_response=False)
+        response = self.submit(uuid.uuid4())
+        self.assertRedirects(response, reverse('orders:cart_detail'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock_of(self.tracked), (3, True))
+        self.assertEqual(self.client.get(reverse('orders:cart_detail')).context['cart_count'], 4)
+
+    def test_sweeper_deletes_expired_reservations(self):
+        self.fill_cart(self.tracked, 3)
+        self.open_checkout()
+        self.assertEqual(self.stock_of(self.tracked), (3, True))
+        self.assertEqual(stock.release_expired(), 0)
+        self.assertEqual(stock.release_expired(timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(self.stock_of(self.tracked), (3, True))
+        self.assertFalse(StockReservation.objects.exists())
+
+        self.open_checkout()
+        StockReservation.objects.update(expires_at=timezone.now())
+        call_command('release_stock_reservations', stdout=mock.MagicMock())
+        self.assertFalse(StockReservation.objects.exists())
+
+class StockConcurrencyTest(TransactionTestCase):
+    BUYERS = 24
+    STOCK = 10
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        cache.clear()
+        category = Category.objects.create(name="Овощи", slug="vegetables")
+        product = Product.objects.create(
+            category=category, name="Морковь", slug="carrot", description="", price=Decimal('10.00'), stock=self.STOCK,
+            weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г",
+        )
+        users = [User.objects.create_user(username=f'buyer{i}') for i in range(self.BUYERS)]
+        barrier = threading.Barrier(self.BUYERS)
+        results = []
+
+        def buy(user):
+            try:
+                barrier.wait()
+                started = time.monotonic()
+                try:
+                    place_order(user, [CartLine(product, 1, product.price)], '+7', 'Адрес', uuid.uuid4())
+                    outcome = 'ok'
+                except stock.OutOfStock:
+                    outcome = 'out'
+                results.append((outcome, time.monotonic() - started))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        outcomes = [outcome for outcome, _ in results]
+        self.assertEqual(len(results), self.BUYERS)
+        self.assertEqual(outcomes.count('ok'), self.STOCK)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.in_stock), (0, False))
+        # Транзакции ждут друг друга, а не таймаута блокировки
+        self.assertLess(max(elapsed for _, elapsed in results), 5)
+
+class CartContextProcessorTest(TestCase):
+    def request(self, cart=None):
+        session = SessionStore()
+        if cart is not None:
+            session['cart'] = cart
+            session.save()
+            session = SessionStore(session.session_key)
+        request = RequestFactory().get('/')
+        request.session = session
+        if session.session_key:
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = session.session_key
+        return request
+
+    def test_visitor_without_cookies_skips_cart_storage(self):
+        request = self.request()
+        with mock.patch('orders.context_processors.Cart') as cart:
+            context = cart_context_processor(request)
+        self.assertEqual(context['cart_count'], 0)
+        cart.assert_not_called()
+        self.assertFalse(request.session.accessed)
+        # Страница без корзины не трогает ни сессию, ни хранилище корзины
+        with mock.patch('orders.cart.get_cart_storage') as storage:
+            response = self.client.get(reverse('products:product_list'))
+        storage.assert_not_called()
+        self.assertContains(response, 'id="cart-badge"></span>')
+
+    def test_session_is_not_read_until_badge_is_rendered(self):
+        request = self.request({'1': {'quantity': 2, 'price': '10.50'}})
+        context = cart_context_processor(request)
+        self.assertFalse(request.session.accessed)
+        self.assertTrue(context['cart_count'] > 0)
+        self.assertTrue(request.session.accessed)
+
+    def test_legacy_cart_without_summary(self):
+        request = self.request({'1': {'quantity': 2, 'price': '10.50'}, '2': {'quantity': 1, 'price': '3'}})
+        context = cart_context_processor(request)
+        self.assertEqual(str(context['cart_count']), '3')
+        self.assertEqual(str(context['cart_total']), '24.00')
+
+@override_settings(CART_STORAGE='orders.cart_storage.SignedCookieCartStorage')
+class SignedCookieCartTest(CartTest):
+    def test_anonymous_cart_needs_no_session(self):
+        self.add(self.products[0], 2)
+        self.assertNotIn('sessionid', self.client.cookies)
+        self.assertEqual(self.cart_data(), {str(self.products[0].id): {'quantity': 2, 'price': '10.10'}})
+
+    def test_tampered_cookie_is_ignored(self):
+        self.add(self.products[0])
+        self.client.cookies['cart'] = self.client.cookies['cart'].value[:-2] + 'xx'
+        self.assertEqual(self.cart_data(), {})
+
+    def test_cookie_is_compact(self):
+        data = {str(i): {'quantity': 3, 'price': '149.90'} for i in range(1000, 1100)}
+        encoded = SignedCookieCartStorage.encode(data)
+        self.assertLess(len(encoded), 1500)
+        self.assertEqual(SignedCookieCartStorage.decode(encoded), data)
+
+
+@override_settings(CART_STORAGE='orders.cart_storage.CacheCartStorage', CART_WRITE_BEHIND_INTERVAL=60)
+class CacheCartTest(CartTest):
+    def test_write_behind(self):
+        self.add(self.products[0])
+        self.assertNotIn('sessionid', self.client.cookies)
+        stored = StoredCart.objects.get()
+        self.assertEqual(stored.data[str(self.products[0].id)]['quantity'], 1)
+
+        # В пределах интервала изменения остаются только в кэше
+        self.add(self.products[0])
+        stored.refresh_from_db()
+        self.assertEqual(stored.data[str(self.products[0].id)]['quantity'], 1)
+        self.assertEqual(self.cart_data()[str(self.products[0].id)]['quantity'], 2)
+
+        # Очистка кэша по умолчанию корзины не задевает
+        cache.clear()
+        self.assertEqual(self.cart_data()[str(self.products[0].id)]['quantity'], 2)
+
+        # После вытеснения из кэша корзин корзина читается из БД
+        caches['carts'].clear()
+        self.assertEqual(self.cart_data()[str(self.products[0].id)]['quantity'], 1)
+
+    def test_flush_writes_changes_made_after_last_write(self):
+        self.add(self.products[0])
+        self.add(self.products[0])
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch('orders.cart_storage.timezone.now', return_value=later):
+            call_command('flush_carts', stdout=StringIO())
+        stored = StoredCart.objects.get()
+        self.assertEqual(stored.data[str(self.products[0].id)]['quantity'], 2)
+        self.assertIsNotNone(stored.flush_after)
+
+        # Без новых изменений следующий проход снимает проверку
+        with mock.patch('orders.cart_storage.timezone.now', return_value=later + timedelta(seconds=61)):
+            self.assertEqual(cart_storage.flush_write_behind(), 0)
+        stored.refresh_from_db()
+        self.assertIsNone(stored.flush_after)
+        caches['carts'].clear()
+        self.assertEqual(self.cart_data()[str(self.products[0].id)]['quantity'], 2)
+
+    def test_requires_shared_cache(self):
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={**settings.CACHES, 'carts': locmem}), self.assertRaises(ImproperlyConfigured):
+            self.add(self.products[0])
+        without_carts = {'default': settings.CACHES['default']}
+        with override_settings(CACHES=without_carts), self.assertRaises(ImproperlyConfigured):
+            self.add(self.products[0])
+
+    def test_cleared_cart_is_removed_from_db(self):
+        self.client.login(username='buyer', password='testpass123')
+        self.add(self.products[0])
+        self.client.post(reverse('orders:checkout'), {'phone': '+7', 'address': 'Адрес'})
+        self.assertFalse(StoredCart.objects.exists())
@@ -0,0 +1,49 @@
+"""Сохранённые суммы заказов.
+
+Order.total и Order.item_count задаются при оформлении (orders.checkout) и
+пересчитываются одним агрегирующим запросом при сохранении и удалении
+позиций (orders.signals), например в админке. Для заказов, созданных до
+появления этих полей, есть команда backfill_order_totals.
+"""
+from decimal import Decimal
+
+from django.db.models import F, Sum
+
+from .models import Order, OrderItem
+
+
+def line_totals(lines):
+    """(сумма, число единиц) для пар (цена, количество)"""
+    total = Decimal('0')
+    count = 0
+    for price, quantity in lines:
+        total += price * quantity
+        count += quantity
+    return total, count
+
+
+def item_totals(order_ids):
+    """{id заказа: (сумма, число единиц)} по позициям; заказов без позиций в словаре нет"""
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('order_id')
+        .annotate(total=Sum(F('price_at_order') * F('quantity')), item_count=Sum('quantity'))
+        .order_by()
+    )
+    return {row['order_id']: (row['total'], row['item_count']) for row in rows}
+
+
+def update_order_totals(order_ids):
+    """Пересчитать сохранённые суммы заказов, возвращает число изменённых"""
+    order_ids = list(order_ids)
+    totals = item_totals(order_ids)
+    orders = []
+    for order in Order.objects.filter(pk__in=order_ids).only('id', 'total', 'item_count'):
+        total, item_count = totals.get(order.pk, (Decimal('0'), 0))
+        if order.total != total or order.item_count != item_count:
+            order.total = total
+            order.item_count = item_count
+            orders.append(order)
+    if orders:
+        Order.objects.bulk_update(orders, ['total', 'item_count'])
+    return len(orders)
@@ -1,110 +1,151 @@
+import uuid
+from decimal import Decimal
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.generic import ListView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
+from .cart import Cart
+from .checkout import find_order, place_order
+from . import stock
+from .forms import CheckoutForm
 from .models import Order, OrderItem
 from products.models import Product
+from products import renditions
 from .mixins import LoginRequiredMixinWithMessage
 
 # Cart functions (session-based)
+def _wants_json(request):
+    """Запрос из JS (fetch) - ответить JSON вместо перенаправления"""
+    accept = request.headers.get('Accept', '')
+    return (
+        request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        or ('application/json' in accept and 'text/html' not in accept)
+    )
+
+
+def _cart_response(cart, product_id, message=''):
+    """Изменённая строка, значок и сумма корзины - всё, что нужно обновить на странице"""
+    quantity = cart.quantity(product_id)
+    price = cart.data[str(product_id)]['price'] if quantity else '0'
+    return JsonResponse({
+        'product_id': product_id,
+        'quantity': quantity,
+        'line_total': f'{Decimal(price) * quantity:.2f}',
+        'cart_count': cart.count,
+        'cart_total': f'{cart.total:.2f}',
+        'message': message,
+    })
+
+
 def cart_add(request, product_id):
-    cart = request.session.get('cart', {})
-    product = get_object_or_404(Product, id=product_id)
-    
-    if str(product_id) in cart:
-        cart[str(product_id)]['quantity'] += 1
-    else:
-        cart[str(product_id)] = {
-            'quantity': 1,
-            'price': str(product.price)
-        }
-    
-    request.session['cart'] = cart
-    messages.success(request, f'{product.name} добавлен в корзину!')
+    product = get_object_or_404(Product.objects.only('id', 'name', 'price'), id=product_id)
+    cart = Cart(request)
+    cart.add(product)
+    message = f'{product.name} добавлен в корзину!'
+    if _wants_json(request):
+        return _cart_response(cart, product.id, message)
+    messages.success(request, message)
     return redirect('products:product_list')
 
 
 def cart_remove(request, product_id):
-    cart = request.session.get('cart', {})
-    
-    if str(product_id) in cart:
-        if cart[str(product_id)]['quantity'] > 1:
-            cart[str(product_id)]['quantity'] -= 1
-        else:
-            del cart[str(product_id)]
-    
-    request.session['cart'] = cart
+    # Кнопка "Удалить" передаёт всё количество строки, "минус" убирает одну единицу
+    try:
+        quantity = max(int(request.POST.get('quantity', 1)), 1)
+    except ValueError:
+        quantity = 1
+    cart = Cart(request)
+    cart.remove(product_id, quantity)
+    if _wants_json(request):
+        return _cart_response(cart, product_id)
     return redirect('orders:cart_detail')
 
 
+def _warn_missing(request, cart):
+    if cart.missing:
+        messages.warning(request, 'Некоторые товары больше недоступны и были удалены из корзины.')
+
+
+def _warn_out_of_stock(request, lines, error):
+    names = ', '.join(line.product.name for line in lines if line.product.id in error.product_ids)
+    messages.error(request, f'Недостаточно товара на складе: {names}. Уменьшите количество в корзине.')
+
+
 def cart_detail(request):
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total_price = 0
-    
-    for product_id, item in cart.items():
-        product = get_object_or_404(Product, id=product_id)
-        item_total = float(item['price']) * item['quantity']
-        total_price += item_total
-        
-        cart_items.append({
-            'product': product,
-            'quantity': item['quantity'],
-            'price': float(item['price']),
-            'item_total': item_total
-        })
-    
+    cart = Cart(request)
+    cart_items = cart.lines
+    _warn_missing(request, cart)
     context = {
         'cart_items': cart_items,
-        'total_price': total_price
+        'total_price': cart.total,
+        'renditions': renditions.ready_map(item.product.image for item in cart_items),
     }
     return render(request, 'orders/cart.html', context)
 
 
 @login_required
 def checkout(request):
-    cart = request.session.get('cart', {})
-    
-    if not cart:
-        messages.error(request, 'Ваша корзина пуста!')
-        return redirect('products:product_list')
-    
-    # Calculate total price for display
-    total_price = 0
-    for product_id, item in cart.items():
-        total_price += float(item['price']) * item['quantity']
+    cart = Cart(request)
     
     if request.method == 'POST':
-        phone = request.POST.get('phone')
-        address = request.POST.get('address')
-        
-        if not phone or not address:
+        form = CheckoutForm(request.POST)
+        if not form.is_valid():
             messages.error(request, 'Пожалуйста, заполните все поля!')
-            return render(request, 'orders/checkout.html', {'phone': phone, 'address': address, 'total_price': total_price})
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            phone=phone,
-            address=address
-        )
+            context = {
+                'phone': request.POST.get('phone'),
+                'address': request.POST.get('address'),
+                'total_price': cart.total,
+                'idempotency_key': request.POST.get('idempotency_key') or uuid.uuid4(),
+            }
+            return render(request, 'orders/checkout.html', context)
         
-        # Create order items
-        for product_id, item in cart.items():
-            product = get_object_or_404(Product, id=product_id)
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=item['quantity'],
-                price_at_order=item['price']
-            )
+        key = form.cleaned_data['idempotency_key'] or uuid.uuid4()
+        # Повторная отправка уже принятой формы - заказ не создаётся второй раз
+        if find_order(request.user, key) is None:
+            if not cart:
+                messages.error(request, 'Ваша корзина пуста!')
+                return redirect('products:product_list')
+            
+            lines = cart.lines
+            if cart.missing:
+                _warn_missing(request, cart)
+                return redirect('orders:cart_detail')
+            
+            try:
+                order, created = place_order(
+                    request.user, lines, form.cleaned_data['phone'], form.cleaned_data['address'], key
+                )
+            except stock.OutOfStock as error:
+                _warn_out_of_stock(request, lines, error)
+                return redirect('orders:cart_detail')
+            if created and sum(line.product.price * line.quantity for line in lines) != cart.total:
+                messages.info(request, 'Цены некоторых товаров изменились с момента добавления в корзину.')
         
         # Clear cart
-        request.session['cart'] = {}
+        cart.clear()
         messages.success(request, 'Заказ успешно оформлен!')
         return redirect('accounts:profile')
     
+    if not cart:
+        messages.error(request, 'Ваша корзина пуста!')
+        return redirect('products:product_list')
+    
+    lines = cart.lines
+    if cart.missing:
+        _warn_missing(request, cart)
+        return redirect('orders:cart_detail')
+    
+    # Товары откладываются, пока покупатель заполняет форму
+    key = uuid.uuid4()
+    try:
+        stock.reserve(request.user, key, stock.cart_quantities(lines))
+    except stock.OutOfStock as error:
+        _warn_out_of_stock(request, lines, error)
+        return redirect('orders:cart_detail')
+    
     # Pre-fill form with profile data
     initial_phone = ''
     initial_address = ''
@@ -115,7 +156,8 @@ def checkout(request):
     context = {
         'phone': initial_phone,
         'address': initial_address,
-        'total_price': total_price
+        'total_price': cart.total,
+        'idempotency_key': key,
     }
     return render(request, 'orders/checkout.html', context)
 
@@ -127,7 +169,7 @@ class OrderListView(LoginRequiredMixinWithMessage, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related('items__product').order_by('-created_at')
+        return Order.objects.filter(user=self.request.user).order_by('-created_at')
 
 
 class OrderDetailView(LoginRequiredMixinWithMessage, DetailView):
@@ -136,4 +178,10 @@ class OrderDetailView(LoginRequiredMixinWithMessage, DetailView):
     context_object_name = 'order'
 
     def get_object(self):
-        return get_object_or_404(Order, id=self.kwargs['pk'], user=self.request.user)
\ No newline at end of file
+        return get_object_or_404(Order, id=self.kwargs['pk'], user=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['items'] = list(self.object.items.select_related('product'))
+        context['renditions'] = renditions.ready_map(item.product.image for item in context['items'])
+        return context
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Supplier
+from .models import Category, Product, ProductImage, Supplier
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
@@ -27,10 +27,19 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class ProductImageInline(admin.TabularInline):
+    model = ProductImage
+    extra = 0
+    fields = ('image', 'position', 'source_url', 'etag', 'downloaded_at')
+    readonly_fields = ('etag', 'downloaded_at')
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'supplier', 'price', 'in_stock')
+    list_display = ('name', 'category', 'supplier', 'price', 'stock', 'in_stock')
     list_filter = ('category', 'supplier', 'in_stock')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
-    list_editable = ('price', 'in_stock')
\ No newline at end of file
+    list_editable = ('price', 'stock', 'in_stock')
+    inlines = [ProductImageInline]
+
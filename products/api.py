@@ -0,0 +1,128 @@
+"""Потоковый JSON API каталога.
+
+Ответ формируется по мере чтения строк из базы (QuerySet.iterator), поэтому
+память процесса не зависит от размера выгрузки, а первый байт уходит клиенту
+сразу после первой пачки строк.
+"""
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+
+from .models import Product
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, seek_filter
+
+API_ORDERING = ('name', 'id')
+CHUNK_SIZE = 2000
+MAX_LIMIT = 1000
+
+# Поле ответа -> поле модели (или путь через связь)
+API_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'description': 'description',
+    'price': 'price',
+    'weight': 'weight',
+    'calories': 'calories',
+    'protein': 'protein',
+    'fat': 'fat',
+    'carbs': 'carbs',
+    'in_stock': 'in_stock',
+    'image': 'image',
+    'category': 'category__slug',
+    'supplier_id': 'supplier_id',
+    'updated_at': 'updated_at',
+}
+DEFAULT_FIELDS = ('id', 'name', 'slug', 'price', 'category', 'supplier_id', 'in_stock')
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def _serialize_value(field, value):
+    if field == 'image':
+        return f'{settings.MEDIA_URL}{value}' if value else None
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _error(message):
+    return JsonResponse({'error': message}, status=400)
+
+
+def _iter_json(rows, fields, limit, next_url_for):
+    """Генератор тела ответа: {"results": [...], "next": ...}"""
+    yield '{"results":['
+    buffer = []
+    last_key = None
+    count = 0
+    for row in rows:
+        if limit is not None and count == limit:
+            # Строка сверх лимита означает, что есть следующая страница
+            yield ''.join(buffer)
+            yield '],"next":' + _encoder.encode(next_url_for(last_key)) + '}'
+            return
+        item = {field: _serialize_value(field, row[API_FIELDS[field]]) for field in fields}
+        buffer.append((',' if count else '') + _encoder.encode(item))
+        last_key = [row[f] for f in API_ORDERING]
+        count += 1
+        if len(buffer) >= 200:
+            yield ''.join(buffer)
+            buffer = []
+    yield ''.join(buffer)
+    yield '],"next":null}'
+
+
+def products_api(request):
+    """GET /api/products/?fields=id,name&category=&supplier=&limit=&after="""
+    fields = DEFAULT_FIELDS
+    if request.GET.get('fields'):
+        fields = tuple(field.strip() for field in request.GET['fields'].split(',') if field.strip())
+        unknown = [field for field in fields if field not in API_FIELDS]
+        if unknown:
+            return _error(f'Неизвестные поля: {", ".join(unknown)}')
+
+    limit = None
+    if request.GET.get('limit'):
+        try:
+            limit = int(request.GET['limit'])
+        except ValueError:
+            return _error('limit должен быть числом')
+        if not 1 <= limit <= MAX_LIMIT:
+            return _error(f'limit должен быть от 1 до {MAX_LIMIT}')
+
+    queryset = Product.objects.filter(in_stock=True)
+    if request.GET.get('category'):
+        queryset = queryset.filter(category__slug=request.GET['category'])
+    if request.GET.get('supplier'):
+        if not request.GET['supplier'].isdecimal():  # isdigit() пропустил бы '²', на котором int() падает
+            return _error('supplier должен быть числом')
+        queryset = queryset.filter(supplier_id=int(request.GET['supplier']))
+    if request.GET.get('after'):
+        try:
+            values = decode_cursor(request.GET['after'], API_ORDERING)
+        except InvalidCursor as e:
+            return _error(str(e))
+        queryset = queryset.filter(seek_filter(API_ORDERING, values))
+
+    columns = {API_FIELDS[field] for field in fields} | set(API_ORDERING)
+    queryset = queryset.order_by(*API_ORDERING).values(*columns)
+    if limit is not None:
+        queryset = queryset[:limit + 1]
+
+    base_query = request.GET.copy()
+
+    def next_url_for(key):
+        base_query['after'] = encode_cursor(key, API_ORDERING)
+        return request.build_absolute_uri(f'{reverse("products:products_api")}?{base_query.urlencode()}')
+
+    rows = queryset.iterator(chunk_size=CHUNK_SIZE)
+    return StreamingHttpResponse(
+        _iter_json(rows, fields, limit, next_url_for),
+        content_type='application/json; charset=utf-8',
+    )
@@ -0,0 +1,137 @@
+"""Функции свежести для условных GET-запросов (ETag / Last-Modified).
+
+Используются с django.views.decorators.http.condition: если страница не
+изменилась, ответ 304 отдаётся без запросов к каталогу и без рендеринга
+шаблона. Версия каталога (products.versioning) и updated_at моделей
+отвечают за данные, а часть ETag, зависящая от посетителя, - за то, что
+в шаблоне берётся из сессии (корзина, имя пользователя, CSRF-токен).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+from orders.cart import Cart
+from orders.cart_storage import may_have_cart
+
+from .models import Category, Product, Supplier
+from .snapshot import get_snapshot, snapshot_enabled
+from .suppliers_cache import get_suppliers_payload
+from .versioning import get_catalog_version, get_renditions_version, get_suppliers_version
+
+# Ключ меняется с версией каталога, срок только освобождает место в кэше
+LAST_MODIFIED_TIMEOUT = 24 * 60 * 60
+
+
+def _has_pending_messages(request):
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def _is_anonymous_without_session(request):
+    # Корзина может жить в cookie без сессии (orders.cart_storage)
+    return not may_have_cart(request)
+
+
+def visitor_variant(request):
+    """Составляющая ETag для персональных частей страницы.
+
+    Анонимный посетитель без сессии получает общую для всех версию и сессия
+    не читается вовсе. None означает, что отвечать 304 нельзя: в сессии
+    лежат сообщения, которые ещё не были показаны.
+    """
+    if _has_pending_messages(request):
+        return None
+    parts = [request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')]
+    if _is_anonymous_without_session(request):
+        return parts
+    if request.user.is_authenticated:
+        parts.append(f'user:{request.user.pk}')
+    parts.append(f'cart:{Cart(request).count}')
+    return parts
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def catalog_last_modified():
+    """Максимальный updated_at по товарам, категориям и поставщикам"""
+    key = f'products:last-modified:{get_catalog_version()}'
+    value = cache.get(key)
+    if value is None:
+        dates = [
+            model.objects.aggregate(last=Max('updated_at'))['last']
+            for model in (Product, Category, Supplier)
+        ]
+        dates = [date for date in dates if date is not None]
+        value = max(dates) if dates else False
+        cache.set(key, value, LAST_MODIFIED_TIMEOUT)
+    return value or None
+
+
+def _served_catalog_version():
+    # Снимок каталога перестраивается с задержкой: ETag - по версии того, что отдаётся
+    return get_snapshot().version if snapshot_enabled() else get_catalog_version()
+
+
+def catalog_etag(request, *args, **kwargs):
+    variant = visitor_variant(request)
+    if variant is None:
+        return None
+    return make_etag('catalog', _served_catalog_version(), get_renditions_version(), request.get_full_path(), *variant)
+
+
+def catalog_last_modified_for(request, *args, **kwargs):
+    # Last-Modified не учитывает корзину, поэтому только для общей версии страницы
+    if not _is_anonymous_without_session(request) or _has_pending_messages(request):
+        return None
+    return catalog_last_modified()
+
+
+def _product_updated_at(request, slug):
+    if not hasattr(request, '_product_updated_at') and snapshot_enabled():
+        record = get_snapshot().get(slug)
+        request._product_updated_at = record.updated_at if record else None
+    if not hasattr(request, '_product_updated_at'):
+        row = (
+            Product.objects.filter(slug=slug)
+            .values_list('updated_at', 'category__updated_at', 'supplier__updated_at')
+            .first()
+        )
+        request._product_updated_at = max(date for date in row if date is not None) if row else None
+    return request._product_updated_at
+
+
+def product_etag(request, slug, *args, **kwargs):
+    """ETag карточки товара.
+
+    Кроме самого товара карточка показывает рекомендации и галерею, у
+    которых нет своих updated_at, поэтому ETag включает версию каталога.
+    Last-Modified карточке не выставляется по той же причине: дата товара
+    не отражает смену рекомендаций или галереи.
+    """
+    variant = visitor_variant(request)
+    updated_at = _product_updated_at(request, slug)
+    if variant is None or updated_at is None:
+        return None
+    return make_etag(
+        'product', request.get_full_path(), updated_at.isoformat(),
+        _served_catalog_version(), get_renditions_version(), *variant,
+    )
+
+
+def suppliers_etag(request, *args, **kwargs):
+    return make_etag('suppliers', get_suppliers_version())
+
+
+def suppliers_json_etag(request, *args, **kwargs):
+    if 'bbox' in request.GET:
+        return suppliers_etag(request)
+    # Полный список: строгий ETag - хэш закэшированного тела ответа
+    return get_suppliers_payload().etag
+
+
+def suppliers_last_modified(request, *args, **kwargs):
+    return catalog_last_modified()
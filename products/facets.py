@@ -0,0 +1,75 @@
+"""Фасеты каталога: количество товаров в наличии по категориям и поставщикам.
+
+Матрица категория x поставщик считается одним GROUP BY и кэшируется под
+текущей версией каталога. Счётчики для выбранного фильтра получаются
+суммированием по матрице в памяти, без дополнительных запросов.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Category, Product, Supplier
+from .versioning import get_catalog_version
+
+FACETS_TIMEOUT = 60 * 60
+
+FacetOption = namedtuple('FacetOption', ['id', 'name', 'slug', 'count'])
+
+
+class CatalogFacets:
+    def __init__(self, categories, suppliers, counts):
+        # categories: [(id, name, slug)], suppliers: [(id, name)]
+        # counts: {(category_id, supplier_id): количество товаров в наличии}
+        self.categories = categories
+        self.suppliers = suppliers
+        self.counts = counts
+
+    @classmethod
+    def build(cls):
+        categories = list(Category.objects.values_list('id', 'name', 'slug'))
+        suppliers = list(Supplier.objects.filter(is_active=True).values_list('id', 'name'))
+        rows = (
+            Product.objects.filter(in_stock=True)
+            .order_by()
+            .values_list('category_id', 'supplier_id')
+            .annotate(count=Count('id'))
+        )
+        return cls(categories, suppliers, {(c, s): n for c, s, n in rows})
+
+    def category_id(self, slug):
+        for pk, name, category_slug in self.categories:
+            if category_slug == slug:
+                return pk
+        return None
+
+    def category_options(self, supplier_id=None):
+        """Категории со счётчиками с учётом выбранного поставщика"""
+        totals = {}
+        for (category_id, product_supplier_id), count in self.counts.items():
+            if supplier_id is None or product_supplier_id == supplier_id:
+                totals[category_id] = totals.get(category_id, 0) + count
+        return [FacetOption(pk, name, slug, totals.get(pk, 0)) for pk, name, slug in self.categories]
+
+    def supplier_options(self, category_id=None):
+        """Поставщики со счётчиками с учётом выбранной категории"""
+        totals = {}
+        for (product_category_id, supplier_id), count in self.counts.items():
+            if category_id is None or product_category_id == category_id:
+                totals[supplier_id] = totals.get(supplier_id, 0) + count
+        return [FacetOption(pk, name, None, totals.get(pk, 0)) for pk, name in self.suppliers]
+
+    def total(self, category_id=None, supplier_id=None):
+        return sum(
+            count for (c, s), count in self.counts.items()
+            if (category_id is None or c == category_id) and (supplier_id is None or s == supplier_id)
+        )
+
+
+def get_catalog_facets():
+    key = f'products:facets:{get_catalog_version()}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = CatalogFacets.build()
+        cache.set(key, facets, FACETS_TIMEOUT)
+    return facets
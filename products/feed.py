@@ -0,0 +1,158 @@
+"""Потоковое чтение фида товаров.
+
+Поддерживаются JSON-массив объектов верхнего уровня (products.json) и
+JSON Lines - по объекту на строку. Файл читается блоками, в памяти
+держится только текущий блок и разбираемая запись, поэтому память не
+зависит от размера фида. Каждая запись отдаётся с номером строки, где
+она начинается, вместе с ошибкой разбора, если она есть: битая строка
+JSON Lines не прерывает чтение. В массиве после синтаксической ошибки
+границу следующей записи не найти, поэтому чтение прекращается (FeedError).
+"""
+import codecs
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+CHUNK_SIZE = 1 << 16
+# Запись длиннее этого считается битой, а не недочитанной
+MAX_RECORD_SIZE = 1 << 20
+WHITESPACE = ' \t\r\n'
+
+TEXT_FIELDS = {
+    'name': 200, 'description': None, 'category': None,
+    'weight': 50, 'calories': 50, 'protein': 50, 'fat': 50, 'carbs': 50,
+}
+
+
+class FeedError(ValueError):
+    """Фид нельзя читать дальше"""
+
+
+class InvalidRecord(ValueError):
+    """Запись пропускается, остальные читаются"""
+
+
+class FeedReader:
+    """Итератор (номер строки, запись, ошибка) по файлу фида.
+
+    bytes_read и size - для индикатора прогресса.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.bytes_read = 0
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            first = f.read(CHUNK_SIZE)
+            self.bytes_read = len(first)
+            start = first.lstrip(codecs.BOM_UTF8 + WHITESPACE.encode())[:1]
+            if start == b'[':
+                yield from self._array(f, first)
+            elif start in (b'{', b''):
+                f.seek(0)
+                self.bytes_read = 0
+                yield from self._lines(f)
+            else:
+                raise FeedError('Фид должен быть JSON-массивом объектов или JSON Lines')
+
+    def _lines(self, f):
+        for number, raw in enumerate(f, 1):
+            self.bytes_read += len(raw)
+            if number == 1:
+                raw = raw.removeprefix(codecs.BOM_UTF8)
+            if not raw.strip():
+                continue
+            try:
+                yield number, json.loads(raw), None
+            except ValueError as error:  # JSONDecodeError и UnicodeDecodeError
+                yield number, None, InvalidRecord(f'некорректный JSON: {error}')
+
+    def _array(self, f, first):
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        buffer = text_decoder.decode(first)
+        pos = buffer.index('[') + 1
+        # Номер строки для позиции pos: переводы строк в отброшенной части буфера + до pos
+        line = 1 + buffer.count('\n', 0, pos)
+        eof = False
+
+        def read_more():
+            nonlocal buffer, pos, eof
+            chunk = f.read(CHUNK_SIZE)
+            self.bytes_read += len(chunk)
+            eof = not chunk
+            buffer = buffer[pos:] + text_decoder.decode(chunk, final=eof)
+            pos = 0
+
+        expect_value = True
+        while True:
+            # Пропуск пробелов и запятых между записями
+            while True:
+                while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                    if buffer[pos] == '\n':
+                        line += 1
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                read_more()
+            if pos >= len(buffer):
+                raise FeedError(f'строка {line}: фид оборван, нет закрывающей ]')
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] == ',' and not expect_value:
+                pos += 1
+                expect_value = True
+                continue
+
+            while True:
+                try:
+                    data, end = decoder.raw_decode(buffer, pos)
+                    break
+                except json.JSONDecodeError as error:
+                    if eof or len(buffer) - pos > MAX_RECORD_SIZE:
+                        raise FeedError(f'строка {line + buffer.count(chr(10), pos, error.pos)}: {error.msg}')
+                    read_more()
+            if not expect_value:
+                raise FeedError(f'строка {line}: между записями нет запятой')
+            yield line, data, None
+            line += buffer.count('\n', pos, end)
+            pos = end
+            expect_value = False
+            if pos > CHUNK_SIZE:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def clean_record(data):
+    """Проверить запись фида и привести типы; InvalidRecord - запись пропускается"""
+    if not isinstance(data, dict):
+        raise InvalidRecord('запись должна быть объектом')
+    missing = [field for field in (*TEXT_FIELDS, 'price') if field not in data]
+    if missing:
+        raise InvalidRecord(f'нет полей: {", ".join(missing)}')
+    cleaned = {}
+    for field, max_length in TEXT_FIELDS.items():
+        value = data[field]
+        if not isinstance(value, str):
+            raise InvalidRecord(f'{field}: ожидается строка')
+        if max_length and len(value) > max_length:
+            raise InvalidRecord(f'{field}: длиннее {max_length} символов')
+        cleaned[field] = value
+    if not cleaned['name'].strip():
+        raise InvalidRecord('name: пустое название')
+    try:
+        if isinstance(data['price'], bool):
+            raise InvalidOperation
+        price = Decimal(str(data['price']))
+    except (InvalidOperation, ValueError):
+        raise InvalidRecord('price: ожидается число')
+    if not price.is_finite() or price < 0 or price >= 10 ** 8:
+        raise InvalidRecord('price: вне допустимого диапазона')
+    cleaned['price'] = price.quantize(Decimal('0.01'))
+    in_stock = data.get('in_stock', True)
+    if not isinstance(in_stock, bool):
+        raise InvalidRecord('in_stock: ожидается true или false')
+    cleaned['in_stock'] = in_stock
+    return cleaned
@@ -0,0 +1,168 @@
+"""Geohash и запросы поставщиков по видимой области карты.
+
+У каждого поставщика хранится geohash координат (Supplier.geohash) с
+частичным индексом по активным поставщикам. Geohash с общим префиксом
+лежат в одной ячейке сетки, поэтому:
+
+* видимая область покрывается небольшим числом ячеек, и каждая ячейка -
+  это диапазон [префикс, префикс + '~') по индексу, а не полный перебор;
+* кластеры - это GROUP BY по префиксу нужной длины, длина выбирается по
+  масштабу карты.
+"""
+import math
+
+from django.db.models import Avg, Count, Min, Q
+from django.db.models.functions import Substr
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+# Символ больше любого символа BASE32: [prefix, prefix + '~') - все хэши с префиксом
+RANGE_END = '~'
+# Видимая область покрывается не более чем таким числом ячеек
+MAX_COVER_CELLS = 16
+# Начиная с этого масштаба поставщики отдаются по одному, без кластеров
+CLUSTER_MAX_ZOOM = 12
+MAX_POINTS = 2000
+
+
+class InvalidBBox(ValueError):
+    pass
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            bounds, coordinate = lon_range, longitude
+        else:
+            bounds, coordinate = lat_range, latitude
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(высота, ширина) ячейки geohash в градусах"""
+    lat_bits = precision * 5 // 2
+    lon_bits = precision * 5 - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def parse_bbox(value):
+    """'south,west,north,east' -> кортеж float"""
+    try:
+        south, west, north, east = (float(part) for part in value.split(','))
+    except ValueError:
+        raise InvalidBBox('bbox должен быть в формате south,west,north,east')
+    if not all(math.isfinite(v) for v in (south, west, north, east)):
+        raise InvalidBBox('bbox должен состоять из чисел')
+    # Leaflet отдаёт долготы за пределами +-180 при прокрутке мира - обрезаем
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    if south > north or west > east:
+        raise InvalidBBox('bbox пустой')
+    return south, west, north, east
+
+
+def cover_cells(bbox):
+    """Префиксы geohash, покрывающие область: самая мелкая сетка из не более MAX_COVER_CELLS ячеек"""
+    south, west, north, east = bbox
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        columns = math.floor(east / width) - math.floor(west / width) + 1
+        if rows * columns <= MAX_COVER_CELLS:
+            break
+    else:
+        return ['']
+
+    cells = []
+    height, width = cell_size(precision)
+    for row in range(math.floor(south / height), math.floor(north / height) + 1):
+        latitude = min((row + 0.5) * height, 90.0)
+        for column in range(math.floor(west / width), math.floor(east / width) + 1):
+            longitude = min((column + 0.5) * width, 180.0)
+            cells.append(encode(latitude, longitude, precision))
+    return sorted(set(cells))
+
+
+def cluster_precision(zoom):
+    """Длина префикса кластера для масштаба карты (None - без кластеров)"""
+    if zoom >= CLUSTER_MAX_ZOOM:
+        return None
+    # Ячейка кластера примерно 50-100 px: каждые 2.5 уровня масштаба - ещё один символ
+    return max(1, min(GEOHASH_PRECISION, int((zoom + 2) / 2.5) + 1))
+
+
+def in_bbox(queryset, bbox):
+    """Поставщики в области: диапазоны по индексу geohash + точная проверка координат"""
+    south, west, north, east = bbox
+    prefixes = cover_cells(bbox)
+    cells = Q()
+    for prefix in prefixes:
+        cells |= Q(geohash__gte=prefix, geohash__lt=prefix + RANGE_END)
+    # Общий диапазон от первой до последней ячейки - по нему SQLite ищет в индексе,
+    # OR по ячейкам отсекает промежутки кривой Z-order между ними
+    span = Q(geohash__gte=prefixes[0], geohash__lt=prefixes[-1] + RANGE_END)
+    return queryset.filter(span, cells).filter(
+        latitude__gte=south, latitude__lte=north,
+        longitude__gte=west, longitude__lte=east,
+    )
+
+
+def viewport(queryset, bbox, zoom):
+    """{'clusters': [...], 'suppliers': [...]} для видимой области и масштаба.
+
+    Кластер из одного поставщика отдаётся как отдельная точка.
+    """
+    queryset = in_bbox(queryset, bbox)
+    precision = cluster_precision(zoom)
+    clusters = []
+    suppliers = []
+    truncated = False
+
+    if precision is None:
+        rows = queryset.order_by('geohash').values_list('id', 'name', 'latitude', 'longitude')[:MAX_POINTS + 1]
+        for pk, name, latitude, longitude in rows:
+            if len(suppliers) == MAX_POINTS:
+                truncated = True
+                break
+            suppliers.append({'id': pk, 'name': name, 'latitude': float(latitude), 'longitude': float(longitude)})
+    else:
+        rows = (
+            queryset.annotate(cell=Substr('geohash', 1, precision))
+            .values('cell')
+            .annotate(
+                count=Count('id'), latitude=Avg('latitude'), longitude=Avg('longitude'),
+                first_id=Min('id'), first_name=Min('name'),
+            )
+            .order_by('cell')
+        )
+        for row in rows:
+            if row['count'] == 1:
+                suppliers.append({
+                    'id': row['first_id'], 'name': row['first_name'],
+                    'latitude': float(row['latitude']), 'longitude': float(row['longitude']),
+                })
+            else:
+                clusters.append({
+                    'geohash': row['cell'], 'count': row['count'],
+                    'latitude': round(float(row['latitude']), 6), 'longitude': round(float(row['longitude']), 6),
+                })
+    return {'zoom': zoom, 'clusters': clusters, 'suppliers': suppliers, 'truncated': truncated}
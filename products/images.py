@@ -0,0 +1,90 @@
+"""Параллельная загрузка изображений товаров (команда download_images).
+
+HTTP-запросы выполняет ограниченный пул потоков через общую
+requests.Session: соединения с CDN переиспользуются (keep-alive), пул
+соединений на хост равен числу потоков, обрывы и ответы 429/5xx
+повторяются с экспоненциальной задержкой (с учётом Retry-After). В очереди
+пула не больше двух заданий на поток, так что память не зависит от числа
+изображений. База и хранилище файлов - только в потоке, который читает
+результаты: потоки загрузки с ORM не работают.
+"""
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Ответ больше этого не считается изображением товара
+MAX_IMAGE_SIZE = 20 * 2 ** 20
+CONTENT_EXTENSIONS = {
+    'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp', 'image/gif': '.gif', 'image/avif': '.avif',
+}
+
+# etag - сохранённый ETag для условного запроса, пустой - загрузить заново
+ImageJob = namedtuple('ImageJob', 'product_id slug position url etag')
+# content is None - изображение не изменилось (304)
+Downloaded = namedtuple('Downloaded', 'content etag content_type')
+
+
+class ImageDownloadError(Exception):
+    """Ответ получен, но изображением не является"""
+
+
+class ImageDownloader:
+    def __init__(self, workers=8, retries=3, backoff=0.5, timeout=10):
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'ecoshop-image-downloader'
+        adapter = HTTPAdapter(
+            pool_maxsize=workers,
+            max_retries=Retry(
+                total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                allowed_methods=['GET'], raise_on_status=False,
+            ),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def fetch(self, url, etag=''):
+        """Downloaded по URL; с etag - условный запрос"""
+        headers = {'If-None-Match': etag} if etag else {}
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304:
+                return Downloaded(None, etag, '')
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if not content_type.startswith('image/'):
+                raise ImageDownloadError(f'ожидалось изображение, получен {content_type or "ответ без типа"}')
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(1 << 16):
+                size += len(chunk)
+                if size > MAX_IMAGE_SIZE:
+                    raise ImageDownloadError(f'больше {MAX_IMAGE_SIZE // 2 ** 20} MB')
+                chunks.append(chunk)
+            return Downloaded(b''.join(chunks), response.headers.get('ETag', ''), content_type)
+
+    def _run(self, job):
+        try:
+            return job, self.fetch(job.url, job.etag), None
+        except (requests.RequestException, ImageDownloadError) as error:
+            return job, None, error
+
+    def download(self, jobs):
+        """(задание, Downloaded или None, ошибка) в порядке готовности"""
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='image-download') as executor:
+            running = set()
+            for job in jobs:
+                running.add(executor.submit(self._run, job))
+                if len(running) >= 2 * self.workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    yield from (future.result() for future in done)
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
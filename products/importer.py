@@ -0,0 +1,186 @@
+"""Пакетная загрузка товаров из фида (команда load_products).
+
+Товар фида сопоставляется с существующим по названию, как раньше в
+update_or_create(name=...), но запись идёт партиями: один
+INSERT ... ON CONFLICT (slug) DO UPDATE (bulk_create с update_conflicts) на
+партию, весь импорт - одна транзакция. Slug товаров партии подбираются в
+памяти: существующие товары с этими названиями и занятые slug читаются
+двумя запросами на партию, а не циклом exists() в Product.save, и память
+импорта ограничена размером партии, а не каталога или фида.
+
+У товара хранится хэш полей фида, из которых он загружен
+(Product.source_hash). Хэши партии сравниваются с сохранёнными тем же
+запросом, что ищет товары по названию, и записываются только новые и
+изменившиеся товары: повторный импорт неизменного фида ничего не пишет,
+не трогает поисковый индекс и не сбрасывает кэши каталога. Товары,
+которых нет в фиде, можно снять с продажи одним UPDATE (retire_missing):
+id встреченных товаров копятся во временной таблице, а не в памяти.
+
+Числовые поля и поисковый индекс заполняются той же партией, версия
+каталога увеличивается один раз после фиксации, если что-то изменилось.
+"""
+import hashlib
+import json
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import search
+from .models import Category, Product, product_base_slug
+from .versioning import bump_catalog_version
+
+# Категории фида: slug -> название
+CATEGORY_NAMES = {
+    'vegetables': 'Овощи',
+    'meat': 'Мясо',
+    'dairy': 'Молочные продукты',
+    'fruits': 'Фрукты',
+    'berries': 'Ягоды',
+    'bakery': 'Выпечка',
+    'preserves': 'Заготовки',
+    'sweets': 'Сладости',
+}
+
+FEED_FIELDS = ('name', 'description', 'price', 'weight', 'calories', 'protein', 'fat', 'carbs', 'in_stock')
+UPDATE_FIELDS = (
+    'category', *FEED_FIELDS, 'source_hash', 'updated_at',
+    *(numeric_field for numeric_field, _ in Product.NUMERIC_FIELDS.values()),
+)
+# Временная таблица id товаров, встреченных в фиде (для retire_missing)
+SEEN_TABLE = 'products_import_seen'
+
+
+def ensure_categories():
+    """{slug: Category} для категорий фида, недостающие создаются; второй элемент - созданные"""
+    categories = {category.slug: category for category in Category.objects.filter(slug__in=CATEGORY_NAMES)}
+    created = [
+        Category.objects.create(slug=slug, name=name)
+        for slug, name in CATEGORY_NAMES.items() if slug not in categories
+    ]
+    categories.update((category.slug, category) for category in created)
+    return categories, created
+
+
+def source_hash(data):
+    """Хэш полей записи фида, из которых строится товар"""
+    values = [data['category'], *(str(data[field]) for field in FEED_FIELDS)]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ProductImporter:
+    """Копит товары фида и записывает их партиями по batch_size.
+
+    Использование: add() для каждой записи, затем finish(); всё это внутри
+    одного transaction.atomic().
+    """
+
+    def __init__(self, categories, batch_size=1000, retire_missing=False):
+        self.categories = categories
+        self.batch_size = batch_size
+        self.retire_missing = retire_missing
+        # Название -> (категория, запись, хэш): повтор товара в партии заменяет предыдущий
+        self.pending = {}
+        self.created = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.retired = 0
+        self.skipped = 0
+        self.written = 0
+        if retire_missing:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {SEEN_TABLE}')
+                cursor.execute(f'CREATE TEMP TABLE {SEEN_TABLE} (id INTEGER PRIMARY KEY)')
+
+    def add(self, data):
+        """Добавить запись фида; False - запись пропущена (неизвестная категория)"""
+        category = self.categories.get(data['category'])
+        if category is None:
+            self.skipped += 1
+            return False
+        if data['name'] in self.pending:
+            # Повтор в той же партии отдельной записи не даёт
+            self.unchanged += 1
+        self.pending[data['name']] = (category, data, source_hash(data))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def existing(self, names):
+        """{название: (id, slug, хэш)} существующих товаров"""
+        rows = Product.objects.filter(name__in=names).order_by('-id').values_list('name', 'id', 'slug', 'source_hash')
+        # При повторах названия в базе берётся самый старый товар, как get() до появления дублей
+        return {name: (pk, slug, digest) for name, pk, slug, digest in rows}
+
+    def new_slugs(self, names):
+        """{название: свободный slug} для новых товаров"""
+        base_slugs = {name: product_base_slug(name) for name in names}
+        taken = set(Product.objects.filter(slug__in=set(base_slugs.values())).values_list('slug', flat=True))
+        slugs = {}
+        for name in names:
+            base_slug = slug = base_slugs[name]
+            if slug in taken:
+                # Занятые base-N нужны только при совпадении основы - редкий случай
+                taken.update(Product.objects.filter(slug__startswith=f'{base_slug}-').values_list('slug', flat=True))
+                counter = 1
+                while slug in taken:
+                    slug = f'{base_slug}-{counter}'
+                    counter += 1
+            taken.add(slug)
+            slugs[name] = slug
+        return slugs
+
+    def flush(self):
+        if not self.pending:
+            return
+        existing = self.existing(list(self.pending))
+        slugs = self.new_slugs([name for name in self.pending if name not in existing])
+        products = []
+        seen_ids = []
+        for name, (category, data, digest) in self.pending.items():
+            if name in existing:
+                pk, slug, stored_digest = existing[name]
+                seen_ids.append(pk)
+                if stored_digest == digest:
+                    self.unchanged += 1
+                    continue
+                self.changed += 1
+            else:
+                slug = slugs[name]
+                self.created += 1
+            product = Product(
+                category=category, slug=slug, source_hash=digest, **{field: data[field] for field in FEED_FIELDS}
+            )
+            product.update_numeric_fields()
+            products.append(product)
+        self.pending = {}
+
+        if products:
+            products = Product.objects.bulk_create(
+                products, update_conflicts=True, unique_fields=['slug'], update_fields=list(UPDATE_FIELDS),
+            )
+            written_ids = [product.pk for product in products]
+            if search.search_available():
+                search.index_products((product.pk, product.name, product.description) for product in products)
+            # У товаров с учётом остатка наличие следует из остатка, а не из фида
+            Product.objects.filter(pk__in=written_ids, stock=0, in_stock=True).update(in_stock=False)
+            Product.objects.filter(pk__in=written_ids, stock__gt=0, in_stock=False).update(in_stock=True)
+            seen_ids += written_ids
+            self.written += len(products)
+        if self.retire_missing:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {SEEN_TABLE} (id) VALUES (%s) ON CONFLICT DO NOTHING', [(pk,) for pk in seen_ids]
+                )
+
+    def finish(self):
+        self.flush()
+        if self.retire_missing:
+            # Хэш сбрасывается: товар, вернувшийся в фид без изменений, снова будет записан
+            self.retired = Product.objects.filter(in_stock=True).exclude(
+                pk__in=RawSQL(f'SELECT id FROM {SEEN_TABLE}', [])
+            ).update(in_stock=False, source_hash='', updated_at=timezone.now())
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {SEEN_TABLE}')
+        if self.written or self.retired:
+            transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+from products.versioning import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = 'Fill numeric weight/nutrition columns from their text fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        text_fields = list(Product.NUMERIC_FIELDS)
+        numeric_fields = [numeric for numeric, parser in Product.NUMERIC_FIELDS.values()]
+
+        last_id = 0
+        processed = 0
+        updated = 0
+        while True:
+            # Пагинация по первичному ключу: каждая партия - короткая транзакция
+            batch = list(
+                Product.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', *text_fields, *numeric_fields)[:batch_size]
+            )
+            if not batch:
+                break
+            changed = [product for product in batch if product.update_numeric_fields()]
+            if changed:
+                with transaction.atomic():
+                    Product.objects.bulk_update(changed, numeric_fields, batch_size=batch_size)
+            last_id = batch[-1].id
+            processed += len(batch)
+            updated += len(changed)
+
+        if updated:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} products, updated {updated}'))
@@ -0,0 +1,84 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products import renditions
+from products.models import ImageRendition
+from products.versioning import bump_renditions_version
+
+
+class Command(BaseCommand):
+    help = 'Build missing image renditions (thumbnails, WebP/JPEG srcset) for existing media'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Concurrent rendering threads')
+        parser.add_argument('--batch-size', type=int, default=200, help='Renditions per state update')
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry renditions that failed before')
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild all renditions, including ready ones')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        queued = self.queue_missing(options['batch_size'])
+
+        statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+        rows = ImageRendition.objects.all() if options['rebuild'] else ImageRendition.objects.filter(status__in=statuses)
+        built = failed = 0
+        last_id = 0
+        with ThreadPoolExecutor(options['workers'], thread_name_prefix='rendition') as executor:
+            while True:
+                # Пагинация по первичному ключу: обработанные строки не попадают в следующую партию
+                batch = list(rows.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                now = timezone.now()
+                results = executor.map(lambda row: renditions.build(row.source, row.preset), batch)
+                for row, (widths, error) in zip(batch, results):
+                    row.status = 'failed' if widths is None else 'ready'
+                    row.widths = ','.join(map(str, widths or ()))
+                    row.error = error
+                    row.updated_at = now
+                    if widths is None:
+                        failed += 1
+                        if options['verbosity'] > 0:
+                            self.stdout.write(self.style.WARNING(f'Failed {row.source} ({row.preset}): {error}'))
+                    else:
+                        built += 1
+                with transaction.atomic():
+                    ImageRendition.objects.bulk_update(batch, ['status', 'widths', 'error', 'updated_at'])
+                connection.queries_log.clear()
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {built + failed} renditions ({time.monotonic() - start:.1f}s)')
+
+        if built:
+            bump_renditions_version()
+        elapsed = time.monotonic() - start
+        if options['verbosity'] > 0:
+            self.stdout.write(self.style.SUCCESS(
+                f'Renditions: {queued} queued, {built} built, {failed} failed in {elapsed:.1f}s '
+                f'({built / elapsed if elapsed else 0:.1f}/s)'
+            ))
+
+    def queue_missing(self, batch_size):
+        """Строки pending для изображений без строк копий; возвращает число созданных"""
+        before = ImageRendition.objects.count()
+        for (app_label, model_name, field_name), presets in renditions.FIELD_PRESETS.items():
+            model = apps.get_model(app_label, model_name)
+            attname = model._meta.get_field(field_name).attname
+            sources = (
+                model._default_manager.filter(**{f'{attname}__gt': ''}).order_by()
+                .values_list(attname, flat=True).distinct().iterator(chunk_size=batch_size)
+            )
+            pairs = []
+            for source in sources:
+                pairs.extend(ImageRendition(source=source, preset=preset) for preset in presets)
+                if len(pairs) >= batch_size:
+                    ImageRendition.objects.bulk_create(pairs, ignore_conflicts=True)
+                    pairs = []
+            ImageRendition.objects.bulk_create(pairs, ignore_conflicts=True)
+        return ImageRendition.objects.count() - before
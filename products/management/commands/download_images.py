@@ -0,0 +1,145 @@
+import os
+import time
+from urllib.parse import urlparse
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from products.feed import FeedError, FeedReader
+from products import renditions
+from products.images import CONTENT_EXTENSIONS, ImageDownloader, ImageJob
+from products.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Download all image_urls of a products feed into product galleries, concurrently; '
+        'already downloaded URLs are skipped, so an interrupted run can simply be restarted'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('json_file', nargs='?', default='products.json', help='Products feed (JSON or JSON Lines)')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent downloads')
+        parser.add_argument('--retries', type=int, default=3, help='Retries per image on connection errors, 429 and 5xx')
+        parser.add_argument('--backoff', type=float, default=0.5, help='Retry backoff factor, seconds')
+        parser.add_argument('--timeout', type=float, default=10, help='Connect/read timeout, seconds')
+        parser.add_argument('--batch-size', type=int, default=500, help='Feed records per product lookup')
+        parser.add_argument(
+            '--revalidate', action='store_true',
+            help='Re-check downloaded images with If-None-Match and replace the changed ones',
+        )
+
+    def handle(self, *args, **options):
+        json_file = options['json_file']
+        self.verbosity = options['verbosity']
+        try:
+            reader = FeedReader(json_file)
+        except FileNotFoundError:
+            self.stdout.write(self.style.ERROR(f'File {json_file} not found'))
+            return
+
+        self.skipped = 0
+        self.missing = 0
+        downloaded = unchanged = failed = 0
+        start = time.monotonic()
+        downloader = ImageDownloader(options['workers'], options['retries'], options['backoff'], options['timeout'])
+        try:
+            for job, result, error in downloader.download(self.jobs(reader, options)):
+                if error is not None:
+                    failed += 1
+                    if self.verbosity > 0:
+                        self.stdout.write(self.style.WARNING(f'Failed {job.url}: {error}'))
+                elif result.content is None:
+                    unchanged += 1
+                else:
+                    self.save(job, result)
+                    downloaded += 1
+                    if self.verbosity > 1:
+                        self.stdout.write(f'  {job.url}')
+        except FeedError as error:
+            # Загруженное до ошибки сохранено: повторный запуск продолжит с того же места
+            self.stdout.write(self.style.ERROR(f'Invalid JSON format in {json_file}: {error}'))
+            return
+        finally:
+            downloader.close()
+
+        elapsed = time.monotonic() - start
+        if self.verbosity > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Images: {downloaded} downloaded, {unchanged} unchanged, {self.skipped} already downloaded, '
+                    f'{failed} failed, {self.missing} products not found in {elapsed:.1f}s '
+                    f'({downloaded / elapsed if elapsed else 0:.1f} images/s)'
+                )
+            )
+
+    def jobs(self, reader, options):
+        """Задания на загрузку по фиду; товары и загруженные URL читаются партиями"""
+        batch = {}
+        for line, data, error in reader:
+            valid = error is None and isinstance(data, dict) and isinstance(data.get('name'), str)
+            urls = (data.get('image_urls') if valid else None) or []
+            if not valid or not isinstance(urls, list):
+                if self.verbosity > 0:
+                    self.stdout.write(self.style.WARNING(
+                        f'Line {line}: skipping record - {error or "нет названия товара или списка image_urls"}'
+                    ))
+                continue
+            batch[data['name']] = list(dict.fromkeys(url for url in urls if isinstance(url, str) and url))
+            if len(batch) >= options['batch_size']:
+                yield from self.batch_jobs(batch, options['revalidate'])
+                batch = {}
+        yield from self.batch_jobs(batch, options['revalidate'])
+
+    def batch_jobs(self, batch, revalidate):
+        # При DEBUG журнал запросов рос бы вместе с фидом
+        connection.queries_log.clear()
+        rows = Product.objects.filter(name__in=batch).order_by('-id').values_list('name', 'id', 'slug')
+        # При повторах названия - самый старый товар, как в load_products
+        products = {name: (pk, slug) for name, pk, slug in rows}
+        stored = {
+            (product_id, url): etag
+            for product_id, url, etag in ProductImage.objects.filter(
+                product_id__in=[pk for pk, _ in products.values()]
+            ).values_list('product_id', 'source_url', 'etag')
+        }
+        for name, urls in batch.items():
+            if name not in products:
+                self.missing += 1
+                continue
+            pk, slug = products[name]
+            for position, url in enumerate(urls):
+                etag = stored.get((pk, url))
+                if etag is None or revalidate:
+                    # Без сохранённого ETag проверка - это загрузка заново
+                    yield ImageJob(pk, slug, position, url, etag or '')
+                else:
+                    self.skipped += 1
+
+    def save(self, job, result):
+        extension = CONTENT_EXTENSIONS.get(result.content_type) or os.path.splitext(urlparse(job.url).path)[1].lower()
+        image = (
+            ProductImage.objects.filter(product_id=job.product_id, source_url=job.url).first()
+            or ProductImage(product_id=job.product_id, source_url=job.url)
+        )
+        old_name = image.image.name
+        image.position = job.position
+        image.etag = result.etag
+        image.image.save(f'{job.slug}-{job.position + 1}{extension or ".jpg"}', ContentFile(result.content), save=False)
+
+        # Основное изображение товара: первое из галереи, если своего нет
+        cover = Q(image='') | Q(image__isnull=True)
+        if old_name:
+            cover |= Q(image=old_name)
+        if job.position == 0:
+            # Первое изображение фида заменяет загруженные раньше него остальные
+            cover |= Q(image__in=ProductImage.objects.filter(product_id=job.product_id).values('image'))
+        # Прежний файл не удаляется: хранилище общее для всех строк (ecoshop/storage.py), его уберёт gc_media
+        with transaction.atomic():
+            if Product.objects.filter(cover, pk=job.product_id).update(image=image.image.name, updated_at=timezone.now()):
+                # update() сигналов не шлёт; копии галереи строятся по post_save ProductImage
+                renditions.schedule_image(Product, 'image', image.image.name)
+            image.save()
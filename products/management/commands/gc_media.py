@@ -0,0 +1,101 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from ecoshop.storage import CONTENT_DIR
+from products import renditions
+from products.models import ImageRendition
+
+
+def file_fields():
+    """(модель, поле) всех файловых полей проекта"""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def referenced_names():
+    """Имена файлов, на которые ссылается хотя бы одна строка"""
+    names = set()
+    for model, field in file_fields():
+        # Без сортировки модели: имена читаются из индекса по полю, а не из таблицы
+        names.update(
+            model._default_manager.filter(**{f'{field.attname}__gt': ''}).order_by()
+            .values_list(field.attname, flat=True).iterator(chunk_size=10_000)
+        )
+    return names
+
+
+def stored_names(roots):
+    """Имена файлов хранилища в каталогах roots"""
+    names = set()
+    for root in roots:
+        for directory, _, files in os.walk(default_storage.path(root)):
+            relative = os.path.relpath(directory, default_storage.location).replace(os.sep, '/')
+            names.update(f'{relative}/{name}' for name in files)
+    return names
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete media files that no row references: content-addressed files, legacy upload_to directories '
+        'and renditions of images that are gone'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Keep unreferenced files younger than this many seconds (uploads whose row is not saved yet)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        roots = {CONTENT_DIR, renditions.RENDITIONS_DIR} | {
+            field.upload_to.split('/')[0] for _, field in file_fields() if isinstance(field.upload_to, str) and field.upload_to
+        }
+        stored = stored_names(sorted(roots))
+        referenced = referenced_names()
+        # Копии нужны, пока нужен источник; строки копий удалённых изображений удаляются
+        stale_renditions = []
+        for pk, source, preset, widths in ImageRendition.objects.values_list('id', 'source', 'preset', 'widths').iterator():
+            if source in referenced:
+                referenced.update(renditions.rendition_names(source, preset, renditions.parse_widths(widths)))
+            else:
+                stale_renditions.append(pk)
+        cutoff = time.time() - options['min_age']
+
+        deleted = kept = size = 0
+        for name in sorted(stored - referenced):
+            path = default_storage.path(name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    kept += 1
+                    continue
+                if not options['dry_run']:
+                    os.unlink(path)
+            except FileNotFoundError:
+                continue
+            deleted += 1
+            size += stat.st_size
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {name}')
+
+        if not options['dry_run']:
+            for offset in range(0, len(stale_renditions), 500):
+                ImageRendition.objects.filter(pk__in=stale_renditions[offset:offset + 500]).delete()
+
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {deleted} unreferenced files ({size / 2 ** 20:.1f} MB) of {len(stored)}; '
+            f'{len(referenced)} referenced, {kept} newer than --min-age kept, '
+            f'{len(stale_renditions)} stale rendition rows, in {time.monotonic() - start:.1f}s'
+        ))
@@ -1,92 +1,93 @@
-import json
+import time
+
 from django.core.management.base import BaseCommand
-from products.models import Category, Product
+from django.db import connection, transaction
+
+from products.feed import FeedError, FeedReader, InvalidRecord, clean_record
+from products.importer import ProductImporter, ensure_categories
+
 
 class Command(BaseCommand):
-    help = 'Load products from JSON file'
+    help = 'Load products from a JSON array or JSON Lines file, streaming (use -v 0 for quiet mode)'
 
     def add_arguments(self, parser):
-        parser.add_argument('json_file', type=str, help='Path to the JSON file with products data')
+        parser.add_argument('json_file', type=str, help='Path to the JSON or JSON Lines file with products data')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per INSERT ... ON CONFLICT batch')
+        parser.add_argument('--progress', action='store_true', help='Show a progress bar instead of per-batch lines')
+        parser.add_argument(
+            '--retire-missing', action='store_true', help='Mark products absent from the feed as out of stock',
+        )
 
     def handle(self, *args, **options):
         json_file = options['json_file']
-        
+        verbosity = options['verbosity']
+
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                products_data = json.load(f)
+            reader = FeedReader(json_file)
         except FileNotFoundError:
             self.stdout.write(self.style.ERROR(f'File {json_file} not found'))
             return
-        except json.JSONDecodeError:
-            self.stdout.write(self.style.ERROR(f'Invalid JSON format in {json_file}'))
-            return
-
-        # Category mapping from English to Russian
-        category_mapping = {
-            'vegetables': 'Овощи',
-            'meat': 'Мясо',
-            'dairy': 'Молочные продукты',
-            'fruits': 'Фрукты',
-            'berries': 'Ягоды',
-            'bakery': 'Выпечка',
-            'preserves': 'Заготовки',
-            'sweets': 'Сладости'
-        }
 
-        # Create categories
-        categories = {}
-        for category_slug, category_name in category_mapping.items():
-            category, created = Category.objects.get_or_create(
-                slug=category_slug,
-                defaults={'name': category_name}
-            )
-            categories[category_slug] = category
-            if created:
-                self.stdout.write(f'Created category: {category_name}')
-            else:
-                self.stdout.write(f'Category already exists: {category_name}')
-
-        # Create products
-        products_created = 0
-        products_updated = 0
-
-        for product_data in products_data:
-            category_slug = product_data['category']
-            category = categories.get(category_slug)
-            
-            if not category:
-                self.stdout.write(self.style.WARNING(f'Skipping product "{product_data["name"]}" - unknown category "{category_slug}"'))
-                continue
+        start = time.monotonic()
+        records = 0
+        invalid = 0
+        try:
+            with transaction.atomic():
+                categories, created_categories = ensure_categories()
+                if verbosity > 0:
+                    for category in created_categories:
+                        self.stdout.write(f'Created category: {category.name}')
 
-            # Prepare product data
-            product_fields = {
-                'category': category,
-                'name': product_data['name'],
-                'description': product_data['description'],
-                'price': product_data['price'],
-                'weight': product_data['weight'],
-                'calories': product_data['calories'],
-                'protein': product_data['protein'],
-                'fat': product_data['fat'],
-                'carbs': product_data['carbs'],
-                'in_stock': product_data['in_stock']
-            }
+                importer = ProductImporter(categories, options['batch_size'], options['retire_missing'])
+                for line, data, error in reader:
+                    records += 1
+                    try:
+                        if error is not None:
+                            raise error
+                        data = clean_record(data)
+                        if not importer.add(data):
+                            raise InvalidRecord(f'unknown category "{data["category"]}"')
+                    except InvalidRecord as error:
+                        invalid += 1
+                        if verbosity > 0:
+                            self.stdout.write(self.style.WARNING(f'Line {line}: skipping record - {error}'))
+                        continue
+                    if not importer.pending:
+                        # При DEBUG Django хранит последние запросы, а INSERT партии
+                        # велик: журнал рос бы вместе с фидом
+                        connection.queries_log.clear()
+                        self.report_progress(options, reader, start)
+                importer.finish()
+        except FeedError as error:
+            # Оборванный или битый массив: транзакция откатана, ничего не записано
+            self.stdout.write(self.style.ERROR(f'Invalid JSON format in {json_file}: {error}'))
+            return
 
-            # Create or update product
-            product, created = Product.objects.update_or_create(
-                name=product_data['name'],
-                defaults=product_fields
+        elapsed = time.monotonic() - start
+        if options['progress'] and verbosity > 0:
+            self.report_progress(options, reader, start)
+            self.stdout.write('')
+        if verbosity > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully loaded products: {importer.created} created, {importer.changed} changed, '
+                    f'{importer.unchanged} unchanged, {importer.retired} retired, {invalid} skipped in {elapsed:.1f}s '
+                    f'({records / elapsed if elapsed else 0:.0f} records/s, '
+                    f'{reader.bytes_read / 2 ** 20 / elapsed if elapsed else 0:.1f} MB/s)'
+                )
             )
 
-            if created:
-                products_created += 1
-                self.stdout.write(f'Created product: {product.name}')
-            else:
-                products_updated += 1
-                self.stdout.write(f'Updated product: {product.name}')
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Successfully loaded products: {products_created} created, {products_updated} updated'
+    def report_progress(self, options, reader, start):
+        if options['verbosity'] == 0:
+            return
+        elapsed = time.monotonic() - start
+        done = min(reader.bytes_read / reader.size, 1) if reader.size else 1
+        if options['progress']:
+            width = 30
+            filled = int(width * done)
+            self.stdout.write(
+                f'\r[{"#" * filled}{"." * (width - filled)}] {done:4.0%} ({elapsed:.1f}s)', ending=''
             )
-        )
\ No newline at end of file
+            self.stdout.flush()
+        elif options['verbosity'] > 1:
+            self.stdout.write(f'  {reader.bytes_read / 2 ** 20:.1f} MB read ({elapsed:.1f}s)')
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT batch')
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            raise CommandError('Full-text search requires the SQLite backend with FTS5')
+
+        start = time.monotonic()
+        total = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {total} products in {time.monotonic() - start:.1f}s')
+        )
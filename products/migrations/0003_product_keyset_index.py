@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_supplier_product_supplier'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['name', 'id'], name='product_instock_name_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+import re
+
+from django.db import migrations
+
+# Копия таблицы и построения термов products.search на момент миграции: миграция
+# не импортирует живой модуль (а через него products.models). Если построение
+# термов меняется, индекс перестраивает rebuild_search_index.
+SEARCH_TABLE = 'products_product_search'
+MIN_STEM_LENGTH = 3
+MIN_DIMINUTIVE_STEM_LENGTH = 5
+BATCH_SIZE = 2000
+
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+TRANSLIT_TABLE = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+RUSSIAN_ENDINGS = sorted({
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ими', 'ыми', 'его', 'ого',
+    'ему', 'ому', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ый',
+    'ям', 'ем', 'ам', 'ом', 'им', 'ым', 'ах', 'ях', 'их', 'ых', 'ию', 'ью',
+    'ия', 'ья', 'ая', 'яя', 'ое', 'ее', 'ые', 'ую', 'юю', 'ою', 'ею',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+}, key=len, reverse=True)
+
+
+def stem(token):
+    for ending in RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+            token = token[:-len(ending)]
+            break
+    if token.endswith('к') and len(token) - 1 >= MIN_DIMINUTIVE_STEM_LENGTH:
+        token = token[:-1]
+    return token
+
+
+def index_terms(text):
+    terms = []
+    for token in TOKEN_RE.findall(text.lower().replace('ё', 'е')):
+        if CYRILLIC_RE.search(token):
+            base = stem(token)
+            terms.extend((base, base.translate(TRANSLIT_TABLE)))
+        else:
+            terms.append(token)
+    return ' '.join(terms)
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(name, description)'
+    )
+    Product = apps.get_model('products', 'Product')
+    rows = Product.objects.using(schema_editor.connection.alias).values_list('id', 'name', 'description')
+    batch = []
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        for product_id, name, description in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append((product_id, index_terms(name), index_terms(description)))
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', batch)
+                batch = []
+        if batch:
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', batch)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='calories_kcal',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Калории, ккал'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='carbs_g',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Углеводы, г'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='fat_g',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Жиры, г'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='protein_g',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Белки, г'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='weight_grams',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Вес, г'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['weight_grams', 'id'], name='product_instock_weight_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['calories_kcal', 'id'], name='product_instock_kcal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['protein_g', 'id'], name='product_instock_protein_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['fat_g', 'id'], name='product_instock_fat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['carbs_g', 'id'], name='product_instock_carbs_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_numeric_nutrition'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['category', 'name', 'id'], name='product_instock_cat_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['supplier', 'name', 'id'], name='product_instock_sup_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['category', 'supplier', 'name', 'id'], name='product_instock_cat_sup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('in_stock', True)), fields=['price', 'id'], name='product_instock_price_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Обновлено'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Обновлено'),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Обновлено'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+from products import geo
+
+
+def fill_geohash(apps, schema_editor):
+    Supplier = apps.get_model('products', 'Supplier')
+    suppliers = list(Supplier.objects.only('id', 'latitude', 'longitude'))
+    for supplier in suppliers:
+        supplier.geohash = geo.encode(float(supplier.latitude), float(supplier.longitude))
+    Supplier.objects.bulk_update(suppliers, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, verbose_name='Geohash'),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['geohash', 'latitude', 'longitude', 'name'], name='supplier_active_geohash_idx'),
+        ),
+    ]
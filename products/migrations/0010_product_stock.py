@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_supplier_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Остаток'),
+        ),
+    ]
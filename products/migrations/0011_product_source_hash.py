@@ -0,0 +1,22 @@
+# Generated by Django 5.2.9 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40, verbose_name='Хэш записи фида'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'slug', 'source_hash'], name='product_name_source_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 16:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(max_length=255, upload_to='products/gallery/', verbose_name='Изображение')),
+                ('source_url', models.URLField(max_length=500, verbose_name='Адрес источника')),
+                ('etag', models.CharField(blank=True, editable=False, max_length=200, verbose_name='ETag')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('downloaded_at', models.DateTimeField(auto_now=True, verbose_name='Загружено')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Изображение товара',
+                'verbose_name_plural': 'Изображения товаров',
+                'ordering': ['product', 'position', 'id'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'source_url'), name='product_image_source_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['image'], name='category_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['image'], name='product_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['image'], name='gallery_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['image'], name='supplier_image_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_media_file_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходный файл')),
+                ('preset', models.CharField(max_length=20, verbose_name='Пресет')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('ready', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Состояние')),
+                ('widths', models.CharField(blank=True, max_length=50, verbose_name='Ширины')),
+                ('error', models.CharField(blank=True, max_length=200, verbose_name='Ошибка')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Копия изображения',
+                'verbose_name_plural': 'Копии изображений',
+                'indexes': [models.Index(condition=models.Q(('status', 'ready'), _negated=True), fields=['status'], name='rendition_unfinished_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'preset'), name='rendition_source_preset_uniq')],
+            },
+        ),
+    ]
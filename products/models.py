@@ -3,6 +3,46 @@ from django.urls import reverse
 from django.utils.text import slugify
 import re
 
+from . import geo
+from .units import parse_energy, parse_nutrient, parse_weight
+
+# Транслитерация для русских символов (используется для slug и поиска)
+TRANSLIT_MAP = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    ' ': '-', '"': '', "'": ''
+}
+
+
+# Один проход str.translate вместо replace по каждой букве
+TRANSLIT_TABLE = str.maketrans(TRANSLIT_MAP)
+
+
+def transliterate(text):
+    return text.translate(TRANSLIT_TABLE)
+
+
+def product_base_slug(name):
+    """Slug товара из названия без проверки уникальности"""
+    # Преобразуем название в транслит
+    slug = transliterate(name.lower())
+    
+    # Удаляем специальные символы и оставляем только буквы, цифры и дефисы
+    slug = re.sub(r'[^a-z0-9\-]', '', slug)
+    
+    # Убираем повторяющиеся дефисы
+    slug = re.sub(r'-+', '-', slug)
+    
+    # Убираем дефисы в начале и конце
+    slug = slug.strip('-')
+    
+    # Если slug пустой, используем 'product'
+    return slug or 'product'
+
+
 class Supplier(models.Model):
     """Модель поставщика с геолокацией"""
     name = models.CharField(max_length=200, verbose_name="Название")
@@ -15,15 +55,35 @@ class Supplier(models.Model):
     email = models.EmailField(blank=True, verbose_name="Email")
     website = models.URLField(blank=True, verbose_name="Сайт")
     is_active = models.BooleanField(default=True, verbose_name="Активен")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+    # Вычисляется из координат при сохранении, см. products/geo.py
+    geohash = models.CharField(max_length=12, blank=True, editable=False, verbose_name="Geohash")
 
     class Meta:
         verbose_name = "Поставщик"
         verbose_name_plural = "Поставщики"
         ordering = ['name']
+        indexes = [
+            # Видимая область карты и кластеры: диапазоны по geohash без обращения к таблице
+            models.Index(
+                fields=['geohash', 'latitude', 'longitude', 'name'],
+                name='supplier_active_geohash_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # Имена файлов для gc_media
+            models.Index(fields=['image'], name='supplier_image_idx', condition=models.Q(image__gt='')),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.geohash = geo.encode(float(self.latitude), float(self.longitude))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'geohash' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['geohash']
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('products:supplier_map')
 
@@ -32,31 +92,24 @@ class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="URL")
     image = models.ImageField(upload_to='categories/', blank=True, null=True, verbose_name="Изображение")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
 
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
         ordering = ['name']
+        indexes = [
+            # Имена файлов для gc_media
+            models.Index(fields=['image'], name='category_image_idx', condition=models.Q(image__gt='')),
+        ]
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            # Транслитерация для русских символов
-            translit_map = {
-                'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-                'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-                'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-                'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
-                'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
-                ' ': '-', '"': '', "'": ''
-            }
-            
             # Преобразуем название в транслит
-            slug = self.name.lower()
-            for rus, eng in translit_map.items():
-                slug = slug.replace(rus, eng)
+            slug = transliterate(self.name.lower())
             
             # Удаляем специальные символы и оставляем только буквы, цифры и дефисы
             slug = re.sub(r'[^a-z0-9\-]', '', slug)
@@ -85,11 +138,54 @@ class Product(models.Model):
     fat = models.CharField(max_length=50, verbose_name="Жиры")
     carbs = models.CharField(max_length=50, verbose_name="Углеводы")
     in_stock = models.BooleanField(default=True, verbose_name="В наличии")
+    # Остаток на складе; NULL - остаток не ведётся, наличие задаётся in_stock вручную.
+    # Списывается условным UPDATE при оформлении заказа (orders.stock)
+    stock = models.PositiveIntegerField(null=True, blank=True, verbose_name="Остаток")
+    # Хэш записи фида, из которой товар загружен: load_products пропускает неизменённые
+    source_hash = models.CharField(max_length=40, blank=True, editable=False, verbose_name="Хэш записи фида")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Обновлено")
+
+    # Числовые значения, разобранные из текстовых полей выше (для фильтров и сортировки)
+    weight_grams = models.FloatField(null=True, blank=True, editable=False, verbose_name="Вес, г")
+    calories_kcal = models.FloatField(null=True, blank=True, editable=False, verbose_name="Калории, ккал")
+    protein_g = models.FloatField(null=True, blank=True, editable=False, verbose_name="Белки, г")
+    fat_g = models.FloatField(null=True, blank=True, editable=False, verbose_name="Жиры, г")
+    carbs_g = models.FloatField(null=True, blank=True, editable=False, verbose_name="Углеводы, г")
+
+    # Текстовое поле -> (числовое поле, парсер)
+    NUMERIC_FIELDS = {
+        'weight': ('weight_grams', parse_weight),
+        'calories': ('calories_kcal', parse_energy),
+        'protein': ('protein_g', parse_nutrient),
+        'fat': ('fat_g', parse_nutrient),
+        'carbs': ('carbs_g', parse_nutrient),
+    }
 
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ['name']
+        indexes = [
+            # Сопоставление записей фида с товарами по названию (products.importer);
+            # slug и хэш в индексе - сравнение обходится без чтения таблицы
+            models.Index(fields=['name', 'slug', 'source_hash'], name='product_name_source_idx'),
+            # Ключ keyset-пагинации каталога: WHERE in_stock ORDER BY name, id
+            models.Index(fields=['name', 'id'], condition=models.Q(in_stock=True), name='product_instock_name_idx'),
+            # Фильтры каталога по категории и/или поставщику с сортировкой по названию
+            models.Index(fields=['category', 'name', 'id'], condition=models.Q(in_stock=True), name='product_instock_cat_name_idx'),
+            models.Index(fields=['supplier', 'name', 'id'], condition=models.Q(in_stock=True), name='product_instock_sup_name_idx'),
+            models.Index(fields=['category', 'supplier', 'name', 'id'], condition=models.Q(in_stock=True), name='product_instock_cat_sup_idx'),
+            # Сортировка по цене
+            models.Index(fields=['price', 'id'], condition=models.Q(in_stock=True), name='product_instock_price_idx'),
+            # Фильтры по диапазону и сортировка по пищевой ценности
+            models.Index(fields=['weight_grams', 'id'], condition=models.Q(in_stock=True), name='product_instock_weight_idx'),
+            models.Index(fields=['calories_kcal', 'id'], condition=models.Q(in_stock=True), name='product_instock_kcal_idx'),
+            models.Index(fields=['protein_g', 'id'], condition=models.Q(in_stock=True), name='product_instock_protein_idx'),
+            models.Index(fields=['fat_g', 'id'], condition=models.Q(in_stock=True), name='product_instock_fat_idx'),
+            models.Index(fields=['carbs_g', 'id'], condition=models.Q(in_stock=True), name='product_instock_carbs_idx'),
+            # Имена файлов для gc_media: чтение только индекса, без широкой таблицы
+            models.Index(fields=['image'], condition=models.Q(image__gt=''), name='product_image_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -100,35 +196,27 @@ class Product(models.Model):
     def formatted_price(self):
         return f"{self.price} ₽"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Поставщик на момент загрузки: signals.py сравнивает его при сохранении
+        if 'supplier_id' in instance.__dict__:
+            instance._loaded_supplier_id = instance.supplier_id
+        return instance
+
+    def update_numeric_fields(self):
+        """Заполняет числовые поля из текстовых, возвращает список изменённых"""
+        changed = []
+        for text_field, (numeric_field, parser) in self.NUMERIC_FIELDS.items():
+            value = parser(getattr(self, text_field))
+            if getattr(self, numeric_field) != value:
+                setattr(self, numeric_field, value)
+                changed.append(numeric_field)
+        return changed
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            # Транслитерация для русских символов
-            translit_map = {
-                'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-                'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-                'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-                'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
-                'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
-                ' ': '-', '"': '', "'": ''
-            }
-            
-            # Преобразуем название в транслит
-            slug = self.name.lower()
-            for rus, eng in translit_map.items():
-                slug = slug.replace(rus, eng)
-            
-            # Удаляем специальные символы и оставляем только буквы, цифры и дефисы
-            slug = re.sub(r'[^a-z0-9\-]', '', slug)
-            
-            # Убираем повторяющиеся дефисы
-            slug = re.sub(r'-+', '-', slug)
-            
-            # Убираем дефисы в начале и конце
-            slug = slug.strip('-')
-            
-            # Если slug пустой, используем 'product'
-            if not slug:
-                slug = 'product'
+            slug = product_base_slug(self.name)
             
             # Проверяем уникальность и добавляем счетчик при необходимости
             base_slug = slug
@@ -138,4 +226,94 @@ class Product(models.Model):
                 counter += 1
             
             self.slug = slug
-        super().save(*args, **kwargs)
\ No newline at end of file
+        changed = self.update_numeric_fields()
+        if self.stock is not None and self.in_stock != (self.stock > 0):
+            # При учёте остатков наличие следует из остатка
+            self.in_stock = self.stock > 0
+            changed.append('in_stock')
+        if kwargs.get('update_fields') is not None and changed:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | set(changed)
+        super().save(*args, **kwargs)
+
+
+class ProductImage(models.Model):
+    """Изображение галереи товара, загруженное из image_urls фида (команда download_images)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False, related_name='images', verbose_name="Товар")
+    image = models.ImageField(upload_to='products/gallery/', max_length=255, verbose_name="Изображение")
+    source_url = models.URLField(max_length=500, verbose_name="Адрес источника")
+    # ETag ответа: повторная проверка идёт условным запросом (If-None-Match)
+    etag = models.CharField(max_length=200, blank=True, editable=False, verbose_name="ETag")
+    position = models.PositiveSmallIntegerField(default=0, verbose_name="Порядок")
+    downloaded_at = models.DateTimeField(auto_now=True, verbose_name="Загружено")
+
+    class Meta:
+        verbose_name = "Изображение товара"
+        verbose_name_plural = "Изображения товаров"
+        ordering = ['product', 'position', 'id']
+        constraints = [
+            # Заодно индекс для выборки галереи товара и проверки загруженных URL
+            models.UniqueConstraint(fields=['product', 'source_url'], name='product_image_source_uniq'),
+        ]
+        indexes = [
+            # Имена файлов для gc_media
+            models.Index(fields=['image'], name='gallery_image_idx'),
+        ]
+
+    def __str__(self):
+        return self.source_url
+
+
+class ImageRendition(models.Model):
+    """Уменьшенные копии изображения по пресету (products/renditions.py).
+
+    Одна строка на файл-источник и пресет; шаблоны подставляют копии только
+    в состоянии ready, до этого - оригинал.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('ready', 'Готово'),
+        ('failed', 'Ошибка'),
+    )
+
+    source = models.CharField(max_length=255, verbose_name="Исходный файл")
+    preset = models.CharField(max_length=20, verbose_name="Пресет")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="Состояние")
+    # Ширины готовых копий через запятую: у маленьких оригиналов их меньше, чем в пресете
+    widths = models.CharField(max_length=50, blank=True, verbose_name="Ширины")
+    error = models.CharField(max_length=200, blank=True, verbose_name="Ошибка")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Копия изображения"
+        verbose_name_plural = "Копии изображений"
+        constraints = [
+            # Заодно индекс для выборки копий изображений страницы
+            models.UniqueConstraint(fields=['source', 'preset'], name='rendition_source_preset_uniq'),
+        ]
+        indexes = [
+            # Незавершённые копии для build_renditions
+            models.Index(fields=['status'], condition=~models.Q(status='ready'), name='rendition_unfinished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} ({self.preset})"
+
+
+class ProductRecommendation(models.Model):
+    """Товары, которые часто покупают вместе (заполняется командой build_recommendations)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False, related_name='recommendations', verbose_name="Товар")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Рекомендуемый товар")
+    rank = models.PositiveSmallIntegerField(verbose_name="Позиция")
+    score = models.FloatField(verbose_name="Сила связи")
+
+    class Meta:
+        verbose_name = "Рекомендация"
+        verbose_name_plural = "Рекомендации"
+        ordering = ['product', 'rank']
+        constraints = [
+            # Заодно индекс для выборки рекомендаций товара по порядку
+            models.UniqueConstraint(fields=['product', 'rank'], name='recommendation_product_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id}"
@@ -0,0 +1,169 @@
+"""Ближайшие поставщики: k-NN по формуле гаверсинусов над массивами в памяти.
+
+Координаты активных поставщиков хранятся в непрерывных массивах float64,
+отсортированных по широте, и перестраиваются при смене версии поставщиков
+(сохранение поставщика или смена поставщика у товара, см. products.versioning).
+Версия лежит в общем кэше, так что индекс обновляется в каждом воркере, где
+бы поставщик ни изменился; каждый запрос читает только её. К базе запрос не
+обращается: полоса широт вокруг точки выбирается через searchsorted, в ней
+остаются поставщики из окна долгот (его ширина растёт как 1/cos широты,
+окно переходит через 180-й меридиан, а у полюса охватывает все долготы),
+расстояния до них считаются векторно. Радиус растёт, пока внутри него не
+окажется k поставщиков.
+"""
+import bisect
+import heapq
+import math
+import threading
+
+from django.db.models import Count
+
+from .models import Supplier
+from .versioning import get_suppliers_version
+
+try:
+    import numpy as np
+except ImportError:  # без numpy - тот же алгоритм поштучно
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+# Начальный радиус поиска; при нехватке поставщиков удваивается
+INITIAL_RADIUS_KM = 50.0
+MAX_K = 50
+
+_index = None
+_build_lock = threading.Lock()
+
+
+class SupplierIndex:
+    def __init__(self, version, ids, names, latitudes, longitudes, products_counts):
+        self.version = version
+        self.ids = ids
+        self.names = names
+        self.latitudes = latitudes            # градусы, по возрастанию
+        self.longitudes = longitudes
+        self.products_counts = products_counts
+        if np is not None:
+            self.lat_radians = np.radians(latitudes)
+            self.lon_radians = np.radians(longitudes)
+            self.cos_lat = np.cos(self.lat_radians)
+
+    @classmethod
+    def build(cls):
+        version = get_suppliers_version()
+        rows = sorted(
+            Supplier.objects.filter(is_active=True)
+            .annotate(products_count=Count('products'))
+            .values_list('latitude', 'id', 'name', 'longitude', 'products_count')
+        )
+        latitudes = [float(row[0]) for row in rows]
+        longitudes = [float(row[3]) for row in rows]
+        ids = [row[1] for row in rows]
+        names = [row[2] for row in rows]
+        counts = [row[4] for row in rows]
+        if np is not None:
+            latitudes = np.array(latitudes, dtype=np.float64)
+            longitudes = np.array(longitudes, dtype=np.float64)
+        return cls(version, ids, names, latitudes, longitudes, counts)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _band(self, latitude, radius_km):
+        """Срез позиций, широта которых не дальше radius_km от точки"""
+        delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+        if np is not None:
+            start = np.searchsorted(self.latitudes, latitude - delta, side='left')
+            stop = np.searchsorted(self.latitudes, latitude + delta, side='right')
+            return int(start), int(stop)
+        return bisect.bisect_left(self.latitudes, latitude - delta), bisect.bisect_right(self.latitudes, latitude + delta)
+
+    def _longitude_window(self, latitude, radius_km):
+        """Полуширина окна долгот в градусах; None, если круг охватывает полюс"""
+        angle = radius_km / EARTH_RADIUS_KM
+        if angle >= math.pi / 2 or math.sin(angle) >= math.cos(math.radians(latitude)):
+            return None
+        return math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+
+    def _candidates(self, latitude, longitude, radius_km):
+        """Позиции в полосе широт и окне долгот: все поставщики не дальше radius_km и часть лишних"""
+        start, stop = self._band(latitude, radius_km)
+        half_width = self._longitude_window(latitude, radius_km)
+        if np is not None:
+            positions = np.arange(start, stop)
+            if half_width is not None:
+                # Разность долгот в [-180, 180): окно переходит через 180-й меридиан
+                d_lon = (self.longitudes[start:stop] - longitude + 180.0) % 360.0 - 180.0
+                positions = positions[np.abs(d_lon) <= half_width]
+            return positions
+        if half_width is None:
+            return list(range(start, stop))
+        return [
+            i for i in range(start, stop)
+            if abs((self.longitudes[i] - longitude + 180.0) % 360.0 - 180.0) <= half_width
+        ]
+
+    def _distances(self, latitude, longitude, positions):
+        lat = math.radians(latitude)
+        lon = math.radians(longitude)
+        if np is not None:
+            d_lat = self.lat_radians[positions] - lat
+            d_lon = self.lon_radians[positions] - lon
+            a = np.sin(d_lat / 2) ** 2 + math.cos(lat) * self.cos_lat[positions] * np.sin(d_lon / 2) ** 2
+            return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        distances = []
+        for i in positions:
+            d_lat = math.radians(self.latitudes[i]) - lat
+            d_lon = math.radians(self.longitudes[i]) - lon
+            a = math.sin(d_lat / 2) ** 2 + math.cos(lat) * math.cos(math.radians(self.latitudes[i])) * math.sin(d_lon / 2) ** 2
+            distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+        return distances
+
+    def _nearest_positions(self, distances, k):
+        if np is not None:
+            if len(distances) > k:
+                candidates = np.argpartition(distances, k)[:k]
+            else:
+                candidates = np.arange(len(distances))
+            return candidates[np.argsort(distances[candidates], kind='stable')].tolist()
+        return heapq.nsmallest(k, range(len(distances)), key=distances.__getitem__)
+
+    def nearest(self, latitude, longitude, k):
+        """[(id, name, широта, долгота, расстояние км, число товаров)] по возрастанию расстояния"""
+        k = min(k, len(self))
+        if not k:
+            return []
+        radius = INITIAL_RADIUS_KM
+        while True:
+            candidates = self._candidates(latitude, longitude, radius)
+            everything = len(candidates) == len(self)
+            if len(candidates) >= k:
+                distances = self._distances(latitude, longitude, candidates)
+                closest = self._nearest_positions(distances, k)
+                # Всё, что вне полосы и окна, дальше radius: результат точен,
+                # если k-й сосед внутри радиуса
+                if everything or distances[closest[-1]] <= radius:
+                    break
+            radius *= 2
+
+        rows = []
+        for i in closest:
+            position = int(candidates[i])
+            rows.append((
+                self.ids[position], self.names[position],
+                float(self.latitudes[position]), float(self.longitudes[position]),
+                float(distances[i]), self.products_counts[position],
+            ))
+        return rows
+
+def get_index():
+    """Актуальный индекс; перестраивается, если версия поставщиков сменилась"""
+    global _index
+    index = _index
+    version = get_suppliers_version()
+    if index is not None and index.version == version:
+        return index
+    with _build_lock:
+        if _index is None or _index.version != version:
+            _index = SupplierIndex.build()
+        return _index
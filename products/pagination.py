@@ -0,0 +1,192 @@
+"""Keyset (cursor) пагинация для каталога товаров.
+
+Вместо OFFSET страница ищется по значениям ключа сортировки последней
+показанной строки, поэтому глубина страницы не влияет на время запроса.
+Курсор подписывается, чтобы его нельзя было подделать в адресной строке.
+"""
+import bisect
+import datetime
+import hashlib
+from decimal import Decimal
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+CURSOR_SALT = 'products.pagination.cursor'
+COUNT_CACHE_TIMEOUT = 300
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _prepare_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _salt(ordering):
+    # Сортировка входит в соль: курсор одной сортировки не примется другой
+    return f'{CURSOR_SALT}:{",".join(ordering)}'
+
+
+def encode_cursor(values, ordering):
+    return signing.dumps([_prepare_value(v) for v in values], salt=_salt(ordering), compress=True)
+
+
+def decode_cursor(token, ordering):
+    try:
+        values = signing.loads(token, salt=_salt(ordering))
+    except signing.BadSignature:
+        raise InvalidCursor('Некорректный курсор')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Курсор не соответствует сортировке')
+    return values
+
+
+def _field_name(field):
+    return field.lstrip('-')
+
+
+def seek_filter(ordering, values, reverse=False):
+    """Условие "строка после (values)" для лексикографической сортировки.
+
+    Первое поле дополнительно ограничено диапазоном (>= / <=), чтобы SQLite
+    мог использовать индекс для range scan, а не перебирать OR-ветки.
+    """
+    def lookup(field, strict):
+        descending = field.startswith('-') != reverse
+        return ('lt' if strict else 'lte') if descending else ('gt' if strict else 'gte')
+
+    condition = Q()
+    for i, field in enumerate(ordering):
+        branch = Q(**{f'{_field_name(field)}__{lookup(field, True)}': values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            branch &= Q(**{_field_name(prev_field): prev_value})
+        condition |= branch
+
+    first = ordering[0]
+    return Q(**{f'{_field_name(first)}__{lookup(first, False)}': values[0]}) & condition
+
+
+def cached_count(queryset, key=None, timeout=COUNT_CACHE_TIMEOUT):
+    """COUNT(*) по выборке, закэшированный по тексту запроса или явному ключу"""
+    if key is None:
+        key = hashlib.md5(str(queryset.query).encode('utf-8')).hexdigest()
+    cache_key = f'products:count:{key}'
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def count(self):
+        return self.paginator.count
+
+
+class KeysetPaginator:
+    """Пагинатор по курсору для выборки с детерминированной сортировкой.
+
+    ``ordering`` должен заканчиваться уникальным полем (обычно ``id``),
+    иначе строки с одинаковым ключом могут потеряться на границе страниц.
+    """
+
+    def __init__(self, queryset, ordering, per_page, count_key=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.count_key = count_key
+
+    @property
+    def count(self):
+        return cached_count(self.queryset.order_by(), self.count_key)
+
+    def _key(self, obj):
+        return [getattr(obj, _field_name(field)) for field in self.ordering]
+
+    def _fetch(self, values, reverse, limit):
+        """Строки после ключа values (или с начала), в порядке обхода"""
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(seek_filter(self.ordering, values, reverse=reverse))
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(f[1:] if f.startswith('-') else f'-{f}' for f in ordering)
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def get_page(self, after=None, before=None):
+        reverse = before is not None
+        cursor = before if reverse else after
+        values = decode_cursor(cursor, self.ordering) if cursor else None
+
+        rows = self._fetch(values, reverse, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        next_cursor = encode_cursor(self._key(rows[-1]), self.ordering) if rows and has_next else None
+        previous_cursor = encode_cursor(self._key(rows[0]), self.ordering) if rows and has_previous else None
+        return KeysetPage(rows, self, has_next, has_previous, next_cursor, previous_cursor)
+
+
+class SequenceKeysetPaginator(KeysetPaginator):
+    """Тот же курсорный протокол поверх списка, уже отсортированного по ordering.
+
+    Используется для снимка каталога в памяти: поиск позиции курсора - bisect.
+    Поддерживается только сортировка по возрастанию.
+    """
+
+    @property
+    def count(self):
+        return len(self.queryset)
+
+    def _fetch(self, values, reverse, limit):
+        items = self.queryset
+        if values is None:
+            start = len(items) if reverse else 0
+        else:
+            key = tuple(values)
+            bisect_func = bisect.bisect_left if reverse else bisect.bisect_right
+            start = bisect_func(items, key, key=lambda item: tuple(self._key(item)))
+        if reverse:
+            return list(reversed(items[max(start - limit, 0):start]))
+        return list(items[start:start + limit])
@@ -0,0 +1,242 @@
+"""Уменьшенные копии изображений (renditions) для страниц каталога.
+
+Пресет - набор ширин и, для квадратных превью, кадрирование по центру.
+Для каждой ширины строятся WebP и JPEG, маленький оригинал не
+увеличивается. Копии лежат по предсказуемым именам
+renditions/<пресет>/<имя источника>-<ширина>.<формат>, а состояние (в
+очереди, готово, ошибка) и построенные ширины - в ImageRendition, по
+строке на источник и пресет. Источник в хранилище по хэшу содержимого не
+меняется (ecoshop/storage.py): готовая копия годна, пока на источник
+ссылаются, а одинаковые изображения разных строк делят одни копии.
+
+Копии строятся после фиксации транзакции, сохранившей новое изображение,
+в фоновом пуле потоков (RENDITION_WORKERS); Pillow отпускает GIL на
+декодировании, масштабировании и кодировании. Запрос изображения не
+масштабирует: ready_map() одним запросом читает готовые копии страницы,
+тег {% picture %} выдаёт по ним srcset, а пока копий нет - оригинал.
+Изображения, сохранённые до появления копий или в обход сигналов,
+достраивает команда build_renditions.
+"""
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_init, post_save
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ImageRendition
+from .versioning import bump_renditions_version
+
+# square - кадрировать в квадрат; sizes - атрибут sizes по умолчанию
+Preset = namedtuple('Preset', 'widths square sizes')
+
+PRESETS = {
+    'thumbnail': Preset((80, 160), True, '80px'),
+    'card': Preset(
+        (320, 480, 640), False,
+        '(min-width: 1200px) 25vw, (min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw',
+    ),
+    'detail': Preset((640, 960, 1280), False, '(min-width: 768px) 50vw, 100vw'),
+    'avatar': Preset((150, 300), True, '150px'),
+}
+# (приложение, модель, поле) -> пресеты, которые строятся по изображению поля
+FIELD_PRESETS = {
+    ('products', 'Product', 'image'): ('card', 'thumbnail', 'detail'),
+    ('products', 'ProductImage', 'image'): ('thumbnail', 'detail'),
+    ('accounts', 'Profile', 'avatar'): ('avatar',),
+}
+# Расширение -> (формат Pillow, параметры кодирования)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+RENDITIONS_DIR = 'renditions'
+ORIENTATION_TAG = 0x0112
+
+# Имена копий задаются явно, а не хэшем содержимого: обычное хранилище в MEDIA_ROOT
+storage = FileSystemStorage()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_name(source, preset, width, extension):
+    return f'{RENDITIONS_DIR}/{preset}/{os.path.splitext(source)[0]}-{width}.{extension}'
+
+
+def rendition_names(source, preset, widths):
+    """Имена всех файлов копий источника по пресету"""
+    return [rendition_name(source, preset, width, extension) for width in widths for extension in FORMATS]
+
+
+def srcset(source, preset, widths, extension):
+    return ', '.join(f'{storage.url(rendition_name(source, preset, width, extension))} {width}w' for width in widths)
+
+
+def parse_widths(widths):
+    return tuple(int(width) for width in widths.split(',') if width)
+
+
+def _write(name, image, image_format, options):
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Запись во временный файл и переименование: читатель не увидит недописанную копию
+    fd, temp_path = tempfile.mkstemp(prefix='.rendition-', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, image_format, **options)
+        if storage.file_permissions_mode is not None:
+            os.chmod(temp_path, storage.file_permissions_mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def render_files(source, preset_name):
+    """Построить файлы копий источника, вернуть построенные ширины"""
+    preset = PRESETS[preset_name]
+    with default_storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2 - 1/8), если хватает для самой большой копии;
+        # ограничение только по ширине (с учётом поворота из EXIF), если копии не квадратные
+        largest = preset.widths[-1]
+        rotated = image.getexif().get(ORIENTATION_TAG, 1) in (5, 6, 7, 8)
+        image.draft('RGB', (largest, largest) if preset.square else (1, largest) if rotated else (largest, 1))
+        image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    largest = min(image.size) if preset.square else image.width
+    widths = [width for width in preset.widths if width <= largest] or [largest]
+    # От большей копии к меньшей: каждая масштабируется из предыдущей, а не из оригинала
+    resized = image
+    for width in reversed(widths):
+        if preset.square:
+            resized = ImageOps.fit(resized, (width, width), Image.Resampling.LANCZOS)
+        else:
+            height = max(1, round(resized.height * width / resized.width))
+            resized = resized.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for extension, (image_format, options) in FORMATS.items():
+            frame = resized
+            if image_format == 'JPEG' and has_alpha:
+                # В JPEG нет прозрачности: подложка белая, как фон страниц
+                frame = Image.new('RGB', resized.size, 'white')
+                frame.paste(resized, mask=resized.getchannel('A'))
+            _write(rendition_name(source, preset_name, width, extension), frame, image_format, options)
+    return widths
+
+
+def build(source, preset):
+    """(ширины, '') или (None, текст ошибки); в базу не пишет"""
+    try:
+        return render_files(source, preset), ''
+    except Exception as error:  # битый файл, неизвестный формат, слишком большое изображение
+        return None, f'{type(error).__name__}: {error}'[:200]
+
+
+def render(source, preset):
+    """Построить копии и записать состояние"""
+    widths, error = build(source, preset)
+    ImageRendition.objects.filter(source=source, preset=preset).update(
+        status='failed' if widths is None else 'ready',
+        widths=','.join(map(str, widths or ())), error=error, updated_at=timezone.now(),
+    )
+    if widths is not None:
+        # Только ETag страниц с {% picture %}: данные каталога от копий не зависят
+        bump_renditions_version()
+
+
+def _render_in_pool(source, preset):
+    close_old_connections()
+    try:
+        render(source, preset)
+    finally:
+        close_old_connections()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.RENDITION_WORKERS, thread_name_prefix='rendition')
+        return _executor
+
+
+def _submit(pairs):
+    for source, preset in pairs:
+        if getattr(settings, 'RENDITION_WORKERS', 0):
+            _pool().submit(_render_in_pool, source, preset)
+        else:
+            render(source, preset)
+
+
+def schedule(pairs):
+    """Поставить в очередь копии для пар (источник, пресет); готовые не перестраиваются"""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    ImageRendition.objects.bulk_create(
+        [ImageRendition(source=source, preset=preset) for source, preset in pairs], ignore_conflicts=True,
+    )
+    pending = [
+        (source, preset)
+        for source, preset in ImageRendition.objects.filter(
+            source__in={source for source, _ in pairs}, status='pending',
+        ).values_list('source', 'preset')
+        if (source, preset) in pairs
+    ]
+    # Файл источника и строка с ним видны пулу только после фиксации
+    transaction.on_commit(lambda: _submit(pending))
+
+
+def schedule_image(model, field_name, source):
+    """Копии изображения source, сохранённого в поле модели в обход save() (update)"""
+    presets = FIELD_PRESETS.get((model._meta.app_label, model.__name__, field_name), ())
+    if source:
+        schedule((str(source), preset) for preset in presets)
+
+
+def ready_map(images):
+    """{(источник, пресет): ширины} готовых копий изображений страницы - один запрос.
+
+    images - FieldFile, имена файлов (ImageRef снимка каталога) или пустые значения.
+    """
+    sources = {str(getattr(image, 'name', image)) for image in images if image}
+    if not sources:
+        return {}
+    rows = ImageRendition.objects.filter(source__in=sources, status='ready').values_list('source', 'preset', 'widths')
+    return {(source, preset): parse_widths(widths) for source, preset, widths in rows}
+
+
+def _stored_name(instance, attname):
+    value = instance.__dict__.get(attname)
+    return str(getattr(value, 'name', value) or '')
+
+
+def connect_signals():
+    """Копии нового изображения строятся после сохранения строки с ним"""
+    for (app_label, model_name, field_name), presets in FIELD_PRESETS.items():
+        model = apps.get_model(app_label, model_name)
+        attname = model._meta.get_field(field_name).attname
+
+        def remember_loaded(sender, instance, attname=attname, **kwargs):
+            instance.__dict__[f'_loaded_{attname}'] = _stored_name(instance, attname)
+
+        def schedule_changed(sender, instance, created, raw=False, attname=attname, presets=presets, **kwargs):
+            if raw or attname not in instance.__dict__:
+                return
+            source = _stored_name(instance, attname)
+            if source and (created or source != instance.__dict__.get(f'_loaded_{attname}')):
+                schedule((source, preset) for preset in presets)
+            instance.__dict__[f'_loaded_{attname}'] = source
+
+        post_init.connect(remember_loaded, sender=model, weak=False, dispatch_uid=f'renditions-init-{model_name}')
+        post_save.connect(schedule_changed, sender=model, weak=False, dispatch_uid=f'renditions-save-{model_name}')
@@ -0,0 +1,197 @@
+"""Полнотекстовый поиск по товарам на SQLite FTS5.
+
+Индекс хранит не исходный текст, а нормализованные термы: русские слова
+приводятся к упрощённой основе (отсекаются типовые окончания и у длинных
+основ уменьшительный суффикс -к-) и дублируются в транслите, поэтому
+запросы "морковка", "моркови" и "morkov" находят одни и те же товары.
+Слово запроса ищется как префикс основы, а от латинского слова
+отсекаются те же окончания в транслите: "morkov" ищется как "mork"* и
+может найти и другие слова, начинающиеся так же. Ранжирование - bm25,
+название весит больше описания.
+"""
+import re
+from functools import lru_cache
+
+from django.db import connection, transaction
+
+from .models import Product, transliterate
+
+SEARCH_TABLE = 'products_product_search'
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+MIN_STEM_LENGTH = 3
+# Уменьшительный суффикс -к- (морковка, шоколадка) отсекается, только если основа
+# остаётся не короче: в коротких словах (сок, молоко, сливки) "к" - часть корня
+MIN_DIMINUTIVE_STEM_LENGTH = 5
+DIMINUTIVE_SUFFIXES = ('к', 'k')
+
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Окончания существительных и прилагательных, от длинных к коротким
+RUSSIAN_ENDINGS = sorted({
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ими', 'ыми', 'его', 'ого',
+    'ему', 'ому', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ый',
+    'ям', 'ем', 'ам', 'ом', 'им', 'ым', 'ах', 'ях', 'их', 'ых', 'ию', 'ью',
+    'ия', 'ья', 'ая', 'яя', 'ое', 'ее', 'ые', 'ую', 'юю', 'ою', 'ею',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+}, key=len, reverse=True)
+
+# Те же окончания в транслите, чтобы латинский запрос сводился к той же основе
+LATIN_ENDINGS = sorted({transliterate(e) for e in RUSSIAN_ENDINGS} - {''}, key=len, reverse=True)
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+
+# Словарь каталога невелик: основы повторяющихся слов не пересчитываются
+@lru_cache(maxsize=65536)
+def stem(token):
+    endings = RUSSIAN_ENDINGS if CYRILLIC_RE.search(token) else LATIN_ENDINGS
+    for ending in endings:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+            token = token[:-len(ending)]
+            break
+    if token.endswith(DIMINUTIVE_SUFFIXES) and len(token) - 1 >= MIN_DIMINUTIVE_STEM_LENGTH:
+        token = token[:-1]
+    return token
+
+
+def index_terms(text):
+    """Строка термов для индекса: основы слов и их транслит"""
+    terms = []
+    for token in tokenize(text):
+        if CYRILLIC_RE.search(token):
+            base = stem(token)
+            terms.append(base)
+            terms.append(transliterate(base))
+        else:
+            terms.append(token)
+    return ' '.join(terms)
+
+
+def build_match_query(query):
+    """FTS5 MATCH-выражение: все слова запроса как префиксы основ"""
+    terms = [f'"{stem(token)}"*' for token in tokenize(query)]
+    return ' '.join(terms)
+
+
+def index_product(product_id, name, description):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [product_id])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+            [product_id, index_terms(name), index_terms(description)],
+        )
+
+
+def index_products(rows):
+    """Переиндексировать пачку товаров: rows - (id, название, описание)"""
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+            [(product_id, index_terms(name), index_terms(description)) for product_id, name, description in rows],
+        )
+
+
+def unindex_product(product_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index(queryset=None, batch_size=2000, using=None):
+    """Полная перестройка индекса, возвращает количество проиндексированных товаров"""
+    if queryset is None:
+        queryset = Product.objects.all()
+    db = connection if using is None else using
+    total = 0
+    with transaction.atomic(using=db.alias), db.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        batch = []
+        rows = queryset.using(db.alias).values_list('id', 'name', 'description').iterator(chunk_size=batch_size)
+        for product_id, name, description in rows:
+            batch.append((product_id, index_terms(name), index_terms(description)))
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', batch
+                )
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', batch
+            )
+            total += len(batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return total
+
+
+class SearchResults:
+    """Ленивый результат поиска, совместимый с django.core.paginator.Paginator.
+
+    Ранжирование и фильтры выполняются одним SQL-запросом над FTS-таблицей,
+    затем нужный срез товаров загружается по первичному ключу.
+    """
+
+    def __init__(self, query, category_slug=None, supplier_id=None):
+        self.match = build_match_query(query)
+        self.category_slug = category_slug
+        self.supplier_id = supplier_id
+        self._count = None
+
+    def _where(self):
+        sql = [f'{SEARCH_TABLE} MATCH %s', 'p.in_stock']
+        params = [self.match]
+        if self.category_slug:
+            sql.append('p.category_id IN (SELECT id FROM products_category WHERE slug = %s)')
+            params.append(self.category_slug)
+        if self.supplier_id:
+            sql.append('p.supplier_id = %s')
+            params.append(self.supplier_id)
+        return ' AND '.join(sql), params
+
+    def count(self):
+        if not self.match:
+            return 0
+        if self._count is None:
+            where, params = self._where()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {SEARCH_TABLE} '
+                    f'JOIN products_product p ON p.id = {SEARCH_TABLE}.rowid WHERE {where}',
+                    params,
+                )
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def ranked_ids(self, offset, limit):
+        if not self.match:
+            return []
+        where, params = self._where()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT p.id FROM {SEARCH_TABLE} '
+                f'JOIN products_product p ON p.id = {SEARCH_TABLE}.rowid WHERE {where} '
+                f'ORDER BY bm25({SEARCH_TABLE}, %s, %s) LIMIT %s OFFSET %s',
+                params + [NAME_WEIGHT, DESCRIPTION_WEIGHT, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = key.stop if key.stop is not None else self.count()
+        ids = self.ranked_ids(start, max(stop - start, 0))
+        products = Product.objects.select_related('category', 'supplier').in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
@@ -0,0 +1,54 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import search
+from .models import Category, Product, ProductImage, Supplier
+from .versioning import bump_catalog_version, bump_suppliers_version
+
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, raw=False, **kwargs):
+    if search.search_available() and not raw:
+        search.index_product(instance.pk, instance.name, instance.description)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_for_search(sender, instance, **kwargs):
+    if search.search_available():
+        search.unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def invalidate_suppliers_cache(sender, **kwargs):
+    bump_suppliers_version()
+
+
+@receiver(post_save, sender=Product)
+def invalidate_suppliers_cache_on_product_save(sender, instance, created, **kwargs):
+    # Число товаров у поставщика меняется только при смене привязки
+    if created:
+        changed = instance.supplier_id is not None
+    else:
+        changed = getattr(instance, '_loaded_supplier_id', object()) != instance.supplier_id
+    if changed:
+        bump_suppliers_version()
+    instance._loaded_supplier_id = instance.supplier_id
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_suppliers_cache_on_product_delete(sender, instance, **kwargs):
+    if instance.supplier_id is not None:
+        bump_suppliers_version()
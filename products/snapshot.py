@@ -0,0 +1,229 @@
+"""Неизменяемый снимок каталога в памяти процесса.
+
+Каталог небольшой и меняется редко, поэтому список и карточки товаров
+можно отдавать без обращений к SQLite. Первый снимок строится до форка
+воркеров (см. ecoshop/wsgi.py), после чего gc.freeze() переносит его
+объекты в постоянное поколение сборщика мусора: страницы памяти не
+трогаются сборщиком и остаются общими между форкнутыми воркерами
+(copy-on-write). Следующие снимки не замораживаются: заморозка в
+работающем воркере унесла бы в постоянное поколение и живые объекты
+запросов.
+
+Записи - объекты со __slots__, индексы фильтров - array('l') позиций в
+отсортированном по (name, id) списке. При смене версии каталога
+(products.versioning, общий кэш - смену видит каждый воркер, в том числе
+после load_products) новый снимок строится целиком и подменяется одной
+операцией присваивания, читатели продолжают работать со старым. Версия
+меняется часто (остатки, копии изображений, рекомендации), поэтому снимок
+перестраивается не чаще раза в CATALOG_SNAPSHOT_REBUILD_INTERVAL секунд:
+до того отдаётся прежний, и ETag каталога считается по его версии.
+"""
+import gc
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.urls import reverse
+
+from .models import Category, Product, Supplier
+from .versioning import get_catalog_version
+
+_snapshot = None
+_build_lock = threading.Lock()
+
+
+def snapshot_enabled():
+    return getattr(settings, 'CATALOG_SNAPSHOT', False)
+
+
+def _is_current(snapshot, version):
+    if snapshot.version == version:
+        return True
+    interval = getattr(settings, 'CATALOG_SNAPSHOT_REBUILD_INTERVAL', 10)
+    return time.monotonic() - snapshot.built_at < interval
+
+
+class ImageRef(str):
+    """Имя файла изображения с атрибутом url, как у FieldFile в шаблонах"""
+    __slots__ = ()
+
+    @property
+    def url(self):
+        return f'{settings.MEDIA_URL}{self}'
+
+
+class CategoryRecord:
+    __slots__ = ('id', 'name', 'slug')
+
+    def __init__(self, id, name, slug):
+        self.id = id
+        self.name = name
+        self.slug = slug
+
+    def __str__(self):
+        return self.name
+
+
+class SupplierRecord:
+    __slots__ = ('id', 'name', 'address', 'phone', 'is_active')
+
+    def __init__(self, id, name, address, phone, is_active):
+        self.id = id
+        self.name = name
+        self.address = address
+        self.phone = phone
+        self.is_active = is_active
+
+    def __str__(self):
+        return self.name
+
+
+class ProductRecord:
+    __slots__ = (
+        'id', 'name', 'slug', 'description', 'price', 'weight', 'calories', 'protein',
+        'fat', 'carbs', 'in_stock', 'image', 'category', 'supplier', 'updated_at',
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def category_id(self):
+        return self.category.id
+
+    @property
+    def supplier_id(self):
+        return self.supplier.id if self.supplier else None
+
+    def get_absolute_url(self):
+        return reverse('products:product_detail', args=[self.slug])
+
+    def formatted_price(self):
+        return f"{self.price} ₽"
+
+
+class RecordList:
+    """Последовательность записей по массиву позиций без копирования записей"""
+    __slots__ = ('records', 'positions')
+
+    def __init__(self, records, positions):
+        self.records = records
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.records[i] for i in self.positions[index]]
+        return self.records[self.positions[index]]
+
+    def count(self):
+        return len(self.positions)
+
+
+class CatalogSnapshot:
+    def __init__(self, version, records, in_stock, by_category, by_supplier, by_slug):
+        self.version = version
+        self.records = records          # tuple всех товаров, отсортированных по (name, id)
+        self.in_stock = in_stock        # array позиций товаров в наличии
+        self.by_category = by_category  # slug категории -> array позиций (в наличии)
+        self.by_supplier = by_supplier  # id поставщика -> array позиций (в наличии)
+        self.by_slug = by_slug          # slug товара -> позиция
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        version = get_catalog_version()
+        categories = {}
+        category_updated = {}
+        for pk, name, slug, updated_at in Category.objects.values_list('id', 'name', 'slug', 'updated_at'):
+            categories[pk] = CategoryRecord(pk, name, slug)
+            category_updated[pk] = updated_at
+        suppliers = {}
+        supplier_updated = {}
+        for pk, name, address, phone, is_active, updated_at in Supplier.objects.values_list(
+            'id', 'name', 'address', 'phone', 'is_active', 'updated_at'
+        ):
+            suppliers[pk] = SupplierRecord(pk, name, address, phone, is_active)
+            supplier_updated[pk] = updated_at
+
+        records = []
+        fields = ('id', 'name', 'slug', 'description', 'price', 'weight', 'calories', 'protein',
+                  'fat', 'carbs', 'in_stock', 'image', 'category_id', 'supplier_id', 'updated_at')
+        rows = Product.objects.order_by('name', 'id').values_list(*fields).iterator(chunk_size=2000)
+        for row in rows:
+            values = dict(zip(fields, row))
+            category_id = values.pop('category_id')
+            supplier_id = values.pop('supplier_id')
+            values['category'] = categories[category_id]
+            values['supplier'] = suppliers.get(supplier_id)
+            values['image'] = ImageRef(values['image']) if values['image'] else None
+            # Карточка товара показывает категорию и поставщика - учитываем их изменения
+            values['updated_at'] = max(filter(None, (
+                values['updated_at'], category_updated.get(category_id), supplier_updated.get(supplier_id),
+            )))
+            records.append(ProductRecord(**values))
+
+        in_stock = array('l')
+        by_category = {}
+        by_supplier = {}
+        by_slug = {}
+        for position, record in enumerate(records):
+            by_slug[record.slug] = position
+            if not record.in_stock:
+                continue
+            in_stock.append(position)
+            by_category.setdefault(record.category.slug, array('l')).append(position)
+            if record.supplier is not None:
+                by_supplier.setdefault(record.supplier.id, array('l')).append(position)
+
+        return cls(version, tuple(records), in_stock, by_category, by_supplier, by_slug)
+
+    def filter(self, category_slug=None, supplier_id=None):
+        """Товары в наличии с фильтрами каталога, в порядке (name, id)"""
+        positions = self.in_stock
+        if category_slug:
+            positions = self.by_category.get(category_slug, array('l'))
+        if supplier_id is not None:
+            supplier_positions = self.by_supplier.get(supplier_id, array('l'))
+            if category_slug:
+                allowed = set(supplier_positions)
+                positions = array('l', (p for p in positions if p in allowed))
+            else:
+                positions = supplier_positions
+        return RecordList(self.records, positions)
+
+    def get(self, slug):
+        position = self.by_slug.get(slug)
+        return None if position is None else self.records[position]
+
+
+def get_snapshot():
+    """Актуальный снимок; после смены версии каталога перестраивается не чаще раза в интервал"""
+    global _snapshot
+    snapshot = _snapshot
+    version = get_catalog_version()
+    if snapshot is not None and _is_current(snapshot, version):
+        return snapshot
+    with _build_lock:
+        if _snapshot is None or not _is_current(_snapshot, version):
+            _snapshot = CatalogSnapshot.build()
+        return _snapshot
+
+
+def warm():
+    """Построить снимок при старте воркера, до форка, и заморозить его для сборщика мусора"""
+    snapshot = get_snapshot()
+    gc.collect()
+    gc.freeze()
+    return snapshot
@@ -0,0 +1,104 @@
+"""Готовый ответ suppliers_json в кэше.
+
+Список поставщиков для карты сериализуется один раз на версию поставщиков
+(products.versioning) и хранится в кэше как байты вместе со строгим ETag
+(хэш тела). Последняя версия дополнительно держится в памяти процесса, так
+что обычный запрос - это одно чтение номера версии и отдача готовых байт.
+
+Перестроение однопоточное: внутри процесса его выполняет один поток, между
+процессами сервера - тот, кто взял файловую блокировку (ecoshop.locks);
+остальные ждут появления записи в общем кэше, а не считают агрегат сами.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+
+from ecoshop import locks
+
+from .models import Supplier
+from .versioning import get_suppliers_version
+
+CACHE_TIMEOUT = 24 * 60 * 60
+LOCK_NAME = 'suppliers-json'
+# Сколько ждать чужого перестроения, прежде чем строить самому
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+_local = None
+_build_lock = threading.Lock()
+
+
+class SuppliersPayload:
+    __slots__ = ('version', 'etag', 'body')
+
+    def __init__(self, version, etag, body):
+        self.version = version
+        self.etag = etag
+        self.body = body
+
+
+def supplier_data(supplier):
+    return {
+        'id': supplier.id,
+        'name': supplier.name,
+        'description': supplier.description,
+        'address': supplier.address,
+        'latitude': float(supplier.latitude),
+        'longitude': float(supplier.longitude),
+        'phone': supplier.phone,
+        'email': supplier.email,
+        'website': supplier.website,
+        'image': supplier.image.url if supplier.image else None,
+        'products_count': supplier.products_count,
+    }
+
+
+def build_payload(version):
+    suppliers = Supplier.objects.filter(is_active=True).annotate(products_count=Count('products'))
+    body = json.dumps([supplier_data(supplier) for supplier in suppliers], cls=DjangoJSONEncoder).encode('utf-8')
+    return SuppliersPayload(version, f'"{hashlib.sha1(body).hexdigest()}"', body)
+
+
+def _cache_key(version):
+    return f'products:suppliers-json:{version}'
+
+
+def _from_cache(version):
+    entry = cache.get(_cache_key(version))
+    return None if entry is None else SuppliersPayload(version, *entry)
+
+
+def _regenerate(version):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        payload = _from_cache(version)
+        if payload is not None:
+            return payload
+        with locks.try_lock(LOCK_NAME) as locked:
+            # По истечении срока перестроение в другом процессе считается зависшим - строим сами
+            if locked or time.monotonic() >= deadline:
+                payload = _from_cache(version)
+                if payload is None:
+                    payload = build_payload(version)
+                    cache.set(_cache_key(version), (payload.etag, payload.body), CACHE_TIMEOUT)
+                return payload
+        time.sleep(POLL_INTERVAL)
+
+
+def get_suppliers_payload():
+    global _local
+    version = get_suppliers_version()
+    payload = _local
+    if payload is not None and payload.version == version:
+        return payload
+    payload = _from_cache(version)
+    if payload is None:
+        with _build_lock:
+            payload = _regenerate(version)
+    _local = payload
+    return payload
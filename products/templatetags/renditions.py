@@ -0,0 +1,30 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from .. import renditions
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def picture(context, image, preset, sizes=None, **attrs):
+    """<picture> с копиями изображения по пресету в WebP и JPEG, без готовых копий - <img> оригинала.
+
+    Готовые копии берутся из context['renditions'] (renditions.ready_map во view):
+    сам тег в базу не обращается. Остальные именованные аргументы - атрибуты <img>.
+    """
+    if not image:
+        return ''
+    source = str(getattr(image, 'name', image))
+    widths = (context.get('renditions') or {}).get((source, preset))
+    attributes = format_html_join('', ' {}="{}"', attrs.items())
+    if not widths:
+        return format_html('<img src="{}"{}>', image.url, attributes)
+    sizes = sizes or renditions.PRESETS[preset].sizes
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        renditions.srcset(source, preset, widths, 'webp'), sizes,
+        renditions.storage.url(renditions.rendition_name(source, preset, widths[0], 'jpg')),
+        renditions.srcset(source, preset, widths, 'jpg'), sizes, attributes,
+    )
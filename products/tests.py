@@ -1,6 +1,45 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Category, Product
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import tempfile
+from PIL import Image
+from ecoshop import locks
+from . import feed, geo, nearest, renditions, search, snapshot, suppliers_cache
+from .models import Category, ImageRendition, Product, ProductImage, ProductRecommendation, Supplier
+from .pagination import seek_filter
+from .versioning import (
+    bump_catalog_version, bump_suppliers_version, get_catalog_version, get_suppliers_version,
+)
+
+
+def bump_through_other_cache(bump):
+    """Увеличить версию через второй экземпляр кэша на том же каталоге, как это делает другой процесс"""
+    params = settings.CACHES['default']
+    other = FileBasedCache(params['LOCATION'], params)
+    with mock.patch('products.versioning.cache', other):
+        bump()
+
 
 class ProductModelTest(TestCase):
     def setUp(self):
@@ -38,4 +77,1161 @@ class ProductModelTest(TestCase):
     def test_product_get_absolute_url(self):
         """Test that get_absolute_url method works correctly"""
         expected_url = f"/{self.product.slug}/"
-        self.assertEqual(self.product.get_absolute_url(), expected_url)
\ No newline at end of file
+        self.assertEqual(self.product.get_absolute_url(), expected_url)
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.vegetables = Category.objects.create(name="Овощи", slug="vegetables")
+        self.fruits = Category.objects.create(name="Фрукты", slug="fruits")
+        for i in range(30):
+            Product.objects.create(
+                category=self.vegetables if i % 2 else self.fruits,
+                name=f"Товар {i:02d}",
+                slug=f"product-{i}",
+                description="Описание",
+                price=100,
+                weight="1 кг",
+                calories="35 ккал",
+                protein="1г",
+                fat="1г",
+                carbs="1г",
+            )
+
+    def test_walks_all_pages_without_gaps(self):
+        """Test that following next cursors visits every product exactly once"""
+        seen = []
+        url = reverse('products:product_list')
+        params = {}
+        while True:
+            response = self.client.get(url, params)
+            page = response.context['page_obj']
+            seen.extend(p.name for p in page.object_list)
+            if not page.has_next():
+                break
+            params = {'after': page.next_cursor}
+        self.assertEqual(seen, sorted(f"Товар {i:02d}" for i in range(30)))
+
+    def test_previous_cursor_returns_previous_page(self):
+        url = reverse('products:product_list')
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(url, {'after': first.next_cursor}).context['page_obj']
+        back = self.client.get(url, {'before': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back.object_list), list(first.object_list))
+        self.assertFalse(back.has_previous())
+
+    def test_cursor_keeps_filters(self):
+        url = reverse('products:product_list')
+        first = self.client.get(url, {'category': 'fruits'}).context['page_obj']
+        second = self.client.get(url, {'category': 'fruits', 'after': first.next_cursor}).context['page_obj']
+        self.assertTrue(all(p.category_id == self.fruits.id for p in second.object_list))
+        self.assertEqual(first.count, 15)
+
+    def test_tampered_cursor_returns_404(self):
+        response = self.client.get(reverse('products:product_list'), {'after': 'forged:cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.vegetables = Category.objects.create(name="Овощи", slug="vegetables")
+        self.dairy = Category.objects.create(name="Молочные продукты", slug="dairy")
+        defaults = dict(price=100, weight="1 кг", calories="35 ккал", protein="1г", fat="1г", carbs="1г")
+        self.carrot = Product.objects.create(
+            category=self.vegetables, name="Свежая морковь", description="Сладкая и сочная", **defaults
+        )
+        self.salad = Product.objects.create(
+            category=self.vegetables, name="Салатный микс", description="Листья салата с тёртой морковкой", **defaults
+        )
+        self.cheese = Product.objects.create(
+            category=self.dairy, name="Сыр фермерский", description="Выдержанный сыр", **defaults
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse('products:product_search'), params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['products'])
+
+    def test_stemmed_query_matches_word_forms(self):
+        """Test that different word forms find the same products, name matches first"""
+        self.assertEqual(self.search(q="моркови"), [self.carrot, self.salad])
+
+    def test_transliterated_query(self):
+        self.assertEqual(self.search(q="syr"), [self.cheese])
+
+    def test_diminutive_and_transliterated_forms(self):
+        for query in ("морковка", "моркови", "морковкой", "morkov", "morkovka"):
+            self.assertEqual(self.search(q=query), [self.carrot, self.salad], query)
+        self.assertEqual(search.stem("морковка"), search.stem("морковь"))
+        # В коротких основах "к" - часть корня
+        self.assertEqual(search.stem("молоко"), "молок")
+
+    def test_respects_category_filter(self):
+        self.assertEqual(self.search(q="морковь", category="dairy"), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.cheese.name = "Творог домашний"
+        self.cheese.save()
+        self.assertEqual(self.search(q="творог"), [self.cheese])
+        self.cheese.delete()
+        self.assertEqual(self.search(q="творог"), [])
+
+
+class CatalogFacetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vegetables = Category.objects.create(name="Овощи", slug="vegetables")
+        self.fruits = Category.objects.create(name="Фрукты", slug="fruits")
+        self.farm = Supplier.objects.create(name="Ферма", address="Адрес", latitude=55.7, longitude=37.6)
+        defaults = dict(description="Описание", price=100, weight="1 кг", calories="35 ккал", protein="1г", fat="1г", carbs="1г")
+        Product.objects.create(category=self.vegetables, supplier=self.farm, name="Морковь", **defaults)
+        Product.objects.create(category=self.vegetables, name="Свекла", **defaults)
+        Product.objects.create(category=self.fruits, supplier=self.farm, name="Яблоко", **defaults)
+        Product.objects.create(category=self.fruits, supplier=self.farm, name="Груша", in_stock=False, **defaults)
+
+    def counts(self, options):
+        return {option.name: option.count for option in options}
+
+    def test_counts_respect_current_filter(self):
+        response = self.client.get(reverse('products:product_list'), {'supplier': self.farm.id})
+        self.assertEqual(self.counts(response.context['categories']), {"Овощи": 1, "Фрукты": 1})
+        response = self.client.get(reverse('products:product_list'), {'category': 'vegetables'})
+        self.assertEqual(self.counts(response.context['suppliers']), {"Ферма": 1})
+
+    def test_invalid_supplier_is_not_found(self):
+        urls = [reverse('products:product_list'), reverse('products:product_search')]
+        self.addCleanup(setattr, snapshot, '_snapshot', None)
+        for supplier in ('abc', '-1', '²', '9' * 30):
+            for url in urls:
+                self.assertEqual(self.client.get(url, {'supplier': supplier, 'q': 'морковь'}).status_code, 404)
+            with override_settings(CATALOG_SNAPSHOT=True):
+                self.assertEqual(self.client.get(urls[0], {'supplier': supplier}).status_code, 404)
+        response = self.client.get(urls[1], {'supplier': self.farm.id, 'q': 'морковь'})
+        self.assertEqual([product.name for product in response.context['products']], ["Морковь"])
+
+    def test_sidebar_is_cached_until_catalog_changes(self):
+        url = reverse('products:product_list')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        self.fruits.name = "Фрукты и ягоды"
+        self.fruits.save()
+        response = self.client.get(url)
+        self.assertIn("Фрукты и ягоды", self.counts(response.context['categories']))
+
+    def test_tests_do_not_touch_the_working_cache(self):
+        location = os.path.realpath(settings.CACHES['default']['LOCATION'])
+        self.assertFalse(location.startswith(os.path.realpath(settings.BASE_DIR / 'var')))
+
+    def test_version_bumped_by_another_process_invalidates_cache(self):
+        url = reverse('products:product_list')
+        self.client.get(url)
+        Category.objects.filter(pk=self.fruits.pk).update(name="Фрукты и ягоды")  # без сигналов
+        self.assertNotIn("Фрукты и ягоды", self.counts(self.client.get(url).context['categories']))
+        bump_through_other_cache(bump_catalog_version)
+        self.assertIn("Фрукты и ягоды", self.counts(self.client.get(url).context['categories']))
+
+
+class NumericNutritionTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Овощи", slug="vegetables")
+        defaults = dict(category=self.category, description="Описание", price=100, fat="0.1г", carbs="7г")
+        self.carrot = Product.objects.create(name="Морковь", weight="1 кг", calories="35 ккал", protein="1.3г", **defaults)
+        self.cheese = Product.objects.create(name="Сыр", weight="1 шт. (350-400г)", calories="340 к kcal", protein="25г", **defaults)
+        self.eggs = Product.objects.create(name="Яйца", weight="6 шт.", calories="157 ккал", protein="12,7 г", **defaults)
+
+    def test_text_values_are_parsed(self):
+        self.assertEqual(self.carrot.weight_grams, 1000)
+        self.assertEqual(self.cheese.weight_grams, 375)
+        self.assertIsNone(self.eggs.weight_grams)
+        self.assertEqual(self.cheese.calories_kcal, 340)
+        self.assertEqual(self.eggs.protein_g, 12.7)
+
+    def test_range_filter_and_sort(self):
+        response = self.client.get(reverse('products:product_list'), {'calories_max': '200', 'sort': 'protein'})
+        self.assertEqual(list(response.context['products']), [self.eggs, self.carrot])
+
+    def test_backfill_command(self):
+        Product.objects.update(calories_kcal=None)
+        call_command('backfill_numeric_fields', batch_size=2, stdout=StringIO())
+        self.carrot.refresh_from_db()
+        self.assertEqual(self.carrot.calories_kcal, 35)
+
+
+class CatalogQueryPlanTest(TestCase):
+    """EXPLAIN QUERY PLAN guards: hot catalog queries must stay on their indexes"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index_name}\b', plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def catalog(self):
+        return Product.objects.filter(in_stock=True).select_related('category', 'supplier')
+
+    def test_category_and_supplier_filter(self):
+        queryset = self.catalog().filter(category__slug='vegetables', supplier_id=1).order_by('name', 'id')[:13]
+        self.assertUsesIndex(queryset, 'product_instock_cat_sup_idx')
+
+    def test_category_filter(self):
+        queryset = self.catalog().filter(category__slug='vegetables').order_by('name', 'id')[:13]
+        self.assertUsesIndex(queryset, 'product_instock_cat_name_idx')
+
+    def test_supplier_filter(self):
+        queryset = self.catalog().filter(supplier_id=1).order_by('name', 'id')[:13]
+        self.assertUsesIndex(queryset, 'product_instock_sup_name_idx')
+
+    def test_price_sorts_with_cursor(self):
+        for ordering in (('price', 'id'), ('-price', '-id')):
+            queryset = self.catalog().filter(seek_filter(ordering, ['150.00', 10])).order_by(*ordering)[:13]
+            self.assertUsesIndex(queryset, 'product_instock_price_idx')
+
+    def test_newest_sort_reads_primary_key_in_order(self):
+        plan = self.catalog().order_by('-id')[:13].explain()
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.product = Product.objects.create(
+            category=self.category, name="Морковь", slug="carrot", description="Описание", price=100,
+            weight="1 кг", calories="35 ккал", protein="1г", fat="1г", carbs="1г",
+        )
+
+    def revalidate(self, url, **params):
+        self.client.get(url, params)  # первый ответ выставляет CSRF-cookie, она входит в ETag
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        return first, self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_unchanged_list_returns_304_without_queries(self):
+        url = reverse('products:product_list')
+        self.client.get(url, {'category': 'vegetables'})
+        first = self.client.get(url, {'category': 'vegetables'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'category': 'vegetables'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Last-Modified', first)
+
+    def test_etag_differs_per_filter_and_changes_with_catalog(self):
+        url = reverse('products:product_list')
+        first, second = self.revalidate(url)
+        other = self.client.get(url, {'category': 'vegetables'})
+        self.assertNotEqual(first['ETag'], other['ETag'])
+        self.product.price = 120
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_from_another_process_is_not_answered_with_304(self):
+        url = reverse('products:product_list')
+        first, second = self.revalidate(url)
+        self.assertEqual(second.status_code, 304)
+        Product.objects.filter(pk=self.product.pk).update(price=120)
+        bump_through_other_cache(bump_catalog_version)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '120')
+
+    def test_detail_revalidates_against_product_timestamp(self):
+        url = self.product.get_absolute_url()
+        first, second = self.revalidate(url)
+        self.assertEqual(second.status_code, 304)
+        Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_revalidates_against_recommendations_and_gallery(self):
+        other = Product.objects.create(
+            category=self.category, name="Свёкла", slug="beet", description="Описание", price=80,
+            weight="1 кг", calories="40 ккал", protein="1г", fat="1г", carbs="1г",
+        )
+        url = self.product.get_absolute_url()
+        first, second = self.revalidate(url)
+        self.assertEqual(second.status_code, 304)
+        self.assertNotIn('Last-Modified', first)
+
+        # Пересчёт рекомендаций в другом процессе: строки без updated_at и версия каталога
+        ProductRecommendation.objects.create(product=self.product, recommended=other, rank=1, score=1)
+        bump_through_other_cache(bump_catalog_version)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Свёкла')
+
+        ProductImage.objects.create(product=self.product, image='products/gallery/beet.jpg', source_url='https://example.com/beet.jpg')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_cart_change_invalidates_page(self):
+        url = reverse('products:product_list')
+        self.client.post(reverse('orders:cart_add', args=[self.product.id]))
+        self.client.get(url)  # показывает сообщение о добавлении
+        first = self.client.get(url)
+        self.client.post(reverse('orders:cart_add', args=[self.product.id]))
+        self.client.get(url)  # показывает сообщение о добавлении
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class ProductsApiTest(TestCase):
+    def setUp(self):
+        self.vegetables = Category.objects.create(name="Овощи", slug="vegetables")
+        self.fruits = Category.objects.create(name="Фрукты", slug="fruits")
+        defaults = dict(description="Описание", price=100, weight="1 кг", calories="35 ккал", protein="1г", fat="1г", carbs="1г")
+        for i in range(5):
+            Product.objects.create(category=self.vegetables, name=f"Овощ {i}", **defaults)
+        Product.objects.create(category=self.fruits, name="Яблоко", **defaults)
+
+    def fetch(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_sparse_fields_and_filters(self):
+        data = self.fetch(reverse('products:products_api'), {'fields': 'name,price', 'category': 'fruits'})
+        self.assertEqual(data, {'results': [{'name': "Яблоко", 'price': '100.00'}], 'next': None})
+
+    def test_cursor_paging_visits_every_product(self):
+        names = []
+        data = self.fetch(reverse('products:products_api'), {'fields': 'name', 'limit': 2})
+        while True:
+            names.extend(item['name'] for item in data['results'])
+            if not data['next']:
+                break
+            data = self.fetch(data['next'])
+        self.assertEqual(names, sorted(Product.objects.values_list('name', flat=True)))
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('products:products_api'), {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_numeric_supplier_is_rejected(self):
+        for supplier in ('abc', '-1', '1.5', '²'):
+            response = self.client.get(reverse('products:products_api'), {'supplier': supplier})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'supplier должен быть числом'})
+
+
+@override_settings(CATALOG_SNAPSHOT=True, CATALOG_SNAPSHOT_REBUILD_INTERVAL=0)
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        snapshot._snapshot = None
+        self.vegetables = Category.objects.create(name="Овощи", slug="vegetables")
+        self.farm = Supplier.objects.create(name="Ферма", address="Адрес", latitude=55.7, longitude=37.6)
+        defaults = dict(description="Описание", price=100, weight="1 кг", calories="35 ккал", protein="1г", fat="1г", carbs="1г")
+        for i in range(15):
+            Product.objects.create(category=self.vegetables, supplier=self.farm if i % 3 else None, name=f"Товар {i:02d}", **defaults)
+        self.hidden = Product.objects.create(category=self.vegetables, name="Нет в наличии", in_stock=False, **defaults)
+
+    def walk(self, url, **params):
+        slugs = []
+        while True:
+            page = self.client.get(url, params).context['page_obj']
+            slugs.extend(p.slug for p in page.object_list)
+            if not page.has_next():
+                return slugs
+            params['after'] = page.next_cursor
+
+    def test_list_matches_orm(self):
+        url = reverse('products:product_list')
+        with override_settings(CATALOG_SNAPSHOT=False):
+            expected = self.walk(url)
+            expected_filtered = self.walk(url, supplier=self.farm.id, category='vegetables')
+        self.assertEqual(self.walk(url), expected)
+        self.assertEqual(self.walk(url, supplier=self.farm.id, category='vegetables'), expected_filtered)
+
+    def test_warm_snapshot_serves_list_without_queries(self):
+        url = reverse('products:product_list')
+        self.client.get(url)  # построение снимка
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'supplier': self.farm.id})
+        self.assertEqual(len(response.context['products']), 10)
+
+    def test_detail_and_rebuild_on_catalog_change(self):
+        product = Product.objects.get(name="Товар 01")
+        self.client.get(product.get_absolute_url())
+        product.name = "Переименованный товар"
+        product.save()
+        response = self.client.get(product.get_absolute_url())
+        self.assertEqual(response.context['product'].name, "Переименованный товар")
+        self.assertEqual(self.client.get(self.hidden.get_absolute_url()).status_code, 200)
+
+    def test_rebuilt_without_freeze_after_change_in_another_process(self):
+        product = Product.objects.get(name="Товар 01")
+        self.client.get(product.get_absolute_url())
+        Product.objects.filter(pk=product.pk).update(name="Переименованный товар")
+        bump_through_other_cache(bump_catalog_version)
+        with mock.patch('products.snapshot.gc.freeze') as freeze:
+            response = self.client.get(product.get_absolute_url())
+        self.assertEqual(response.context['product'].name, "Переименованный товар")
+        freeze.assert_not_called()
+
+    @override_settings(CATALOG_SNAPSHOT_REBUILD_INTERVAL=60)
+    def test_rebuilds_at_most_once_per_interval(self):
+        url = reverse('products:product_list')
+        product = Product.objects.get(name="Товар 01")
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        product.name = "Переименованный товар"
+        product.save()
+        # Снимок ещё не перестроен: и страница, и ETag списка - по прежней версии
+        self.assertEqual(self.client.get(product.get_absolute_url()).context['product'].name, "Товар 01")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('products.snapshot.time.monotonic', return_value=time.monotonic() + 61):
+            response = self.client.get(product.get_absolute_url())
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(response.context['product'].name, "Переименованный товар")
+
+
+class SupplierViewportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.moscow = [
+            Supplier.objects.create(name=f"Ферма {i}", address="Подмосковье", latitude=55.70 + i * 0.01, longitude=37.60)
+            for i in range(3)
+        ]
+        self.kazan = Supplier.objects.create(name="Казанская ферма", address="Казань", latitude=55.79, longitude=49.12)
+        Supplier.objects.create(name="Закрыта", address="Москва", latitude=55.71, longitude=37.61, is_active=False)
+        self.url = reverse('products:suppliers_json')
+
+    def viewport(self, bbox, zoom):
+        response = self.client.get(self.url, {'bbox': bbox, 'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_geohash_is_computed_on_save(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744), 'u4pruydqq')
+        supplier = self.moscow[0]
+        supplier.latitude, supplier.longitude = 57.64911, 10.40744
+        supplier.save(update_fields=['latitude', 'longitude'])
+        supplier.refresh_from_db()
+        self.assertEqual(supplier.geohash, 'u4pruydqq')
+
+    def test_high_zoom_returns_suppliers_in_bbox(self):
+        data = self.viewport('55.6,37.5,55.8,37.7', 13)
+        self.assertEqual(data['clusters'], [])
+        self.assertEqual(sorted(s['name'] for s in data['suppliers']), ["Ферма 0", "Ферма 1", "Ферма 2"])
+        self.assertEqual(set(data['suppliers'][0]), {'id', 'name', 'latitude', 'longitude'})
+
+    def test_low_zoom_returns_clusters(self):
+        data = self.viewport('40,20,70,60', 5)
+        self.assertEqual([c['count'] for c in data['clusters']], [3])
+        self.assertAlmostEqual(data['clusters'][0]['latitude'], 55.71)
+        self.assertEqual([s['id'] for s in data['suppliers']], [self.kazan.id])
+
+    def test_cover_cells_contain_every_point(self):
+        bbox = (55.0, 37.0, 56.5, 50.0)
+        cells = geo.cover_cells(bbox)
+        self.assertLessEqual(len(cells), geo.MAX_COVER_CELLS)
+        for supplier in Supplier.objects.all():
+            self.assertTrue(any(supplier.geohash.startswith(cell) for cell in cells))
+
+    def test_invalid_bbox(self):
+        self.assertEqual(self.client.get(self.url, {'bbox': '1,2,3'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'bbox': '56,38,55,37'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'bbox': '55,37,56,38', 'zoom': 'x'}).status_code, 400)
+
+    def test_supplier_detail(self):
+        response = self.client.get(reverse('products:supplier_json', args=[self.kazan.id]))
+        self.assertEqual(response.json()['address'], "Казань")
+        self.assertEqual(response.json()['products_count'], 0)
+        inactive = Supplier.objects.get(is_active=False)
+        self.assertEqual(self.client.get(reverse('products:supplier_json', args=[inactive.id])).status_code, 404)
+
+    def test_viewport_uses_geohash_index(self):
+        queryset = geo.in_bbox(Supplier.objects.filter(is_active=True), (55.6, 37.5, 55.8, 37.7))
+        plan = queryset.order_by('geohash').values_list('id', 'name', 'latitude', 'longitude').explain()
+        self.assertIn('SEARCH products_supplier USING INDEX supplier_active_geohash_idx (geohash>? AND geohash<?)', plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+
+class NearestSuppliersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        rng = random.Random(7)
+        self.suppliers = [
+            Supplier.objects.create(
+                name=f"Ферма {i}", address="Адрес",
+                latitude=round(rng.uniform(43, 60), 6), longitude=round(rng.uniform(30, 60), 6),
+            )
+            for i in range(60)
+        ]
+        self.url = reverse('products:suppliers_nearest')
+
+    def brute_force(self, latitude, longitude, k):
+        def distance(supplier):
+            lat1, lon1 = map(math.radians, (latitude, longitude))
+            lat2, lon2 = math.radians(float(supplier.latitude)), math.radians(float(supplier.longitude))
+            a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+            return 2 * nearest.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        return [s.id for s in sorted(self.suppliers, key=distance)[:k]]
+
+    def test_matches_brute_force(self):
+        for latitude, longitude, k in [(55.75, 37.62, 5), (44.0, 59.0, 3), (70.0, 10.0, 10), (50.0, 45.0, 60)]:
+            results = nearest.get_index().nearest(latitude, longitude, k)
+            self.assertEqual([row[0] for row in results], self.brute_force(latitude, longitude, k))
+
+    def test_across_antimeridian_and_near_pole(self):
+        rng = random.Random(11)
+        for i in range(40):
+            self.suppliers.append(Supplier.objects.create(
+                name=f"Остров {i}", address="Адрес",
+                latitude=round(rng.uniform(-70, 89.9), 6), longitude=round(rng.choice((-1, 1)) * rng.uniform(170, 180), 6),
+            ))
+        points = [(65.0, 179.99, 5), (-20.0, -179.9, 4), (89.95, 0.0, 6), (-89.9, 100.0, 3), (60.0, -175.0, 8)]
+        for use_numpy in (True, False):
+            with mock.patch.object(nearest, 'np', nearest.np if use_numpy else None):
+                index = nearest.SupplierIndex.build()
+                for latitude, longitude, k in points:
+                    results = index.nearest(latitude, longitude, k)
+                    self.assertEqual([row[0] for row in results], self.brute_force(latitude, longitude, k))
+
+    def test_longitude_window_skips_far_suppliers(self):
+        index = nearest.get_index()
+        # В полосе широт около 55° все 60 поставщиков, но в 200 км по долготе - только соседи
+        candidates = index._candidates(55.0, 45.0, 200.0)
+        start, stop = index._band(55.0, 200.0)
+        self.assertLess(len(candidates), stop - start)
+        self.assertTrue(all(abs(float(index.longitudes[i]) - 45.0) <= 3.2 for i in candidates))
+
+    def test_without_numpy(self):
+        with mock.patch.object(nearest, 'np', None):
+            index = nearest.SupplierIndex.build()
+            results = index.nearest(55.75, 37.62, 7)
+        self.assertEqual([row[0] for row in results], self.brute_force(55.75, 37.62, 7))
+
+    def test_endpoint(self):
+        category = Category.objects.create(name="Овощи", slug="vegetables")
+        farm = Supplier.objects.create(name="Под боком", address="Москва", latitude=55.751, longitude=37.621)
+        Product.objects.create(
+            category=category, supplier=farm, name="Морковь", slug="carrot", description="",
+            price=100, weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г",
+        )
+        response = self.client.get(self.url, {'lat': 55.75, 'lon': 37.62, 'k': 2})
+        results = response.json()['results']
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['id'], farm.id)
+        self.assertEqual(results[0]['products_count'], 1)
+        self.assertLess(results[0]['distance_km'], 0.2)
+        self.assertLessEqual(results[0]['distance_km'], results[1]['distance_km'])
+
+    def test_index_refreshes_after_supplier_save(self):
+        self.assertNotEqual(nearest.get_index().nearest(10.0, 10.0, 1)[0][1], "Ферма 0")
+        supplier = self.suppliers[0]
+        supplier.latitude, supplier.longitude = 10.0, 10.0
+        supplier.save()
+        self.assertEqual(nearest.get_index().nearest(10.0, 10.0, 1)[0][1], "Ферма 0")
+        supplier.is_active = False
+        supplier.save()
+        self.assertNotEqual(nearest.get_index().nearest(10.0, 10.0, 1)[0][1], "Ферма 0")
+
+    def test_index_refreshes_after_change_in_another_process(self):
+        nearest.get_index()
+        Supplier.objects.filter(pk=self.suppliers[0].pk).update(latitude=10.0, longitude=10.0)
+        bump_through_other_cache(bump_suppliers_version)
+        self.assertEqual(nearest.get_index().nearest(10.0, 10.0, 1)[0][1], "Ферма 0")
+
+    def test_invalid_parameters(self):
+        for params in ({'lat': 55}, {'lat': 'x', 'lon': 37}, {'lat': 95, 'lon': 37}, {'lat': 55, 'lon': 37, 'k': 0}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class SuppliersJsonCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        suppliers_cache._local = None
+        self.category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.farm = Supplier.objects.create(name="Ферма", address="Москва", latitude=55.75, longitude=37.62)
+        self.other = Supplier.objects.create(name="Другая ферма", address="Тверь", latitude=56.86, longitude=35.9)
+        self.product = Product.objects.create(
+            category=self.category, supplier=self.farm, name="Морковь", slug="carrot", description="",
+            price=100, weight="1 кг", calories="35 ккал", protein="1г", fat="0г", carbs="7г",
+        )
+        self.url = reverse('products:suppliers_json')
+
+    def etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_response_is_served_from_cache(self):
+        response = self.client.get(self.url)
+        counts = {item['name']: item['products_count'] for item in response.json()}
+        self.assertEqual(counts, {"Ферма": 1, "Другая ферма": 0})
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_strong_etag_and_not_modified(self):
+        etag = self.etag()
+        self.assertFalse(etag.startswith('W/'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_by_supplier_changes_only(self):
+        etag = self.etag()
+        self.product.price = 120
+        self.product.save()
+        self.assertEqual(self.etag(), etag)
+
+        self.product.supplier = self.other
+        self.product.save()
+        moved = self.etag()
+        self.assertNotEqual(moved, etag)
+
+        Product.objects.get(pk=self.product.pk).save()
+        self.assertEqual(self.etag(), moved)
+
+        self.other.phone = "+7 900 000-00-00"
+        self.other.save()
+        self.assertNotEqual(self.etag(), moved)
+
+    def test_waits_for_concurrent_regeneration(self):
+        version = suppliers_cache.get_suppliers_version()
+        key = suppliers_cache._cache_key(version)
+        built = suppliers_cache.build_payload(version)
+        timer = threading.Timer(0.1, cache.set, (key, (built.etag, built.body)))
+        with locks.try_lock(suppliers_cache.LOCK_NAME) as locked:  # как перестроение в другом процессе
+            self.assertTrue(locked)
+            timer.start()
+            try:
+                with self.assertNumQueries(0):
+                    payload = suppliers_cache.get_suppliers_payload()
+            finally:
+                timer.join()
+        self.assertEqual(payload.body, built.body)
+
+    def test_lock_is_exclusive(self):
+        with locks.try_lock(suppliers_cache.LOCK_NAME) as first:
+            with locks.try_lock(suppliers_cache.LOCK_NAME) as second:
+                self.assertEqual((first, second), (True, False))
+        with locks.try_lock(suppliers_cache.LOCK_NAME) as again:
+            self.assertTrue(again)
+
+
+class LoadProductsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def record(self, name, **fields):
+        return {
+            'name': name, 'description': f'{name} с фермы', 'price': 100, 'category': 'vegetables',
+            'weight': '1 кг', 'calories': '35 ккал', 'protein': '1.3г', 'carbs': '7.2г', 'fat': '0.1г',
+            'in_stock': True, **fields,
+        }
+
+    def write(self, text, name='products.json'):
+        path = f'{self.directory.name}/{name}'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def load(self, records, *args):
+        return self.load_file(self.write(json.dumps(records, ensure_ascii=False, indent=2)), *args)
+
+    def load_file(self, path, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_products', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_creates_and_updates_by_name(self):
+        output = self.load([self.record('Морковь'), self.record('Свёкла', category='unknown')])
+        self.assertIn('1 created, 0 changed, 0 unchanged, 0 retired, 1 skipped', output)
+        carrot = Product.objects.get()
+        self.assertEqual((carrot.slug, carrot.weight_grams, carrot.category.slug), ('morkov', 1000, 'vegetables'))
+
+        output = self.load([self.record('Морковь', price=120, in_stock=False), self.record('Лук')])
+        self.assertIn('1 created, 1 changed', output)
+        carrot.refresh_from_db()
+        self.assertEqual((carrot.price, carrot.in_stock), (120, False))
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_slugs_are_unique(self):
+        category = Category.objects.create(name="Овощи", slug="vegetables")
+        Product.objects.create(
+            category=category, name="Морковь!", slug="morkov", description="", price=1,
+            weight="1 кг", calories="1", protein="1", fat="1", carbs="1",
+        )
+        self.load([self.record('Морковь'), self.record('Морковь'), self.record('морковь')], '--batch-size', '2')
+        slugs = dict(Product.objects.values_list('name', 'slug'))
+        self.assertEqual((slugs['Морковь'], slugs['морковь']), ('morkov-1', 'morkov-2'))
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_query_count_does_not_grow_with_feed(self):
+        def queries(size):
+            with CaptureQueriesContext(connection) as context:
+                self.load([self.record(f'Товар {size}-{i}') for i in range(size)])
+            return len(context.captured_queries)
+
+        queries(1)
+        # SQLite ограничивает число параметров запроса: 40 товаров - ещё один INSERT
+        self.assertEqual(queries(2), queries(40))
+
+    def test_updates_search_index_and_catalog_version(self):
+        suppliers_version = get_suppliers_version()
+        catalog_version = get_catalog_version()
+        self.load([self.record('Сыр фермерский', category='dairy')])
+        self.assertNotEqual(get_catalog_version(), catalog_version)
+        self.assertEqual(get_suppliers_version(), suppliers_version)
+        if search.search_available():
+            self.assertEqual([p.name for p in search.SearchResults('сыр')[0:10]], ['Сыр фермерский'])
+
+    def test_tracked_stock_wins_over_feed(self):
+        self.load([self.record('Морковь')])
+        Product.objects.update(stock=0, in_stock=False)
+        self.load([self.record('Морковь', in_stock=True)])
+        self.assertFalse(Product.objects.get().in_stock)
+
+    def test_quiet_mode(self):
+        self.assertEqual(self.load([self.record('Морковь')], '-v', '0'), '')
+
+    def test_unchanged_feed_writes_nothing(self):
+        records = [self.record(f'Товар {i}') for i in range(5)]
+        self.load(records)
+        version = get_catalog_version()
+        records[1]['price'] = 150
+        with CaptureQueriesContext(connection) as context:
+            output = self.load(records)
+        self.assertIn('0 created, 1 changed, 4 unchanged, 0 retired', output)
+        inserts = [q for q in context.captured_queries if q['sql'].startswith('INSERT INTO "products_product"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertNotEqual(get_catalog_version(), version)
+
+        version = get_catalog_version()
+        self.assertIn('0 created, 0 changed, 5 unchanged', self.load(records))
+        self.assertEqual(get_catalog_version(), version)
+
+    def test_feed_lookup_uses_covering_index(self):
+        plan = Product.objects.filter(name__in=['Морковь', 'Лук']).values_list('name', 'id', 'slug', 'source_hash').explain()
+        self.assertIn('USING COVERING INDEX product_name_source_idx', plan)
+
+    def test_retire_missing(self):
+        self.load([self.record('Морковь'), self.record('Лук'), self.record('Свёкла', in_stock=False)])
+        output = self.load([self.record('Лук')], '--retire-missing')
+        self.assertIn('0 created, 0 changed, 1 unchanged, 1 retired', output)
+        self.assertEqual(list(Product.objects.filter(in_stock=True).values_list('name', flat=True)), ['Лук'])
+        # Вернувшийся в фид товар снова в продаже
+        self.load([self.record('Морковь')])
+        self.assertTrue(Product.objects.get(name='Морковь').in_stock)
+
+    def test_json_lines_with_bad_records(self):
+        lines = [
+            json.dumps(self.record('Морковь'), ensure_ascii=False),
+            '{"name": "обрыв',
+            json.dumps(self.record('Лук', price='дорого'), ensure_ascii=False),
+            '',
+            json.dumps(self.record('Свёкла'), ensure_ascii=False),
+        ]
+        output = self.load_file(self.write('\n'.join(lines), 'products.jsonl'))
+        self.assertIn('Line 2: skipping record - некорректный JSON', output)
+        self.assertIn('Line 3: skipping record - price', output)
+        self.assertIn('2 created, 0 changed, 0 unchanged, 0 retired, 2 skipped', output)
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Морковь', 'Свёкла'])
+
+    def test_broken_array_writes_nothing(self):
+        text = json.dumps([self.record('Морковь')], ensure_ascii=False)[:-1] + ', {"name": }]'
+        output = self.load_file(self.write(text))
+        self.assertIn('Invalid JSON format', output)
+        self.assertFalse(Product.objects.exists())
+
+
+class FeedReaderTest(TestCase):
+    def read(self, text, chunk_size=7):
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.json', delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.unlink, f.name)
+        with mock.patch.object(feed, 'CHUNK_SIZE', chunk_size):
+            return list(feed.FeedReader(f.name))
+
+    def test_array_is_streamed_in_small_chunks(self):
+        records = [{'name': f'Товар «{i}»', 'tags': ['а', {'б': i}]} for i in range(20)]
+        text = json.dumps(records, ensure_ascii=False, indent=2)
+        rows = self.read(text)
+        self.assertEqual([data for _, data, _ in rows], records)
+        # Номер строки - строка, где начинается запись
+        starts = [number for number, line in enumerate(text.split('\n'), 1) if line == '  {']
+        self.assertEqual([line for line, _, _ in rows], starts)
+
+    def test_errors(self):
+        with self.assertRaises(feed.FeedError):
+            self.read('[{"a": 1} {"b": 2}]')
+        with self.assertRaises(feed.FeedError):
+            self.read('[{"a": 1},')
+        with self.assertRaises(feed.FeedError):
+            self.read('"products"')
+        self.assertEqual(self.read('\ufeff [ ]'), [])
+
+    def test_clean_record(self):
+        record = {
+            'name': 'Морковь', 'description': '', 'category': 'vegetables', 'price': 149.9,
+            'weight': '1 кг', 'calories': '', 'protein': '', 'fat': '', 'carbs': '',
+        }
+        self.assertEqual(feed.clean_record(record)['price'], Decimal('149.90'))
+        self.assertTrue(feed.clean_record(record)['in_stock'])
+        for broken in ({'price': True}, {'price': -1}, {'name': ' '}, {'weight': 1}, {'in_stock': 'yes'}):
+            with self.assertRaises(feed.InvalidRecord):
+                feed.clean_record({**record, **broken})
+        with self.assertRaises(feed.InvalidRecord):
+            feed.clean_record([record])
+
+
+class StandInImageServer:
+    """Локальная замена CDN: /<имя>.jpg отдаёт изображение с ETag и задержкой"""
+
+    def __init__(self, delay=0.0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        server = self
+        self.delay = delay
+        self.requests = []
+        self.failures = {}  # путь -> сколько раз ответить 503
+        self.bodies = {}  # путь -> содержимое, по умолчанию от пути
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело уходят отдельными write: без этого keep-alive ждал бы delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server.requests.append((self.path, self.headers.get('If-None-Match')))
+                time.sleep(server.delay)
+                body = server.bodies.get(self.path, f'image {self.path}'.encode())
+                etag = f'"{hash(body)}"'
+                if server.failures.get(self.path):
+                    server.failures[self.path] -= 1
+                    self.reply(503, b'busy', 'text/plain')
+                elif self.path.startswith('/missing'):
+                    self.reply(404, b'not found', 'text/plain')
+                elif self.headers.get('If-None-Match') == etag:
+                    self.reply(304, b'', 'image/jpeg', etag)
+                else:
+                    self.reply(200, body, 'image/jpeg', etag)
+
+            def reply(self, status, body, content_type, etag=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                if etag:
+                    self.send_header('ETag', etag)
+                if status != 304:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class DownloadImagesTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.server = StandInImageServer()
+        self.addCleanup(self.server.stop)
+        self.category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.feed = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.jsonl', delete=False)
+        self.feed.close()
+        self.addCleanup(os.unlink, self.feed.name)
+
+    def product(self, name):
+        return Product.objects.create(
+            category=self.category, name=name, description="", price=1,
+            weight="1 кг", calories="1", protein="1", fat="1", carbs="1",
+        )
+
+    def download(self, records, *args):
+        with open(self.feed.name, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        out = StringIO()
+        call_command('download_images', self.feed.name, '--backoff', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_downloads_gallery_and_skips_downloaded_urls(self):
+        carrot = self.product('Морковь')
+        records = [
+            {'name': 'Морковь', 'image_urls': [self.server.url('/a.jpg'), self.server.url('/b.jpg'), self.server.url('/a.jpg')]},
+            {'name': 'Нет в каталоге', 'image_urls': [self.server.url('/c.jpg')]},
+        ]
+        output = self.download(records)
+        self.assertIn('2 downloaded, 0 unchanged, 0 already downloaded, 0 failed, 1 products not found', output)
+        gallery = list(carrot.images.all())
+        self.assertEqual([image.source_url for image in gallery], records[0]['image_urls'][:2])
+        self.assertEqual(gallery[1].image.read(), b'image /b.jpg')
+        carrot.refresh_from_db()
+        self.assertEqual(carrot.image.name, gallery[0].image.name)
+
+        self.server.requests.clear()
+        self.assertIn('0 downloaded, 0 unchanged, 2 already downloaded', self.download(records))
+        self.assertEqual(self.server.requests, [])
+
+    def test_retries_and_resumes_after_failures(self):
+        carrot = self.product('Морковь')
+        self.server.failures['/busy.jpg'] = 2
+        urls = [self.server.url('/busy.jpg'), self.server.url('/missing.jpg'), self.server.url('/late.jpg')]
+        self.server.failures['/late.jpg'] = 10
+        output = self.download([{'name': 'Морковь', 'image_urls': urls}], '--retries', '2')
+        self.assertIn('1 downloaded, 0 unchanged, 0 already downloaded, 2 failed', output)
+        self.assertEqual(self.server.requests.count(('/busy.jpg', None)), 3)
+
+        # Повторный запуск запрашивает только то, что не загрузилось
+        self.server.requests.clear()
+        self.server.failures.clear()
+        output = self.download([{'name': 'Морковь', 'image_urls': urls}])
+        self.assertIn('1 downloaded, 0 unchanged, 1 already downloaded, 1 failed', output)
+        self.assertEqual(sorted(path for path, _ in self.server.requests), ['/late.jpg', '/missing.jpg'])
+        self.assertEqual(
+            [image.source_url for image in carrot.images.all()], [self.server.url('/busy.jpg'), self.server.url('/late.jpg')],
+        )
+
+    def test_revalidate_uses_etag(self):
+        carrot = self.product('Морковь')
+        records = [{'name': 'Морковь', 'image_urls': [self.server.url('/a.jpg'), self.server.url('/b.jpg')]}]
+        self.download(records)
+        old = carrot.images.get(position=0).image.name
+
+        self.server.bodies['/a.jpg'] = b'new image'
+        self.server.requests.clear()
+        output = self.download(records, '--revalidate')
+        self.assertIn('1 downloaded, 1 unchanged', output)
+        self.assertTrue(all(etag for _, etag in self.server.requests))
+        image = carrot.images.get(position=0)
+        self.assertEqual(image.image.read(), b'new image')
+        # Прежний файл остаётся до сборки мусора
+        self.assertTrue(image.image.storage.exists(old))
+        call_command('gc_media', '--min-age', '0', stdout=StringIO())
+        self.assertFalse(image.image.storage.exists(old))
+        self.assertTrue(image.image.storage.exists(image.image.name))
+        carrot.refresh_from_db()
+        self.assertEqual(carrot.image.name, image.image.name)
+
+    def test_speedup_with_workers(self):
+        for i in range(4):
+            self.product(f'Товар {i}')
+        self.server.delay = 0.1
+        records = [
+            {'name': f'Товар {i}', 'image_urls': [self.server.url(f'/{i}-{j}.jpg') for j in range(4)]} for i in range(4)
+        ]
+
+        def elapsed(workers):
+            ProductImage.objects.all().delete()
+            start = time.perf_counter()
+            self.assertIn('16 downloaded', self.download(records, '--workers', str(workers)))
+            return time.perf_counter() - start
+
+        serial = elapsed(1)
+        self.assertGreater(serial, 1.6)
+        # 16 изображений по 0.1 с: 4 потока - ~0.4 с, 8 - ~0.2 с
+        self.assertGreater(serial / elapsed(4), 3)
+        self.assertGreater(serial / elapsed(8), 5)
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.category = Category.objects.create(name="Овощи", slug="vegetables")
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media)
+            for directory, _, names in os.walk(self.media) for name in names
+        )
+
+    def test_identical_uploads_are_stored_once(self):
+        product = Product.objects.create(
+            category=self.category, name="Морковь", description="", price=1,
+            weight="1 кг", calories="1", protein="1", fat="1", carbs="1",
+        )
+        product.image.save('carrot.JPEG', ContentFile(b'jpeg bytes'))
+        self.category.image.save('vegetables.jpg', ContentFile(b'jpeg bytes'))
+        user = User.objects.create_user(username='buyer', password='x')
+        user.profile.avatar.save('me.jpg', ContentFile(b'jpeg bytes'))
+        user.profile.avatar.save('other.png', ContentFile(b'png bytes'))
+
+        self.assertRegex(product.image.name, r'^content/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$')
+        self.assertEqual(self.category.image.name, product.image.name)
+        self.assertEqual(len(self.files()), 2)
+        self.assertEqual(product.image.read(), b'jpeg bytes')
+
+    def test_upload_is_hashed_in_chunks(self):
+        class ChunkedOnly(BytesIO):
+            def read(self, size=-1):
+                assert size is not None and size > 0, 'файл читается целиком'
+                return super().read(size)
+
+        body = os.urandom(3 * 2 ** 16 + 5)
+        name = default_storage.save('avatars/big.png', File(ChunkedOnly(body), 'big.png'))
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), body)
+        self.assertEqual(name, f'content/{name[8:10]}/{name[11:13]}/{hashlib.sha256(body).hexdigest()}.png')
+        self.assertEqual(self.files(), [name])
+
+    def test_gc_deletes_unreferenced_files(self):
+        self.category.image.save('kept.jpg', ContentFile(b'kept'))
+        orphan = default_storage.save('orphan.jpg', ContentFile(b'orphan'))
+        os.makedirs(os.path.join(self.media, 'categories'))
+        legacy = 'categories/legacy.jpg'
+        with open(os.path.join(self.media, legacy), 'wb') as f:
+            f.write(b'legacy')
+        fresh = default_storage.save('fresh.jpg', ContentFile(b'fresh'))
+        hour_ago = time.time() - 7200
+        for name in (orphan, legacy):
+            os.utime(default_storage.path(name), (hour_ago, hour_ago))
+
+        out = StringIO()
+        call_command('gc_media', '--dry-run', stdout=out)
+        self.assertIn('Would delete 2 unreferenced files', out.getvalue())
+        self.assertEqual(len(self.files()), 4)
+
+        out = StringIO()
+        call_command('gc_media', stdout=out)
+        self.assertIn('Deleted 2 unreferenced files', out.getvalue())
+        self.assertIn('1 newer than --min-age kept', out.getvalue())
+        self.assertEqual(self.files(), sorted([self.category.image.name, fresh]))
+
+    def test_duplicate_upload_refreshes_grace_period(self):
+        name = default_storage.save('orphan.jpg', ContentFile(b'same bytes'))
+        hour_ago = time.time() - 7200
+        os.utime(default_storage.path(name), (hour_ago, hour_ago))
+        # Та же картинка загружена снова, строка со ссылкой ещё не сохранена
+        self.assertEqual(default_storage.save('again.jpg', ContentFile(b'same bytes')), name)
+        self.assertGreater(os.stat(default_storage.path(name)).st_mtime, hour_ago + 3600)
+        call_command('gc_media', stdout=StringIO())
+        self.assertEqual(self.files(), [name])
+
+    def test_gc_reads_file_names_from_index(self):
+        plan = Product.objects.filter(image__gt='').order_by().values_list('image', flat=True).explain()
+        self.assertIn('USING COVERING INDEX product_image_idx', plan)
+
+
+@override_settings(RENDITION_WORKERS=0)
+class RenditionsTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.category = Category.objects.create(name="Овощи", slug="vegetables")
+        self.product = Product.objects.create(
+            category=self.category, name="Морковь", description="", price=1,
+            weight="1 кг", calories="1", protein="1", fat="1", carbs="1",
+        )
+
+    def photo(self, size=(1000, 800), image_format='JPEG', mode='RGB'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'orange').save(buffer, image_format)
+        return ContentFile(buffer.getvalue())
+
+    def states(self):
+        return {rendition.preset: (rendition.status, rendition.widths) for rendition in ImageRendition.objects.all()}
+
+    def test_saved_image_gets_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.image.save('carrot.jpg', self.photo())
+        self.assertEqual(self.states(), {
+            'card': ('ready', '320,480,640'), 'detail': ('ready', '640,960'), 'thumbnail': ('ready', '80,160'),
+        })
+        source = self.product.image.name
+        with Image.open(renditions.storage.path(renditions.rendition_name(source, 'thumbnail', 160, 'webp'))) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (160, 160)))
+        with Image.open(renditions.storage.path(renditions.rendition_name(source, 'card', 480, 'jpg'))) as card:
+            self.assertEqual((card.format, card.size), ('JPEG', (480, 384)))
+
+        # Сохранение товара без смены изображения копии не трогает
+        with CaptureQueriesContext(connection) as context, self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get().save()
+        self.assertFalse([q for q in context.captured_queries if 'imagerendition' in q['sql']])
+
+    def test_transparent_avatar(self):
+        user = User.objects.create_user(username='buyer', password='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.profile.avatar.save('me.png', self.photo((200, 120), 'PNG', 'RGBA'))
+        self.assertEqual(self.states(), {'avatar': ('ready', '120')})
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('accounts:profile')), '-120.webp 120w')
+
+    def test_picture_falls_back_to_original_until_ready(self):
+        self.product.image.save('carrot.jpg', self.photo(), save=False)
+        Product.objects.filter(pk=self.product.pk).update(image=self.product.image.name)
+        original = self.product.image.url
+        response = self.client.get(reverse('products:product_list'))
+        self.assertContains(response, f'<img src="{original}"')
+        self.assertNotContains(response, '<picture>')
+
+        call_command('build_renditions', '--workers', '2', stdout=StringIO())
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('products:product_list'))
+        self.assertEqual(len([q for q in context.captured_queries if 'imagerendition' in q['sql']]), 1)
+        self.assertContains(response, '<source type="image/webp" srcset="/media/renditions/card/content/')
+        self.assertContains(response, '-640.webp 640w')
+        self.assertNotContains(response, f'src="{original}"')
+
+        response = self.client.get(self.product.get_absolute_url())
+        self.assertContains(response, '-960.webp 960w')
+
+    def test_ready_renditions_change_page_etags_not_catalog_version(self):
+        self.product.image.save('carrot.jpg', self.photo(), save=False)
+        Product.objects.filter(pk=self.product.pk).update(image=self.product.image.name)
+        urls = [reverse('products:product_list'), self.product.get_absolute_url()]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        catalog_version = get_catalog_version()
+
+        call_command('build_renditions', '--workers', '2', stdout=StringIO())
+        # Кэши данных каталога (фасеты, счётчики) копии не сбрасывают
+        self.assertEqual(get_catalog_version(), catalog_version)
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, '<picture>')
+
+    def test_build_renditions(self):
+        broken = default_storage.save('broken.jpg', ContentFile(b'not an image'))
+        Product.objects.filter(pk=self.product.pk).update(image=broken)
+        self.assertIn('3 queued, 0 built, 3 failed', self.call('build_renditions'))
+        self.assertEqual({status for status, _ in self.states().values()}, {'failed'})
+
+        self.assertIn('0 queued, 0 built, 0 failed', self.call('build_renditions'))
+        with open(default_storage.path(broken), 'wb') as f:
+            f.write(self.photo().read())
+        self.assertIn('0 queued, 3 built, 0 failed', self.call('build_renditions', '--retry-failed'))
+
+    def test_gc_removes_renditions_of_removed_images(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.image.save('carrot.jpg', self.photo())
+        source = self.product.image.name
+        self.assertIn('Deleted 0 unreferenced files', self.call('gc_media', '--min-age', '0'))
+
+        Product.objects.update(image='')
+        # 7 ширин в двух форматах и сам источник
+        self.assertIn('Deleted 15 unreferenced files', self.call('gc_media', '--min-age', '0'))
+        self.assertFalse(ImageRendition.objects.exists())
+        self.assertFalse(default_storage.exists(source))
+
+    def call(self, *args):
+        out = StringIO()
+        call_command(*args, stdout=out)
+        return out.getvalue()
@@ -0,0 +1,61 @@
+"""Разбор текстовых величин товара ("1.2 кг", "35 ккал", "1.3г") в числа.
+
+Поля Product.weight/calories/protein/fat/carbs заполняются вручную и из
+фидов поставщиков, поэтому формат свободный: запятая или точка, пробелы,
+диапазоны ("350-400г"), штуки с весом в скобках. Парсер возвращает None,
+если величину нельзя надёжно привести к единице измерения.
+"""
+import re
+
+QUANTITY_RE = re.compile(r'(\d+(?:[.,]\d+)?)(?:\s*[-–]\s*(\d+(?:[.,]\d+)?))?\s*([a-zа-яё]*)', re.IGNORECASE)
+
+# Масса в граммах; объём жидкостей приравнивается к массе (плотность ~1)
+MASS_UNITS = {
+    'мг': 0.001, 'mg': 0.001,
+    'г': 1, 'гр': 1, 'грамм': 1, 'g': 1, 'gr': 1,
+    'кг': 1000, 'kg': 1000,
+    'мл': 1, 'ml': 1,
+    'л': 1000, 'l': 1000,
+}
+
+ENERGY_UNITS = {
+    'ккал': 1, 'kcal': 1,
+    'кдж': 1 / 4.184, 'kj': 1 / 4.184,
+}
+
+
+def _number(text):
+    return float(text.replace(',', '.'))
+
+
+def parse_quantity(text, units, default_unit=None):
+    """Первая величина с известной единицей, приведённая к базовой единице.
+
+    Диапазон заменяется средним значением. Если ни у одного числа нет
+    известной единицы, используется ``default_unit`` для первого числа.
+    """
+    if not text:
+        return None
+    matches = list(QUANTITY_RE.finditer(text.lower()))
+    for match in matches:
+        unit = match.group(3)
+        if unit in units:
+            value = _number(match.group(1))
+            if match.group(2):
+                value = (value + _number(match.group(2))) / 2
+            return round(value * units[unit], 3)
+    if default_unit and matches:
+        return round(_number(matches[0].group(1)) * units[default_unit], 3)
+    return None
+
+
+def parse_weight(text):
+    return parse_quantity(text, MASS_UNITS)
+
+
+def parse_energy(text):
+    return parse_quantity(text, ENERGY_UNITS, default_unit='ккал')
+
+
+def parse_nutrient(text):
+    return parse_quantity(text, MASS_UNITS, default_unit='г')
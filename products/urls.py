@@ -1,10 +1,15 @@
 from django.urls import path
-from .views import ProductListView, ProductDetailView, SupplierMapView, suppliers_json
+from .api import products_api
+from .views import ProductListView, ProductSearchView, ProductDetailView, SupplierMapView, suppliers_json, supplier_json, suppliers_nearest
 
 app_name = 'products'
 urlpatterns = [
     path('', ProductListView.as_view(), name='product_list'),
+    path('api/products/', products_api, name='products_api'),
+    path('search/', ProductSearchView.as_view(), name='product_search'),
     path('<slug:slug>/', ProductDetailView.as_view(), name='product_detail'),
     path('suppliers/map/', SupplierMapView.as_view(), name='supplier_map'),
     path('suppliers/json/', suppliers_json, name='suppliers_json'),
+    path('suppliers/<int:pk>/json/', supplier_json, name='supplier_json'),
+    path('suppliers/nearest/', suppliers_nearest, name='suppliers_nearest'),
 ]
\ No newline at end of file
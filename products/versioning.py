@@ -0,0 +1,71 @@
+"""Версии каталога для инвалидации кэшей.
+
+Любое изменение товара, категории или поставщика увеличивает счётчик,
+а кэшированные данные хранятся под ключами с номером версии, поэтому
+устаревшие записи просто перестают запрашиваться и вытесняются сами.
+
+Отдельная версия поставщиков меняется только при изменении поставщика или
+привязки товара к поставщику: от неё зависят данные карты, которым не
+важны цены и описания товаров. Версия копий изображений меняется, когда
+готовы новые копии (products.renditions): от неё зависят только ETag
+страниц с {% picture %}, а не кэши данных каталога. Массовые операции
+(update, bulk_create) сигналов не шлют и должны увеличивать версии сами.
+
+Версии лежат в общем для всех процессов кэше (CACHES в settings): смену
+версии командой manage.py или другим воркером видит каждый процесс. Новая
+версия не вычисляется из старой, а записывается заново: у файлового кэша
+incr - это чтение и запись, и одновременные увеличения из разных процессов
+дали бы одинаковый номер.
+"""
+import time
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'products:catalog-version'
+SUPPLIERS_VERSION_KEY = 'products:suppliers-version'
+RENDITIONS_VERSION_KEY = 'products:renditions-version'
+
+
+def _new_version(current=None):
+    # Номер от времени: после вытеснения ключа из кэша версия не вернётся
+    # к уже использованному номеру
+    version = time.time_ns()
+    return version + 1 if version == current else version
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    version = _new_version(cache.get(key))
+    cache.set(key, version, None)
+    return version
+
+
+def get_catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return _bump_version(CATALOG_VERSION_KEY)
+
+
+def get_suppliers_version():
+    return _get_version(SUPPLIERS_VERSION_KEY)
+
+
+def bump_suppliers_version():
+    return _bump_version(SUPPLIERS_VERSION_KEY)
+
+
+def get_renditions_version():
+    return _get_version(RENDITIONS_VERSION_KEY)
+
+
+def bump_renditions_version():
+    return _bump_version(RENDITIONS_VERSION_KEY)
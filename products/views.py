@@ -1,43 +1,225 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import ListView, DetailView, TemplateView
-from django.http import JsonResponse
-from .models import Product, Category, Supplier
+from django.http import HttpResponse, JsonResponse, Http404
+from .models import Product, Category, Supplier, ProductImage, ProductRecommendation
+from .pagination import KeysetPaginator, SequenceKeysetPaginator, InvalidCursor
+from .snapshot import RecordList, get_snapshot, snapshot_enabled
+from .search import SearchResults, search_available
+from .facets import get_catalog_facets
+from .versioning import get_catalog_version
+from . import conditional, geo, nearest, renditions
+from .suppliers_cache import get_suppliers_payload, supplier_data
 
+
+# Наибольший id, который SQLite хранит в INTEGER
+MAX_ID = 2 ** 63 - 1
+
+
+def get_supplier_id(request):
+    """id поставщика из ?supplier=; Http404, если это не номер поставщика"""
+    value = request.GET.get('supplier')
+    if not value:
+        return None
+    # isdigit() пропустил бы '²', на котором int() падает
+    if not value.isdecimal() or int(value) > MAX_ID:
+        raise Http404('Поставщик не найден')
+    return int(value)
+
+
+@method_decorator(condition(etag_func=conditional.catalog_etag, last_modified_func=conditional.catalog_last_modified_for), name='dispatch')
 class ProductListView(ListView):
     model = Product
     template_name = 'products/list.html'
     context_object_name = 'products'
     paginate_by = 12
+    # ?sort= -> (подпись, порядок строк); последний элемент порядка обязан быть уникальным
+    sort_options = {
+        'name': ('По названию', ('name', 'id')),
+        'price': ('Сначала дешёвые', ('price', 'id')),
+        '-price': ('Сначала дорогие', ('-price', '-id')),
+        'newest': ('Сначала новые', ('-id',)),
+        'calories': ('Сначала менее калорийные', ('calories_kcal', 'id')),
+        'protein': ('Сначала больше белка', ('-protein_g', '-id')),
+        'fat': ('Сначала меньше жиров', ('fat_g', 'id')),
+        'carbs': ('Сначала меньше углеводов', ('carbs_g', 'id')),
+        'weight': ('Сначала лёгкие', ('weight_grams', 'id')),
+    }
+    default_sort = 'name'
+    # ?<ключ>_min= / ?<ключ>_max= -> числовое поле товара
+    range_filters = {key: numeric for key, (numeric, parser) in Product.NUMERIC_FIELDS.items()}
+
+    def get_pagination_mode(self):
+        return getattr(settings, 'CATALOG_PAGINATION', 'offset')
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort')
+        return sort if sort in self.sort_options else self.default_sort
+
+    def get_ordering(self):
+        return self.sort_options[self.get_sort()][1]
+
+    def get_range_values(self):
+        """Разобранные границы диапазонов: {'calories_max': 100.0, ...}"""
+        values = {}
+        for key in self.range_filters:
+            for bound in ('min', 'max'):
+                raw = self.request.GET.get(f'{key}_{bound}', '').replace(',', '.').strip()
+                try:
+                    values[f'{key}_{bound}'] = float(raw)
+                except ValueError:
+                    continue
+        return values
+
+    def get_filter_query(self):
+        """Текущие фильтры в виде querystring без параметров пагинации"""
+        query = self.request.GET.copy()
+        for param in ('page', 'after', 'before'):
+            query.pop(param, None)
+        return query.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        if isinstance(queryset, RecordList):
+            paginator = SequenceKeysetPaginator(queryset, self.get_ordering(), page_size)
+        else:
+            count_key = f'list:{get_catalog_version()}:{self.get_filter_query()}'
+            paginator = KeysetPaginator(queryset, self.get_ordering(), page_size, count_key=count_key)
+        try:
+            page = paginator.get_page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def can_use_snapshot(self):
+        """Снимок в памяти индексирован только по категории/поставщику и имени"""
+        return snapshot_enabled() and self.get_sort() == self.default_sort and not self.get_range_values()
 
     def get_queryset(self):
-        queryset = Product.objects.filter(in_stock=True).select_related('category', 'supplier')
         category_slug = self.request.GET.get('category')
-        supplier_id = self.request.GET.get('supplier')
+        supplier_id = get_supplier_id(self.request)
+
+        if self.can_use_snapshot():
+            return get_snapshot().filter(category_slug, supplier_id)
+
+        queryset = Product.objects.filter(in_stock=True).select_related('category', 'supplier')
         
         if category_slug:
             queryset = queryset.filter(category__slug=category_slug)
         if supplier_id:
             queryset = queryset.filter(supplier_id=supplier_id)
-        
-        return queryset
+
+        for param, value in self.get_range_values().items():
+            key, bound = param.rsplit('_', 1)
+            lookup = 'gte' if bound == 'min' else 'lte'
+            queryset = queryset.filter(**{f'{self.range_filters[key]}__{lookup}': value})
+
+        ordering = self.get_ordering()
+        sort_field = ordering[0].lstrip('-')
+        if sort_field in self.range_filters.values():
+            # Товары без разобранного значения не участвуют в сортировке по нему
+            queryset = queryset.filter(**{f'{sort_field}__isnull': False})
+
+        return queryset.order_by(*ordering)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['suppliers'] = Supplier.objects.filter(is_active=True)
+        current_category = self.request.GET.get('category', None)
+        current_supplier = self.request.GET.get('supplier', None)
+
+        # Сайдбар и счётчики фасетов берутся из кэша версии каталога
+        facets = get_catalog_facets()
+        category_id = facets.category_id(current_category) if current_category else None
+        supplier_id = get_supplier_id(self.request)
+        context['categories'] = facets.category_options(supplier_id=supplier_id)
+        context['suppliers'] = facets.supplier_options(category_id=category_id)
+        context['current_category'] = current_category
+        context['current_supplier'] = current_supplier
+        context['pagination_mode'] = self.get_pagination_mode()
+        context['filter_query'] = self.get_filter_query()
+        context['sort_options'] = [(key, label) for key, (label, ordering) in self.sort_options.items()]
+        context['current_sort'] = self.get_sort()
+        context['range_values'] = self.get_range_values()
+        # Готовые копии изображений страницы одним запросом: тег {% picture %} в базу не ходит
+        context['renditions'] = renditions.ready_map(product.image for product in context['products'])
+        return context
+
+
+class ProductSearchView(ListView):
+    """Поиск по каталогу с ранжированием bm25 и фильтрами каталога"""
+    template_name = 'products/search.html'
+    context_object_name = 'products'
+    paginate_by = 12
+
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        query = self.get_search_query()
+        category_slug = self.request.GET.get('category')
+        supplier_id = get_supplier_id(self.request)
+
+        if not search_available():
+            queryset = Product.objects.filter(in_stock=True, name__icontains=query).select_related('category', 'supplier')
+            if category_slug:
+                queryset = queryset.filter(category__slug=category_slug)
+            if supplier_id:
+                queryset = queryset.filter(supplier_id=supplier_id)
+            return queryset
+
+        return SearchResults(query, category_slug=category_slug, supplier_id=supplier_id)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context['search_query'] = self.get_search_query()
+        context['filter_query'] = query.urlencode()
         context['current_category'] = self.request.GET.get('category', None)
         context['current_supplier'] = self.request.GET.get('supplier', None)
+        context['renditions'] = renditions.ready_map(product.image for product in context['products'])
         return context
 
 
+@method_decorator(condition(etag_func=conditional.product_etag), name='dispatch')
 class ProductDetailView(DetailView):
     model = Product
     template_name = 'products/detail.html'
     context_object_name = 'product'
 
     def get_object(self):
+        if snapshot_enabled():
+            product = get_snapshot().get(self.kwargs['slug'])
+            if product is None:
+                raise Http404('Товар не найден')
+            return product
         return get_object_or_404(Product.objects.select_related('category', 'supplier'), slug=self.kwargs['slug'])
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Готовый top-N из orders/recommendations.py: один запрос по (product, rank)
+        context['recommendations'] = [
+            recommendation.recommended
+            for recommendation in ProductRecommendation.objects.filter(
+                product_id=self.object.id, recommended__in_stock=True,
+            ).select_related('recommended').order_by('rank')
+        ]
+        # Галерея из image_urls фида (команда download_images)
+        context['gallery'] = list(ProductImage.objects.filter(product_id=self.object.id).order_by('position', 'id'))
+        context['renditions'] = renditions.ready_map([
+            self.object.image,
+            *(item.image for item in context['gallery']),
+            *(product.image for product in context['recommendations']),
+        ])
+        return context
+
 
 class SupplierMapView(TemplateView):
     """Представление для отображения интерактивной карты поставщиков"""
@@ -45,27 +227,68 @@ class SupplierMapView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['suppliers'] = Supplier.objects.filter(is_active=True)
+        context['cluster_max_zoom'] = geo.CLUSTER_MAX_ZOOM
         return context
 
 
+@condition(etag_func=conditional.suppliers_json_etag, last_modified_func=conditional.suppliers_last_modified)
 def suppliers_json(request):
-    """API endpoint для получения данных о поставщиках в формате JSON"""
+    """API endpoint для получения данных о поставщиках в формате JSON.
+
+    С параметрами ?bbox=south,west,north,east&zoom= отдаются только
+    поставщики видимой области (кластерами при малом масштабе) с минимумом
+    полей; подробности - в supplier_json.
+    """
+    if 'bbox' in request.GET:
+        try:
+            bbox = geo.parse_bbox(request.GET['bbox'])
+        except geo.InvalidBBox as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        try:
+            zoom = int(request.GET.get('zoom', geo.CLUSTER_MAX_ZOOM))
+        except ValueError:
+            return JsonResponse({'error': 'zoom должен быть числом'}, status=400)
+        return JsonResponse(geo.viewport(Supplier.objects.filter(is_active=True), bbox, zoom))
+
+    # Полный список отдаётся готовыми байтами из кэша, см. suppliers_cache.py
+    payload = get_suppliers_payload()
+    response = HttpResponse(payload.body, content_type='application/json')
+    response['ETag'] = payload.etag
+    return response
+
+
+@condition(etag_func=conditional.suppliers_etag, last_modified_func=conditional.suppliers_last_modified)
+def supplier_json(request, pk):
+    """Подробности одного поставщика для всплывающего окна карты"""
     from django.db.models import Count
-    suppliers = Supplier.objects.filter(is_active=True).annotate(products_count=Count('products'))
-    data = []
-    for supplier in suppliers:
-        data.append({
-            'id': supplier.id,
-            'name': supplier.name,
-            'description': supplier.description,
-            'address': supplier.address,
-            'latitude': float(supplier.latitude),
-            'longitude': float(supplier.longitude),
-            'phone': supplier.phone,
-            'email': supplier.email,
-            'website': supplier.website,
-            'image': supplier.image.url if supplier.image else None,
-            'products_count': supplier.products_count,
-        })
-    return JsonResponse(data, safe=False)
\ No newline at end of file
+    supplier = get_object_or_404(
+        Supplier.objects.filter(is_active=True).annotate(products_count=Count('products')), pk=pk
+    )
+    return JsonResponse(supplier_data(supplier))
+
+
+@condition(etag_func=conditional.suppliers_etag, last_modified_func=conditional.suppliers_last_modified)
+def suppliers_nearest(request):
+    """Ближайшие к точке поставщики: ?lat=&lon=&k="""
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Нужны числовые параметры lat и lon'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'Координаты вне допустимого диапазона'}, status=400)
+    try:
+        k = int(request.GET.get('k', 5))
+    except ValueError:
+        return JsonResponse({'error': 'k должен быть числом'}, status=400)
+    if not 1 <= k <= nearest.MAX_K:
+        return JsonResponse({'error': f'k должен быть от 1 до {nearest.MAX_K}'}, status=400)
+
+    results = [
+        {
+            'id': pk, 'name': name, 'latitude': lat, 'longitude': lon,
+            'distance_km': round(distance, 3), 'products_count': products_count,
+        }
+        for pk, name, lat, lon, distance, products_count in nearest.get_index().nearest(latitude, longitude, k)
+    ]
+    return JsonResponse({'results': results})